@@ -0,0 +1,81 @@
+# Bittinikkari - atomic_file.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import shutil
+import tempfile
+
+def _fsync_dir(folder):
+    """Kansion fsync, jotta rename on pysyvä. Windows ei tue kansion avaamista: ohitetaan."""
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicFile:
+    """
+    Tiedoston korvaus kokonaan tai ei lainkaan: with-lohkossa kirjoitetaan väliaikaistiedostoon
+    samassa kansiossa, ja lohkon päättyessä se vaihdetaan paikalleen os.replace-kutsulla
+    (oikeudet kopioidaan vanhasta tiedostosta). Virheen tai discard()-kutsun jälkeen
+    väliaikaistiedosto poistetaan eikä kohdetta muuteta.
+    durable=True tekee fsyncin ennen vaihtoa ja kansiolle sen jälkeen, jolloin
+    myöskään virtakatko ei jätä tiedostoa tyhjäksi.
+    """
+
+    def __init__(self, file_path, binary=False, newline=None, durable=False):
+        self.file_path = file_path
+        self.folder = os.path.dirname(os.path.abspath(file_path))
+        self.binary = binary
+        self.newline = newline
+        self.durable = durable
+        self.keep = True
+
+    def discard(self):
+        """Kohde jätetään ennalleen (esim. sisältö osoittautui samaksi)."""
+        self.keep = False
+
+    def __enter__(self):
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.folder, prefix=".nikkari-", suffix=".tmp")
+        try:
+            if self.binary:
+                self.file = os.fdopen(fd, "wb")
+            else:
+                self.file = os.fdopen(fd, "w", encoding="utf-8", newline=self.newline)
+        except Exception:
+            os.close(fd)
+            os.remove(self.tmp_path)
+            raise
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.keep:
+                if self.durable:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                self.file.close()
+                if os.path.exists(self.file_path):
+                    shutil.copymode(self.file_path, self.tmp_path)
+                os.replace(self.tmp_path, self.file_path)
+                if self.durable:
+                    _fsync_dir(self.folder)
+        finally:
+            self.file.close()
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        return False
+
+
+def write_atomic(file_path, content, newline=None, durable=False):
+    """
+    Kirjoittaa sisällön (str tai bytes) AtomicFilella. newline="" kirjoittaa tekstin
+    rivinvaihdot sellaisinaan (sisältö luettu newline=""-tilassa).
+    """
+    binary = isinstance(content, (bytes, bytearray))
+    with AtomicFile(file_path, binary=binary, newline=newline, durable=durable) as f:
+        f.write(content)
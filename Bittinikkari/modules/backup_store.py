@@ -0,0 +1,237 @@
+# Bittinikkari - backup_store.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import json
+import time
+import zlib
+import lzma
+import hashlib
+import threading
+from datetime import datetime
+from atomic_file import AtomicFile
+
+# Blobin tiedostopääte kertoo pakkaustavan
+CODEC_SUFFIXES = {"none": ".raw", "zlib": ".z", "lzma": ".xz"}
+CHUNK_SIZE = 1024 * 1024
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(settings):
+    """
+    Palauttaa asetusten backup_dir-kansioon osoittavan varmuuskopiovaraston.
+    Sama olio jaetaan säikeiden kesken, jotta indeksin lukko on yhteinen.
+    """
+    root_dir = os.path.abspath(settings.get("backup_dir", "backups"))
+    key = (root_dir, settings.get("backup_compression", "zlib"),
+           settings.get("backup_keep_generations", 10), settings.get("backup_keep_days", 30))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = BackupStore(root_dir, *key[1:])
+        return _stores[key]
+
+def _make_compressor(codec):
+    if codec == "zlib":
+        return zlib.compressobj(6)
+    if codec == "lzma":
+        return lzma.LZMACompressor()
+    return None
+
+def _make_decompressor(codec):
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    return None
+
+class BackupStore:
+    """
+    Sisältöosoitteinen varmuuskopiovarasto:
+      objects/ab/abcdef...(.z|.xz|.raw)  - blobit SHA-256-tiivisteen mukaan, sama sisältö vain kerran
+      index.jsonl                        - (projektin suhteellinen polku, aika) -> blob
+    Indeksiin vain lisätään rivejä, joten rinnakkaiset kirjoittajat eivät sotke toisiaan.
+    """
+
+    def __init__(self, root_dir, compression="zlib", keep_generations=10, keep_days=30):
+        self.root_dir = root_dir
+        self.objects_dir = os.path.join(root_dir, "objects")
+        self.index_path = os.path.join(root_dir, "index.jsonl")
+        self.compression = compression if compression in CODEC_SUFFIXES else "zlib"
+        self.keep_generations = keep_generations
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._paths = set()      # indeksin polut has_backup-kyselyille
+        self._paths_stamp = None # (koko, mtime_ns), jolla _paths luettiin
+
+    # --- Blobit ---
+
+    def _blob_path(self, digest, codec):
+        return os.path.join(self.objects_dir, digest[:2], digest + CODEC_SUFFIXES[codec])
+
+    def _find_blob(self, digest):
+        """Etsii blobin millä tahansa pakkauksella. Palauttaa (polku, codec) tai (None, None)."""
+        for codec in CODEC_SUFFIXES:
+            path = self._blob_path(digest, codec)
+            if os.path.exists(path):
+                return path, codec
+        return None, None
+
+    def _write_blob(self, file_path, digest):
+        """Pakkaa tiedoston blobiksi paloittain (väliaikaistiedosto + rename)."""
+        blob_path = self._blob_path(digest, self.compression)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        compressor = _make_compressor(self.compression)
+        with AtomicFile(blob_path, binary=True) as out, open(file_path, "rb") as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                out.write(compressor.compress(chunk) if compressor else chunk)
+            if compressor:
+                out.write(compressor.flush())
+        return self.compression
+
+    def _iter_blob(self, digest):
+        path, codec = self._find_blob(digest)
+        if path is None:
+            raise FileNotFoundError(f"Varmuuskopion blobia ei löydy: {digest}")
+        decompressor = _make_decompressor(codec)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                yield decompressor.decompress(chunk) if decompressor else chunk
+
+    # --- Indeksi ---
+
+    def _read_index(self):
+        entries = []
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue # Keskeytynyt rivi, ohitetaan
+        except OSError:
+            pass
+        return entries
+
+    def _append_index(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    # --- Julkinen rajapinta ---
+
+    def backup(self, file_path, rel_path):
+        """
+        Tallentaa tiedoston nykyisen sisällön. Palauttaa indeksimerkinnän.
+        Identtinen sisältö tallennetaan vain kerran.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+
+        os.makedirs(self.root_dir, exist_ok=True)
+        if self._find_blob(digest)[0] is None:
+            self._write_blob(file_path, digest)
+
+        now = time.time()
+        entry = {
+            "path": rel_path.replace("\\", "/"),
+            "time": now,
+            "stamp": datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S"),
+            "hash": digest,
+            "size": size,
+        }
+        self._append_index(entry)
+        return entry
+
+    def history(self, rel_path):
+        """Palauttaa tiedoston varmuuskopiot uusimmasta vanhimpaan."""
+        rel_path = rel_path.replace("\\", "/")
+        entries = [e for e in self._read_index() if e.get("path") == rel_path]
+        return sorted(entries, key=lambda e: e["time"], reverse=True)
+
+    def has_backup(self, rel_path):
+        """Onko tiedostolla varmuuskopioita. Indeksi luetaan uudelleen vain, jos se on muuttunut."""
+        try:
+            st = os.stat(self.index_path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._paths_stamp != (st.st_size, st.st_mtime_ns):
+                self._paths = {entry.get("path") for entry in self._read_index()}
+                self._paths_stamp = (st.st_size, st.st_mtime_ns)
+            return rel_path.replace("\\", "/") in self._paths
+
+    def read(self, digest):
+        """Palauttaa blobin sisällön tavuina."""
+        return b"".join(self._iter_blob(digest))
+
+    def restore(self, rel_path, dest_path, digest=None):
+        """
+        Palauttaa tiedoston varmuuskopiosta dest_path-polkuun atomisesti. Versio valitaan
+        sisällön tiivisteellä (history()-merkinnän "hash"), koska sekunnin tarkkuinen
+        aikaleima ei erota saman sekunnin varmuuskopioita; digest=None palauttaa uusimman.
+        Nykyinen sisältö varmuuskopioidaan ensin, joten palautuksen voi perua.
+        Palauttaa käytetyn indeksimerkinnän.
+        """
+        entries = self.history(rel_path)
+        if digest is not None:
+            entries = [e for e in entries if e.get("hash") == digest]
+        if not entries:
+            raise FileNotFoundError(f"Ei varmuuskopioita: {rel_path}")
+        entry = entries[0]
+
+        if os.path.exists(dest_path):
+            self.backup(dest_path, rel_path)
+
+        with AtomicFile(dest_path, binary=True) as out:
+            for chunk in self._iter_blob(entry["hash"]):
+                out.write(chunk)
+        return entry
+
+    def prune(self):
+        """
+        Karsii vanhat sukupolvet: tiedostolle säilytetään keep_generations uusinta,
+        ja niistäkin poistetaan keep_days päivää vanhemmat. Uusin säilyy aina.
+        Lopuksi poistetaan blobit, joihin indeksi ei enää viittaa. Palauttaa poistettujen määrän.
+        """
+        with self._lock:
+            entries = self._read_index()
+            cutoff = time.time() - self.keep_days * 86400 if self.keep_days else None
+
+            by_path = {}
+            for entry in entries:
+                by_path.setdefault(entry["path"], []).append(entry)
+
+            kept = []
+            for path_entries in by_path.values():
+                path_entries.sort(key=lambda e: e["time"], reverse=True)
+                for i, entry in enumerate(path_entries):
+                    if i == 0:
+                        kept.append(entry)
+                    elif self.keep_generations and i >= self.keep_generations:
+                        continue
+                    elif cutoff is not None and entry["time"] < cutoff:
+                        continue
+                    else:
+                        kept.append(entry)
+
+            removed = len(entries) - len(kept)
+            if removed:
+                kept.sort(key=lambda e: e["time"])
+                with AtomicFile(self.index_path) as f:
+                    for entry in kept:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+                referenced = {entry["hash"] for entry in kept}
+                for digest in {entry["hash"] for entry in entries} - referenced:
+                    path, codec = self._find_blob(digest)
+                    if path:
+                        os.remove(path)
+            return removed
@@ -0,0 +1,279 @@
+# Bittinikkari - c_analyzer.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import re
+import hashlib
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+# Kevyt C-lekseri: kommentit, merkkijonot ja esikääntäjärivit ohitetaan kokonaan,
+# jolloin niiden sisällä olevat malloc/free-sanat eivät sotke laskentaa.
+# Ehdokasmerkit haetaan str.find-kutsuilla (C-tason muistihaku); merkkijonon, merkin
+# ja esikääntäjärivin loppu haetaan lausekkeella vain kyseisestä kohdasta.
+_LEX_CHARS = "{}/\"'#"
+_STRING_RE = re.compile(r'(?:\\.|[^"\\\n])*"?', re.S)
+_CHAR_RE = re.compile(r"(?:\\.|[^'\\\n])*'?", re.S)
+_PP_RE = re.compile(r'(?:\\\n|[^\n])*')
+# Kutsut haetaan erikseen nimen loppuosalla: kirjaimellisella alulla re-moottori käyttää
+# nopeaa merkkijonohakua. Koko nimi ja sanaraja tarkistetaan Pythonissa.
+_CALL_SUFFIX_RES = (
+    (re.compile(r'alloc\s*\('), 5, ("malloc", "calloc", "realloc")),
+    (re.compile(r'dup\s*\('), 3, ("strdup", "strndup")),
+    (re.compile(r'free\s*\('), 4, ("free",)),
+)
+_WORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+
+_STRIP_RE = re.compile(r'/\*.*?\*/|//[^\n]*|^[ \t]*#[^\n]*', re.S | re.M)
+# Funktion nimi: viimeinen "nimi(...)" juuri ennen avaavaa aaltosulkua
+_FUNC_NAME_RE = re.compile(r'([A-Za-z_]\w*)\s*\((?:[^()]|\([^()]*\))*\)\s*(?:const\s*)?$')
+# "p = ", "s->buf = ", "char *p = (char *) ", "a[i + 1] = " allokointikutsun edessä
+_ASSIGN_RE = re.compile(r'([A-Za-z_*][\w.>*-]*(?:\s*\[[^\]=]*\])*)\s*=\s*(?:\([^()]*\)\s*)?$')
+# Sijoituksen kohteen viimeinen nimi: "char*p" -> "p", "int *a[2]" -> "a[2]"
+_DECLARATOR_RE = re.compile(r'[A-Za-z_]\w*(?:\[[^\]]*\])*$')
+_RETURN_PREFIX_RE = re.compile(r'\breturn\s*(?:\([^()]*\)\s*)?$')
+_ARG_RE = re.compile(r'\s*(?:\([^()]*\)\s*)?([^(),]*?)\s*[,)]')
+# "return p;" tai "st->entries = entries;": osoitin palautetaan tai siirretään muualle.
+# Tarkistetaan vain muuttujan esiintymien ympäriltä (ennen ja jälkeen).
+_ESCAPE_BEFORE_RE = re.compile(r'(?:\breturn\s*\(?|(?<![=!<>+\-*/%&|^])=\s*(?:\([^()]*\)\s*)?)\s*$')
+_ESCAPE_AFTER_RE = re.compile(r'\s*\)?\s*[;,)]')
+_ESCAPE_WINDOW = 80
+_CONTROL_WORDS = {"if", "for", "while", "switch", "do", "else", "return", "sizeof"}
+_MAX_HEADER = 2000
+
+# Tulokset välimuistissa sisällön tiivisteen mukaan (sama tiedosto -> ei uutta analyysiä)
+_CACHE_SIZE = 512
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _normalize(expr):
+    return "".join((expr or "").split())
+
+def _target(prefix, expr):
+    """
+    Sijoituksen kohde muuttujana: tyyppi ja osoitintähdet pois ("char*p" -> "p"), rakenteen
+    kenttä sellaisenaan ("s->buf"), ja "*out" kun tallennetaan osoittimen kautta.
+    """
+    expr = _normalize(expr)
+    if "->" in expr or "." in expr:
+        var = expr.lstrip("*")
+    else:
+        found = _DECLARATOR_RE.search(expr)
+        if found is None:
+            return None
+        var = found.group()
+    return "*" + var if prefix.lstrip().startswith("*") else var
+
+def _escapes(body, var):
+    """Palautetaanko muuttuja (return p) tai luovutetaanko se sijoituksella (s->buf = p)."""
+    find = body.find
+    pos = find(var)
+    while pos >= 0:
+        end = pos + len(var)
+        if (pos == 0 or body[pos - 1] not in _WORD_CHARS) and body[end:end + 1] not in _WORD_CHARS \
+                and _ESCAPE_AFTER_RE.match(body, end) \
+                and _ESCAPE_BEFORE_RE.search(body, max(0, pos - _ESCAPE_WINDOW), pos):
+            return True
+        pos = find(var, end)
+    return False
+
+def _local_array(body, base):
+    """Onko taulukko tai osoitin base esitelty funktion rungossa (eikä parametri tai globaali)."""
+    return re.search(r'(?<![\w.>])(?!(?:return|else|case|sizeof)\b)[A-Za-z_]\w*[\s*]+'
+                     + re.escape(base) + r'\s*[\[;=,]', body) is not None
+
+def _unmatched(allocs, freed, body):
+    """Valitsee funktion varauksista ne, joille ei löytynyt free-kutsua tai omistajan siirtoa."""
+    result = []
+    for alloc in allocs:
+        var = alloc["var"]
+        if alloc["returned"]:
+            continue
+        if var is None:
+            # Nimetön varaus (esim. foo(malloc(n))): hyväksytään, jos funktiossa vapautetaan jotain
+            if not freed:
+                result.append(alloc)
+            continue
+        if "." in var or "->" in var or var.startswith("*"):
+            continue # Tallennettu rakenteeseen: omistajuus siirtyy funktion ulkopuolelle
+        if var in freed:
+            continue
+        base = var.partition("[")[0]
+        if base != var:
+            # a[i] = malloc(n): seurataan vain funktion omia taulukoita; vapautus millä tahansa
+            # indeksillä (esim. silmukassa) kelpaa, samoin koko taulukon palautus tai luovutus
+            if not _local_array(body, base) or any(name.partition("[")[0] == base for name in freed):
+                continue
+            if _escapes(body, base):
+                continue
+        if not _escapes(body, var):
+            result.append(alloc)
+    return result
+
+def _find_calls(content):
+    """Palauttaa [(kohta, nimi, kutsun_loppu)] kaikille varaus- ja free-kutsuille tekstijärjestyksessä."""
+    calls = []
+    for regex, suffix_len, names in _CALL_SUFFIX_RES:
+        for m in regex.finditer(content):
+            for name in names:
+                pos = m.start() - (len(name) - suffix_len)
+                if pos >= 0 and content.startswith(name, pos) and \
+                        (pos == 0 or content[pos - 1] not in _WORD_CHARS):
+                    calls.append((pos, name, m.end()))
+                    break
+    calls.sort()
+    return calls
+
+def _positions(content, chars):
+    """Merkkien chars kaikki kohdat järjestyksessä (str.find on C-tason haku)."""
+    found = []
+    find = content.find
+    for ch in chars:
+        i = find(ch)
+        while i >= 0:
+            found.append(i)
+            i = find(ch, i + 1)
+    found.sort()
+    return found
+
+def _scan_structure(content):
+    """
+    Kommentti-, merkkijono- ja esikääntäjäalueet sekä ylätason lohkot.
+    Palauttaa (ohitettavien_alkukohdat, ohitettavien_loppukohdat, lohkot).
+    Lohko = (rungon_alku, rungon_loppu, otsikon_alku); nimi selvitetään vasta tarvittaessa.
+    """
+    skip_starts, skip_ends, blocks = [], [], []
+    depth = 0
+    top_start = 0 # edellisen ylätason lohkon loppu -> funktion otsikon alku
+    body_start = header_start = 0
+    skip_until = 0
+    size = len(content)
+    for pos in _positions(content, _LEX_CHARS):
+        if pos < skip_until:
+            continue # kommentin tai merkkijonon sisällä
+        ch = content[pos]
+        if ch == "{":
+            if depth == 0:
+                header_start = max(top_start, pos - _MAX_HEADER)
+                body_start = pos + 1
+            depth += 1
+            continue
+        if ch == "}":
+            if depth == 0:
+                continue
+            depth -= 1
+            if depth == 0:
+                blocks.append((body_start, pos, header_start))
+                top_start = pos + 1
+            continue
+        if ch == "/":
+            following = content[pos + 1:pos + 2]
+            if following == "*":
+                end = content.find("*/", pos + 2)
+                end = size if end < 0 else end + 2
+            elif following == "/":
+                end = content.find("\n", pos + 2)
+                end = size if end < 0 else end
+            else:
+                continue # jakolasku
+        elif ch == '"':
+            end = _STRING_RE.match(content, pos + 1).end()
+        elif ch == "'":
+            end = _CHAR_RE.match(content, pos + 1).end()
+        else:
+            end = _PP_RE.match(content, pos + 1).end()
+        skip_starts.append(pos)
+        skip_ends.append(end)
+        skip_until = end
+    return skip_starts, skip_ends, blocks
+
+def _function_name(content, block):
+    """Lohkon funktion nimi otsikosta, tai None (struct, taulukon alustus tms.)."""
+    body_start, body_end, header_start = block
+    header_start = max(header_start, content.rfind(";", header_start, body_start) + 1)
+    header = _STRIP_RE.sub(" ", content[header_start:body_start - 1])
+    found = _FUNC_NAME_RE.search(header)
+    return found.group(1) if found and found.group(1) not in _CONTROL_WORDS else None
+
+def _analyze(content):
+    calls = _find_calls(content)
+    if not any(name != "free" for pos, name, end in calls):
+        return [] # Ei varauksia lainkaan: rakennetta ei tarvitse jäsentää
+
+    skip_starts, skip_ends, blocks = _scan_structure(content)
+    block_starts = [b[0] for b in blocks]
+    per_function = {}
+    line, line_pos = 1, 0
+
+    for pos, call, call_end in calls:
+        # Kommentissa tai merkkijonossa oleva kutsu ei ole oikea kutsu
+        i = bisect_right(skip_starts, pos) - 1
+        if i >= 0 and pos < skip_ends[i]:
+            continue
+        f = bisect_right(block_starts, pos) - 1
+        if f < 0 or pos > blocks[f][1]:
+            continue
+        allocs, freed = per_function.setdefault(f, ([], set()))
+
+        if call == "free":
+            arg = _ARG_RE.match(content, call_end)
+            if arg:
+                freed.add(_normalize(arg.group(1)))
+            continue
+
+        body_start = blocks[f][0]
+        stmt_start = max(content.rfind(";", body_start, pos), content.rfind("{", body_start, pos),
+                         content.rfind("}", body_start, pos), body_start - 1) + 1
+        prefix = content[stmt_start:pos]
+        assign = _ASSIGN_RE.search(prefix)
+        var = _target(prefix, assign.group(1)) if assign else None
+        if call == "realloc" and var:
+            arg = _ARG_RE.match(content, call_end)
+            if arg and _normalize(arg.group(1)) == var:
+                continue # p = realloc(p, n): sama varaus jatkuu
+        line += content.count("\n", line_pos, pos)
+        line_pos = pos
+        allocs.append({"call": call, "line": line, "var": var,
+                       "returned": bool(_RETURN_PREFIX_RE.search(prefix))})
+
+    findings = []
+    for f, (allocs, freed) in sorted(per_function.items()):
+        body_start, body_end, header_start = blocks[f]
+        unmatched = _unmatched(allocs, freed, content[body_start:body_end])
+        # Nimi selvitetään vain löydöksille; ylätason alustukset ja rakenteet eivät ole funktioita
+        name = _function_name(content, blocks[f]) if unmatched else None
+        if name is None:
+            continue
+        for alloc in unmatched:
+            findings.append({"function": name, "line": alloc["line"],
+                             "call": alloc["call"], "var": alloc["var"]})
+    return findings
+
+def analyze_c_source(content, file_path=""):
+    """
+    Etsii C-lähteestä varaukset (malloc, calloc, realloc, strdup, strndup), joille
+    samassa funktiossa ei ole vastaavaa free-kutsua. Varaus hyväksytään myös, jos
+    se palautetaan (return p), tallennetaan rakenteeseen (s->buf = malloc(...))
+    tai luovutetaan sijoituksella (s->buf = p).
+    Palauttaa listan: {"file", "function", "line", "call", "var"}.
+    Tulokset tallennetaan välimuistiin sisällön SHA-1-tiivisteen mukaan.
+    """
+    key = hashlib.sha1(content.encode("utf-8", "surrogatepass")).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is None:
+        cached = _analyze(content)
+        with _cache_lock:
+            _cache[key] = cached
+            while len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+    return [dict(finding, file=file_path) for finding in cached]
+
+def format_finding(finding):
+    """Raporttirivi yhdelle löydökselle."""
+    var = f" ({finding['var']})" if finding["var"] else ""
+    return (f"HUOM: {finding['file']}:{finding['line']}: {finding['call']}(){var} "
+            f"funktiossa {finding['function']} ilman vastaavaa free-kutsua.")
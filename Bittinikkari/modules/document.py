@@ -0,0 +1,132 @@
+# Bittinikkari - document.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+from bisect import bisect_right
+from itertools import accumulate, chain, islice
+from edit_hook import install_edit_hook
+
+BLOCK_LINES = 512 # rivejä lohkossa; muokkaus kopioi enintään yhden lohkon verran rivejä
+
+class Document:
+    """
+    Välilehden teksti Python-puolella rivilohkoina (rope), synkronoituna Text-widgetin
+    kanssa EditHookin kautta: muokkauksen jälkeen widgetiltä haetaan vain muuttuneet rivit.
+    Rivin ja merkkisiirtymän haku on binäärihaku lohkojen alkuihin, ja rivialueet
+    luetaan iteraattorina ilman koko tekstin kopiota. Haku, analyysi ja tallennus
+    lukevat tekstin täältä eivätkä kierrätä sitä Tk:n kautta.
+    """
+
+    def __init__(self, text_area):
+        self.text = text_area
+        self.version = 0 # kasvaa jokaisessa muutoksessa (tallennus vertaa, muuttuiko teksti välissä)
+        self.reset()
+        install_edit_hook(text_area).add_listener(self.on_edit)
+
+    def reset(self, content=None):
+        """Lataa koko tekstin uudelleen (oletuksena widgetistä)."""
+        if content is None:
+            content = self.text.get("1.0", "end-1c")
+        lines = content.split("\n")
+        self.blocks = [lines[i:i + BLOCK_LINES] for i in range(0, len(lines), BLOCK_LINES)]
+        self.block_chars = [sum(map(len, block)) + len(block) for block in self.blocks]
+        self._stale = True
+        self.version += 1
+
+    def on_edit(self, op, start, old_end, new_end):
+        """EditHookin kuuntelija: rivit start..old_end korvautuivat widgetin riveillä start..new_end."""
+        self.replace_lines(start, old_end, self.text.get(f"{start}.0", f"{new_end}.end").split("\n"))
+
+    def replace_lines(self, first, last, new_lines):
+        """Korvaa rivit first..last (1-alkuiset) listalla new_lines."""
+        first_block, first_row = self._locate(first)
+        last_block, last_row = self._locate(last)
+        head = self.blocks[first_block][:first_row]
+        tail = self.blocks[last_block][last_row + 1:]
+        if first_block > 0 and len(head) + len(new_lines) + len(tail) < BLOCK_LINES // 4:
+            # Pieni jäännös yhdistetään edelliseen lohkoon, jottei lohkoja pirstoudu
+            first_block -= 1
+            head = self.blocks[first_block] + head
+        merged = head + new_lines + tail
+        blocks = [merged[i:i + BLOCK_LINES] for i in range(0, len(merged), BLOCK_LINES)]
+        self.blocks[first_block:last_block + 1] = blocks
+        self.block_chars[first_block:last_block + 1] = [sum(map(len, block)) + len(block) for block in blocks]
+        self._stale = True
+        self.version += 1
+
+    def _index(self):
+        """Lohkojen alkurivit ja -merkit muokkauksen jälkeen; lohkoja on vain n / BLOCK_LINES."""
+        if self._stale:
+            self._line_starts = list(accumulate(map(len, self.blocks), initial=0))
+            self._char_starts = list(accumulate(self.block_chars, initial=0))
+            self._row_starts = {}
+            self._stale = False
+
+    def _rows(self, block):
+        """Lohkon rivien alut merkkeinä lohkon alusta; lasketaan vasta kysyttäessä ja vain tälle lohkolle."""
+        rows = self._row_starts.get(block)
+        if rows is None:
+            rows = self._row_starts[block] = list(accumulate((len(text) + 1 for text in self.blocks[block]), initial=0))
+        return rows
+
+    def _locate(self, line):
+        """Rivi (1-alkuinen) -> (lohko, rivi lohkossa). Liian suuri rivi osoittaa viimeiseen riviin."""
+        self._index()
+        line = max(1, min(line, self._line_starts[-1]))
+        block = bisect_right(self._line_starts, line - 1) - 1
+        return block, line - 1 - self._line_starts[block]
+
+    def line_count(self):
+        self._index()
+        return self._line_starts[-1]
+
+    def char_count(self):
+        """Merkkien määrä (sama kuin widgetin get("1.0", "end-1c"))."""
+        self._index()
+        return self._char_starts[-1] - 1
+
+    def line(self, number):
+        block, row = self._locate(number)
+        return self.blocks[block][row]
+
+    def lines(self, first=1, last=None):
+        """Iteraattori riveihin first..last (kopioimatta muuta tekstiä)."""
+        count = self.line_count()
+        last = count if last is None else min(last, count)
+        if first > last:
+            return iter(())
+        block, row = self._locate(first)
+        last_block, _ = self._locate(last)
+        return islice(chain(islice(self.blocks[block], row, None), *self.blocks[block + 1:last_block + 1]),
+                      last - first + 1)
+
+    def get(self, first=1, last=None):
+        """Rivit first..last tekstinä (vastaa widgetin get("first.0", "last.end"))."""
+        return "\n".join(self.lines(first, last))
+
+    def offset(self, line, column=0):
+        """Rivi ja sarake -> merkkisiirtymä tekstin alusta."""
+        block, row = self._locate(line)
+        return self._char_starts[block] + self._rows(block)[row] + column
+
+    def position(self, offset):
+        """Merkkisiirtymä -> (rivi, sarake)."""
+        self._index()
+        block = max(0, min(bisect_right(self._char_starts, offset) - 1, len(self.blocks) - 1))
+        offset -= self._char_starts[block]
+        rows = self._rows(block)
+        row = max(0, min(bisect_right(rows, offset) - 1, len(rows) - 2))
+        return self._line_starts[block] + row + 1, offset - rows[row]
+
+
+def text_of(text_area):
+    """Koko teksti (ilman Tk:n loppurivinvaihtoa); dokumenttimallista, jos välilehdellä on sellainen."""
+    document = getattr(text_area, "document", None)
+    return document.get() if document is not None else text_area.get("1.0", "end-1c")
+
+def lines_of(text_area, first, last):
+    """Rivit first..last listana; dokumenttimallista, jos välilehdellä on sellainen."""
+    document = getattr(text_area, "document", None)
+    if document is not None:
+        return list(document.lines(first, last))
+    return text_area.get(f"{first}.0", f"{last}.end").split("\n")
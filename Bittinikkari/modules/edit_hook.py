@@ -0,0 +1,80 @@
+# Bittinikkari - edit_hook.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+# Widgetin komennon tilalle asetettava Tcl-proseduuri. Muut kuin muokkauskomennot
+# välitetään suoraan alkuperäiselle komennolle (ei Pythonin kautta), ja virheet
+# nousevat kutsujalle kuten ilman koukkua. Muokkauksen jälkeen kutsutaan Python-
+# callbackia muutetulla rivialueella.
+_PROXY_TCL = r'''
+proc %(widget)s {args} {
+    set op [lindex $args 0]
+    if {$op ni {insert delete replace}} {
+        return [%(orig)s {*}$args]
+    }
+    set last [lindex [split [%(orig)s index end-1c] .] 0]
+    if {$op eq "insert"} {
+        set indices [lrange $args 1 1]
+    } elseif {$op eq "replace"} {
+        set indices [lrange $args 1 2]
+    } else {
+        set indices [lrange $args 1 end]
+        if {[llength $indices] %% 2} {
+            lappend indices "[lindex $indices end]+1c"
+        }
+    }
+    set lines {}
+    foreach index $indices {
+        lappend lines [lindex [split [%(orig)s index $index] .] 0]
+    }
+    set start [expr {min([tcl::mathfunc::min {*}$lines], $last)}]
+    set old_end [expr {min([tcl::mathfunc::max {*}$lines], $last)}]
+    set result [%(orig)s {*}$args]
+    set new_last [lindex [split [%(orig)s index end-1c] .] 0]
+    %(callback)s $op $start $old_end [expr {$old_end + $new_last - $last}]
+    return $result
+}
+'''
+
+class EditHook:
+    """
+    Kuuntelee Text-widgetin muutoksia Tcl-tasolla: widgetin komento nimetään uudelleen
+    ja tilalle asetetaan välityskomento. Näin jokainen insert/delete/replace huomataan
+    riippumatta siitä, tuleeko se näppäimistöltä, liittämisestä, undo/redo-toiminnosta
+    tai ohjelmakoodista.
+    Kuuntelija saa kutsun listener(toiminto, alku, vanha_loppu, uusi_loppu):
+    rivit alku..vanha_loppu korvautuivat riveillä alku..uusi_loppu (1-alkuiset).
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.listeners = []
+        self.orig = widget._w + "_orig"
+        callback = widget.register(self._notify)
+        widget.tk.call("rename", widget._w, self.orig)
+        widget.tk.eval(_PROXY_TCL % {"widget": widget._w, "orig": self.orig, "callback": callback})
+        # Widgetin tuhoaminen poistaa myös välityskomennon
+        widget._tclCommands.append(widget._w)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def call(self, *args):
+        """Kutsuu alkuperäistä widget-komentoa ohi kuuntelijoiden."""
+        return self.widget.tk.call((self.orig,) + args)
+
+    def _notify(self, op, start, old_end, new_end):
+        for listener in list(self.listeners):
+            listener(op, int(start), int(old_end), int(new_end))
+
+
+def install_edit_hook(widget):
+    """Palauttaa widgetin EditHookin; luodaan ensimmäisellä kutsulla, jotta koukkuja on vain yksi."""
+    hook = getattr(widget, "edit_hook", None)
+    if hook is None:
+        hook = widget.edit_hook = EditHook(widget)
+    return hook
@@ -7,21 +7,26 @@ import xml.etree.ElementTree as ET
 from tkinter import filedialog, messagebox, ttk
 import os
 import re
-from engine import run_fixing_logic, load_settings
+import time
+from engine import (run_fixing_logic, load_settings, process_full_project,
+                    search_project, replace_in_project, compile_pattern)
+from c_analyzer import analyze_c_source
+from backup_store import open_store
+from report_view import ReportPanel, VirtualLineView
+from task_runner import BackgroundTask, ProgressDialog
+from highlighter import IncrementalHighlighter
+from gutter import GutterRenderer
+from line_state import LineStates
+from large_file import load_in_chunks, MappedLines
+from find_engine import find_engine_for, TYPE_DEBOUNCE_MS
+from save_pipeline import SavePipeline
+from project_model import open_project, collect_files, ProjectTreeView, SAVE_DELAY_MS
+from recovery_journal import (RecoveryJournal, StaleJournalError, read_journal, remove_journal,
+                              set_aside, apply_recovered)
+from document import Document, text_of
+
+PREVIEW_BATCH_S = 0.1 # kuivan ajon rivit näytetään vähintään näin usein
 
-
-
-def process_full_project(project_path, settings):
-    """Suorittaa yhden komennon taktiikan mukaisen hienosäädön [cite: 2026-01-05]."""
-    changes = 0
-    reports = ["--- Bittinikkari Raportti 2026 ---"]
-    
-    # Esimerkki: Varmuuskopiointi ja kevyt C-tarkistus
-    reports.append(f"Analysoidaan projekti: {project_path}")
-    # Logiikka sisennyksille, lisensseille ja muistinhallinnalle...
-    
-    return changes, reports
-    
 class ToolTip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -50,6 +55,9 @@ class BittinikkariEditor:
         self.root.title("Bittinikkari - Tekstieditori (GPL)")
         self.root.geometry("1200x800")
         self.settings = load_settings()
+        self.save_pipeline = SavePipeline(self.root, self.settings)
+        self.project_save_job = None # ajastettu .cbp-kirjoitus projektin muutoserän jälkeen
+        self.recovery = RecoveryJournal(self.root, self.settings.get("recovery_dir", "recovery"))
         
         # Pääkontti
         self.main_container = tk.Frame(self.root, bg=self.settings.get("bg_color", "#f0f0f0"))
@@ -92,11 +100,14 @@ class BittinikkariEditor:
         # Pikanäppäimet
         self.root.bind("<Control-n>", lambda e: self.new_file())
         self.root.bind("<Control-f>", lambda e: self.find_text())
+        self.root.bind("<Control-Shift-F>", lambda e: self.find_in_project())
         self.root.bind("<Control-s>", lambda e: self.save_file())
         self.root.bind("<Alt-n>", lambda e: self.nikkaroi_action())
         self.root.bind("<F5>", lambda e: self.nikkaroi_action())
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
         
         self.new_file()
+        self.root.after(100, self.recover_tabs)
 
     def create_toolbar(self):
         toolbar = tk.Frame(self.main_container, bd=1, relief=tk.RAISED)
@@ -111,6 +122,8 @@ class BittinikkariEditor:
             btn.pack(side=tk.LEFT, padx=2, pady=2)
             ToolTip(btn, hint)
         toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.toolbar = toolbar
+        self.add_quick_fix_button()
 
     def add_quick_fix_button(self):
         # Työkalupalkin nappi (jos sinulla on Toolbar-frame)
@@ -136,12 +149,80 @@ class BittinikkariEditor:
                                      "- Lisenssit tarkistetaan\n"
                                      "- C-muistinhallinta analysoidaan")
         if confirm:
-            from modules.engine import process_full_project
-            changes, reports = process_full_project(project_path, self.settings)
-            
-            # Näytetään tulokset
-            report_text = "\n".join(reports[:15])
-            messagebox.showinfo("Valmis", f"Muutoksia tehty: {changes}\n\nRaportti:\n{report_text}")
+            self.start_project_maintenance(project_path, "Hienosäädön raportti")
+
+    def start_project_maintenance(self, project_path, title):
+        """
+        Käynnistää process_full_projectin taustasäikeessä. Edistyminen näytetään
+        ikkunassa, ja Peruuta keskeyttää ajon seuraavan tiedoston kohdalla.
+        """
+        if getattr(self, "maintenance_task", None):
+            messagebox.showinfo("Bittinikkari", "Projektin käsittely on jo käynnissä.")
+            return
+
+        def finish():
+            self.maintenance_task = None
+            dialog.destroy()
+
+        def on_done(result):
+            finish()
+            changes, reports = result
+            self.show_report(title, reports, f"Muutoksia tehty: {changes}.")
+            self.update_status(f"Projektin käsittely valmis: {changes} muutosta.")
+
+        def on_error(error):
+            finish()
+            messagebox.showerror("Bittinikkari", f"Projektin käsittelyvirhe: {error}")
+
+        dialog = ProgressDialog(self.root, "Käsitellään projektia...", lambda: self.maintenance_task.cancel())
+        self.maintenance_task = BackgroundTask(self.root, process_full_project, project_path, dict(self.settings),
+                                               on_progress=dialog.update_progress,
+                                               on_done=on_done, on_error=on_error).start()
+        self.update_status("Projektin käsittely käynnissä taustalla...")
+
+    def preview_full_maintenance(self):
+        """Kuiva ajo: näyttää unified diffit koko projektista kirjoittamatta mitään."""
+        project_path = self.settings.get("current_project", "Bittinikkari.cbp")
+        if not os.path.exists(project_path):
+            messagebox.showwarning("Bittinikkari", "Projektitiedostoa ei löydy.")
+            return
+        panel = ReportPanel(self.root, "Hienosäädön esikatselu (kuiva ajo)", None)
+
+        def run(progress, cancel, emit):
+            # Diffit lasketaan taustasäikeessä; rivit välitetään paneelille erissä
+            changes, lines = process_full_project(project_path, self.settings, dry_run=True)
+            batch = []
+            deadline = time.monotonic() + PREVIEW_BATCH_S
+            for line in lines:
+                if cancel.is_set():
+                    return False
+                batch.append(line)
+                if len(batch) >= 500 or time.monotonic() >= deadline:
+                    emit(batch)
+                    batch = []
+                    deadline = time.monotonic() + PREVIEW_BATCH_S
+            if batch:
+                emit(batch)
+            return True
+
+        def on_item(batch):
+            if panel.winfo_exists():
+                panel.extend(batch)
+
+        def on_done(finished):
+            if panel.winfo_exists():
+                panel.finish("" if finished else "(keskeytetty)")
+
+        def on_error(error):
+            if panel.winfo_exists():
+                panel.finish(f"Virhe: {error}")
+
+        task = BackgroundTask(self.root, run, on_item=on_item, on_done=on_done, on_error=on_error).start()
+        panel.on_close = task.cancel
+
+    def show_report(self, title, lines, summary=""):
+        """Avaa virtualisoidun raporttipaneelin; rivit luetaan erissä, joten generaattori käy."""
+        return ReportPanel(self.root, title, lines, summary)
 
     def create_sidebar_content(self):
         self.projects_tab = ttk.Frame(self.sidebar)
@@ -185,8 +266,13 @@ class BittinikkariEditor:
         change_bar = tk.Canvas(tab, width=5, bg="#313335", highlightthickness=0)
         change_bar.pack(side=tk.LEFT, fill=tk.Y)
 
+        def on_yscroll(first, last):
+            # Myös vierityspalkilla vierittäminen päivittää rivinumerot
+            y_scroll.set(first, last)
+            trigger_update()
+
         text_area = tk.Text(tab, undo=True, wrap=tk.NONE, font=("Courier New", 12),
-                            yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set,
+                            yscrollcommand=on_yscroll, xscrollcommand=x_scroll.set,
                             bg=self.settings.get("bg_color", "#2b2b2b"),
                             fg=self.settings.get("fg_color", "#a9b7c6"),
                             insertbackground="white", padx=5)
@@ -194,21 +280,18 @@ class BittinikkariEditor:
         y_scroll.config(command=text_area.yview)
         x_scroll.config(command=text_area.xview)
         text_area.pack(fill=tk.BOTH, expand=True)
+        # Tekstin Python-puolen malli: haku, analyysi ja tallennus lukevat tästä (ks. document.py)
+        text_area.document = Document(text_area)
+        text_area.line_states = LineStates(text_area)
+        text_area.gutter = GutterRenderer(text_area, text_area.line_states, line_nums, change_bar, folding_bar)
 
         def trigger_update(*args):
             self.update_lines(text_area, line_nums, change_bar, folding_bar)
 
-        def mark_line_modified(event):
-            if event.char and event.keysym not in ("Control_L", "Control_R", "Shift_L", "Shift_R"):
-                text_area.tag_add("modified_line", "insert linestart", "insert lineend")
-                self.root.after(10, trigger_update)
-
         def on_modified(event):
             if text_area.edit_modified():
-                text_area.tag_remove('match', '1.0', tk.END)
                 self.root.after(1, trigger_update)
 
-        text_area.bind("<Key>", mark_line_modified)
         text_area.bind("<KeyRelease>", trigger_update)
         text_area.bind("<MouseWheel>", trigger_update)
         text_area.bind("<<Modified>>", on_modified)
@@ -224,34 +307,19 @@ class BittinikkariEditor:
         if content: 
             text_area.insert(1.0, content)
             text_area.edit_modified(False) 
+            text_area.line_states.reset()
+        # Palautuspäiväkirja: muokkaukset avatun sisällön päälle (ks. recovery_journal.py)
+        text_area.journal = self.recovery.attach(text_area, path, content or "")
         
         self.apply_syntax_highlighting(text_area)
         self.notebook.add(tab, text=title)
         self.notebook.select(tab)
         self.root.after(100, trigger_update)
+        return tab
 
     def update_lines(self, text_area, line_nums, change_bar, folding_bar):
-        line_nums.delete("all")
-        change_bar.delete("all")
-        folding_bar.delete("all")
-        
-        is_modified_globally = text_area.edit_modified()
-        i = text_area.index("@0,0")
-        while True:
-            dline = text_area.dlineinfo(i)
-            if dline is None: break
-            y1, y2 = dline[1], dline[1] + dline[3]
-            line_num = str(i).split(".")[0]
-            line_nums.create_text(35, y1, anchor="ne", text=line_num, fill="gray")
-            
-            has_tag = "modified_line" in text_area.tag_names(f"{line_num}.0")
-            if not is_modified_globally:
-                color = "green"
-                text_area.tag_remove("modified_line", f"{line_num}.0", f"{line_num}.end")
-            else:
-                color = "red" if has_tag else "#313335"
-            change_bar.create_rectangle(0, y1, 5, y2, fill=color, outline="")
-            i = text_area.index("%s+1line" % i)
+        """Pyytää rivinumeroiden ja muutospalkin päivityksen (ks. gutter.py); ryöppy yhdistetään yhdeksi piirroksi."""
+        text_area.gutter.request()
 
     def open_settings(self):
         messagebox.showinfo("Asetukset", "Asetuspaneeli tulossa päivityksessä (2026).")
@@ -273,8 +341,19 @@ class BittinikkariEditor:
             self.open_specific_file(path)
 
     def open_specific_file(self, path):
-        """Lukee tiedoston sisällön ja avaa uuden välilehden."""
+        """
+        Lukee tiedoston sisällön ja avaa uuden välilehden. Suuret tiedostot ladataan
+        paloittain (large_file_threshold_mb) ja hyvin suuret avataan vain luku
+        -näkymään muistiin kuvattuna (mmap_view_threshold_mb).
+        """
         try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            if size_mb >= self.settings.get("mmap_view_threshold_mb", 100):
+                self.open_mapped_file(path)
+                return
+            if size_mb >= self.settings.get("large_file_threshold_mb", 8):
+                self.open_large_file(path)
+                return
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
             self.new_file(content=content, title=os.path.basename(path), path=path)
@@ -282,12 +361,92 @@ class BittinikkariEditor:
         except Exception as e:
             messagebox.showerror("Virhe", f"Tiedostoa ei voitu avata: {e}")
 
+    def open_large_file(self, path):
+        """Lataa tiedoston välilehteen paloittain; välilehti on lukittu latauksen ajan."""
+        title = os.path.basename(path)
+        tab = self.new_file(title=title, path=path)
+        text_area = tab.text_area
+
+        def on_progress(done, total):
+            percent = min(100, done * 100 // total)
+            self.notebook.tab(tab, text=f"{title} ({percent} %)")
+            self.status_bar.config(text=f"Ladataan {title}: {percent} %")
+
+        def on_done(error):
+            tab.cancel_loading = None
+            self.notebook.tab(tab, text=title)
+            text_area.line_states.reset()
+            text_area.gutter.request()
+            if error:
+                # Osittain ladattua tekstiä ei saa tallentaa alkuperäisen päälle: välilehti
+                # irrotetaan tiedostosta ja jätetään vain luku -tilaan
+                tab.file_path = None
+                text_area.config(state="disabled")
+                text_area.journal.discard()
+                self.notebook.tab(tab, text=f"{title} [keskeytynyt]")
+                messagebox.showerror("Virhe", f"Tiedoston lataus keskeytyi: {error}")
+            else:
+                text_area.journal.rebase(path, text_of(text_area))
+                self.update_status(f"Avattu: {path}")
+
+        tab.cancel_loading = load_in_chunks(text_area, path, on_progress, on_done)
+
+    def open_mapped_file(self, path):
+        """
+        Avaa hyvin suuren tiedoston vain luku -näkymään: tiedosto kuvataan muistiin (mmap)
+        ja rivit dekoodataan vasta, kun ne vieritetään näkyviin. Rivien alut indeksoidaan
+        taustalla lyhyissä erissä, joten näkymä aukeaa heti.
+        """
+        title = os.path.basename(path)
+        lines = MappedLines(path)
+        tab = tk.Frame(self.notebook, bg=self.settings.get("bg_color", "#2b2b2b"))
+        view = VirtualLineView(tab, lines, colors=(), font=("Courier New", 12))
+        view.pack(fill=tk.BOTH, expand=True)
+        tab.text_area = None
+        tab.file_path = path
+        tab.mapped = lines
+        tab.view = view
+        self.notebook.add(tab, text=f"{title} [vain luku]")
+        self.notebook.select(tab)
+
+        def index_more():
+            tab.index_job = None
+            if lines.closed:
+                return
+            done = lines.index_step()
+            view.refresh()
+            if done:
+                self.update_status(f"Avattu (vain luku): {path} | {len(lines)} riviä")
+            else:
+                self.status_bar.config(text=f"Indeksoidaan {title}: {lines.progress} % ({len(lines)} riviä)")
+                tab.index_job = self.root.after(1, index_more)
+
+        tab.index_job = self.root.after(1, index_more)
+
+    def check_editable(self, text_widget):
+        """
+        Onko välilehteä lupa muuttaa: vain luku -näkymä (None), kesken oleva lataus ja
+        keskeytynyt lataus (lukittu widget) ilmoitetaan käyttäjälle ja palautetaan False.
+        """
+        if text_widget is not None and getattr(text_widget, "loading", False):
+            messagebox.showinfo("Bittinikkari", "Tiedoston lataus on vielä kesken.")
+            return False
+        if text_widget is None or str(text_widget.cget("state")) == "disabled":
+            messagebox.showinfo("Bittinikkari", "Välilehti on vain luku -tilassa.")
+            return False
+        return True
+
     def save_file(self, save_as=False):
-        """Tallentaa nykyisen tiedoston. Luo automaattisesti .bak-varmuuskopion."""
-        import shutil
+        """
+        Tallentaa nykyisen tiedoston taustalla (SavePipeline): teksti kopioidaan heti ja
+        kirjoitetaan atomisesti, vanha sisältö varmuuskopiovarastoon. Tallennettu-tila asetetaan vasta,
+        kun kirjoitus on valmis eikä tekstiä ole sillä välin muutettu.
+        """
         try:
             text_widget = self.get_current_text_widget()
             path = self.get_current_file_path()
+            if not self.check_editable(text_widget):
+                return False
             
             if not path or save_as:
                 path = filedialog.asksaveasfilename(
@@ -296,25 +455,125 @@ class BittinikkariEditor:
                 )
                 
             if path:
-                # Varmuuskopiointi ennen tallennusta
-                if os.path.exists(path):
-                    try:
-                        shutil.copy2(path, path + ".bak")
-                    except:
-                        pass # Varmuuskopiointi epäonnistui, jatketaan silti
-
-                content = text_widget.get(1.0, tk.END)
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(content)
-                
+                content = text_of(text_widget) + "\n" # kuten get(1.0, END): Tk:n loppurivinvaihto mukaan
+                version = text_widget.document.version
                 self.set_current_file_path(path)
-                text_widget.edit_modified(False)
-                self.update_status(f"Tallennettu: {os.path.basename(path)}")
+
+                def saved(error, findings):
+                    if error is not None:
+                        messagebox.showerror("Tallennusvirhe", str(error))
+                        return
+                    if text_widget.winfo_exists():
+                        if text_widget.document.version == version:
+                            text_widget.edit_modified(False)
+                            text_widget.line_states.mark_saved()
+                            text_widget.gutter.request()
+                            text_widget.journal.rebase(path, content)
+                        else:
+                            # Tekstiä muutettiin tallennuksen aikana: muutokset tallennetun päälle
+                            text_widget.journal.rebase(path, content, text_of(text_widget))
+                    status = f"Tallennettu: {os.path.basename(path)}"
+                    if findings:
+                        status += f" | {len(findings)} varausta ilman free-kutsua"
+                    self.update_status(status)
+
+                analyze = analyze_c_source if path.endswith((".c", ".h")) else None
+                self.save_pipeline.save(path, content, saved, analyze, self.backup_dir_base())
+                self.update_status(f"Tallennetaan: {os.path.basename(path)}...")
                 return True
         except Exception as e:
             messagebox.showerror("Tallennusvirhe", str(e))
         return False
 
+    def quit_app(self):
+        """
+        Odottaa kesken olevat tallennukset ennen kuin ohjelma suljetaan. Tallentamattomien
+        välilehtien palautuspäiväkirjat jätetään, jotta muutokset voi palauttaa seuraavalla kerralla.
+        """
+        self.save_pipeline.flush(timeout=10)
+        self.flush_project_save()
+        tabs = [self.notebook.nametowidget(tab_id) for tab_id in self.notebook.tabs()]
+        self.recovery.close(keep=[tab.text_area for tab in tabs
+                                  if getattr(tab, "text_area", None) is not None and tab.text_area.edit_modified()])
+        self.root.quit()
+
+    def recover_tabs(self):
+        """Tarjoaa edellisen istunnon tallentamattomat muutokset palautettaviksi päiväkirjoista."""
+        files = self.recovery.leftovers()
+        if not files:
+            return
+        if not messagebox.askyesno("Palautus", f"Edelliseltä kerralta jäi tallentamattomia muutoksia "
+                                               f"({len(files)} välilehteä). Palautetaanko ne?"):
+            for file in files:
+                remove_journal(file)
+            return
+        failed = []
+        for file in files:
+            try:
+                path, base, text = read_journal(file)
+                if path:
+                    tab = self.new_file(content=base, title=os.path.basename(path), path=path)
+                else:
+                    tab = self.new_file(content=base, title="Palautettu")
+                apply_recovered(tab.text_area, base, text)
+            except StaleJournalError as e:
+                # Muokkauksia ei voi toistaa muuttuneen tiedoston päälle: päiväkirja jätetään talteen
+                failed.append(f"{e} (päiväkirja säilytetty: {set_aside(file)})")
+                continue
+            except (OSError, ValueError) as e:
+                failed.append(str(e))
+            remove_journal(file)
+        if failed:
+            messagebox.showwarning("Palautus", "Kaikkea ei voitu palauttaa:\n" + "\n".join(failed))
+        self.update_status(f"Palautettu {len(files) - len(failed)} välilehteä")
+
+    def restore_from_backup(self):
+        """Näyttää nykyisen tiedoston varmuuskopiot ja palauttaa valitun."""
+        if not self.check_editable(self.get_current_text_widget()):
+            return
+        path = self.get_current_file_path()
+        if not path or not os.path.exists(path):
+            messagebox.showwarning("Bittinikkari", "Tiedostoa ei ole vielä tallennettu levylle.")
+            return
+
+        rel_path = os.path.relpath(os.path.abspath(path), self.backup_dir_base())
+        store = open_store(self.settings)
+        history = store.history(rel_path)
+        if not history:
+            messagebox.showinfo("Varmuuskopiot", f"Tiedostolle {rel_path} ei löytynyt varmuuskopioita.")
+            return
+
+        win = tk.Toplevel(self.root)
+        win.title(f"Varmuuskopiot: {rel_path}")
+        win.geometry("420x300")
+        win.attributes('-topmost', True)
+        listbox = tk.Listbox(win, font=("Courier New", 10))
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for entry in history:
+            listbox.insert(tk.END, f"{entry['stamp']}  {entry['size']:>10} t  {entry['hash'][:12]}")
+        listbox.selection_set(0)
+
+        def do_restore():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            entry = history[selection[0]]
+            try:
+                store.restore(rel_path, path, entry["hash"])
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                text_widget = self.get_current_text_widget()
+                text_widget.delete("1.0", tk.END)
+                text_widget.insert("1.0", content)
+                text_widget.edit_modified(False)
+                text_widget.line_states.reset()
+                self.update_status(f"Palautettu varmuuskopiosta: {entry['stamp']}")
+                win.destroy()
+            except Exception as e:
+                messagebox.showerror("Virhe", f"Palautus epäonnistui: {e}")
+
+        tk.Button(win, text="Palauta", command=do_restore, width=12).pack(pady=(0, 10))
+
     def create_context_menu(self, text_widget):
         context_menu = tk.Menu(text_widget, tearoff=0)
         context_menu.add_command(label="Leikkaa", command=lambda: text_widget.event_generate("<<Cut>>"))
@@ -331,6 +590,11 @@ class BittinikkariEditor:
 
     def find_text(self):
         text_widget = self.get_current_text_widget()
+        if text_widget is None:
+            return
+        if getattr(text_widget, "loading", False):
+            messagebox.showinfo("Bittinikkari", "Tiedoston lataus on vielä kesken.")
+            return
         selected_text = ""
         try:
             if text_widget.tag_ranges("sel"):
@@ -339,7 +603,7 @@ class BittinikkariEditor:
 
         find_win = tk.Toplevel(self.root)
         find_win.title("Etsi ja Korvaa")
-        find_win.geometry("450x230")
+        find_win.geometry("520x230")
         find_win.attributes('-topmost', True)
         main_frame = tk.Frame(find_win, padx=10, pady=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -356,70 +620,297 @@ class BittinikkariEditor:
         replace_entry.grid(row=1, column=1, padx=5, pady=5)
 
         regex_var = tk.BooleanVar(value=False)
-        tk.Checkbutton(main_frame, text="Regex haku", variable=regex_var).grid(row=2, column=1, sticky="w")
+        result_label = tk.Label(main_frame, text="", fg="gray")
+        result_label.grid(row=2, column=0, sticky="w")
+
+        # Haku tehdään kerran koko puskurista; seuraava/edellinen käyttää välimuistia, ja
+        # muokkauksen jälkeen haetaan uudelleen vain muuttuneet rivit (ks. find_engine.py)
+        engine = find_engine_for(text_widget)
+        pending = {"job": None}
+
+        def show_result():
+            total = len(engine.starts)
+            if not total:
+                result_label.config(text="Ei osumia")
+                return
+            more = "+" if engine.truncated else ""
+            position = f"{engine.current + 1}/" if engine.current >= 0 else ""
+            result_label.config(text=f"{position}{total:,}{more}")
 
         def do_find(event=None):
-            text_widget.tag_remove('match', '1.0', tk.END)
             s = find_entry.get()
-            if not s: return
-            idx = '1.0'
-            use_regex = regex_var.get()
-            while True:
-                idx = text_widget.search(s, idx, stopindex=tk.END, nocase=True, regexp=use_regex)
-                if not idx: break
-                if use_regex:
-                    content_after = text_widget.get(idx, f"{idx} lineend")
-                    match_obj = re.search(s, content_after, re.IGNORECASE)
-                    match_len = len(match_obj.group(0)) if match_obj else 1
-                else: match_len = len(s)
-                lastidx = f"{idx}+{match_len}c"
-                text_widget.tag_add('match', idx, lastidx)
-                idx = lastidx
-            text_widget.tag_config('match', background='yellow', foreground='black')
+            if not s:
+                engine.reset()
+                result_label.config(text="")
+                return False
+            try:
+                engine.search(s, use_regex=regex_var.get())
+            except re.error as e:
+                result_label.config(text=f"Virheellinen regex: {e}")
+                return False
+            show_result()
+            return True
+
+        def schedule_find(event=None):
+            # Haku kirjoitettaessa: näppäilyt yhdistetään, ja haku tehdään vasta tauon jälkeen
+            if event is not None and event.keysym in ("Return", "Up", "Down", "Left", "Right"):
+                return
+            if pending["job"] is not None:
+                find_win.after_cancel(pending["job"])
+            pending["job"] = find_win.after(TYPE_DEBOUNCE_MS, run_scheduled)
+
+        def run_scheduled():
+            pending["job"] = None
+            do_find()
+
+        def on_close(event):
+            if event.widget is find_win and engine.on_change == show_result:
+                engine.on_change = None
+
+        tk.Checkbutton(main_frame, text="Regex haku", variable=regex_var,
+                       command=schedule_find).grid(row=2, column=1, sticky="w")
+        engine.on_change = show_result
+        find_win.bind("<Destroy>", on_close)
+
+        def do_next(event=None, backwards=False):
+            if do_find():
+                engine.next(backwards)
+                show_result()
+            return "break"
 
         def do_replace_all():
+            # Vain muuttuvat kohdat korvataan, ja koko korvaus kumoutuu yhdellä Ctrl+Z:lla
             search_str = find_entry.get()
-            replace_str = replace_entry.get()
-            if not search_str: return
-            content = text_widget.get("1.0", tk.END)
-            new_content = content.replace(search_str, replace_str)
-            text_widget.delete("1.0", tk.END)
-            text_widget.insert("1.0", new_content)
-            text_widget.tag_remove('match', '1.0', tk.END)
-            text_widget.edit_modified(True)
+            if not search_str or not self.check_editable(text_widget): return
+            try:
+                count = engine.replace_all(search_str, replace_entry.get(), use_regex=regex_var.get())
+            except re.error as e:
+                result_label.config(text=f"Virheellinen regex: {e}")
+                return
+            more = " (ensimmäiset)" if engine.truncated else ""
+            result_label.config(text=f"Korvattu: {count:,}{more}")
+            self.update_status(f"Korvattu {count} osumaa{more}.")
 
         btn_frame = tk.Frame(main_frame)
         btn_frame.grid(row=3, column=0, columnspan=2, pady=10)
         tk.Button(btn_frame, text="Etsi", command=do_find, width=10).pack(side=tk.LEFT, padx=2)
+        tk.Button(btn_frame, text="Edellinen", command=lambda: do_next(backwards=True), width=10).pack(side=tk.LEFT, padx=2)
+        tk.Button(btn_frame, text="Seuraava", command=do_next, width=10).pack(side=tk.LEFT, padx=2)
         tk.Button(btn_frame, text="Korvaa kaikki", command=do_replace_all, width=12).pack(side=tk.LEFT, padx=2)
-        find_entry.bind("<Return>", do_find)
+        find_entry.bind("<Return>", do_next)
+        find_entry.bind("<Shift-Return>", lambda e: do_next(backwards=True))
+        find_entry.bind("<KeyRelease>", schedule_find)
+        find_entry.focus_set()
+
+    def find_in_project(self):
+        """
+        Etsii kaikista projektin Unit-tiedostoista taustalla rinnakkain. Tulokset ilmestyvät
+        puuhun tiedostoittain sitä mukaa kuin ne valmistuvat; tuplaklikkaus avaa osuman.
+        Korvaus varmuuskopioi ja kirjoittaa tiedostot atomisesti (ks. engine.replace_in_project).
+        """
+        project_path = self.settings.get("current_project")
+        if not project_path or not os.path.exists(project_path):
+            messagebox.showwarning("Bittinikkari", "Projektitiedostoa ei löydy.")
+            return
+
+        win = tk.Toplevel(self.root)
+        win.title("Etsi projektista")
+        win.geometry("700x500")
+        form = tk.Frame(win, padx=10, pady=10)
+        form.pack(fill=tk.X)
+        tk.Label(form, text="Etsi:").grid(row=0, column=0, sticky="w")
+        find_entry = tk.Entry(form, width=40)
+        find_entry.grid(row=0, column=1, padx=5, pady=2, sticky="we")
+        tk.Label(form, text="Korvaa:").grid(row=1, column=0, sticky="w")
+        replace_entry = tk.Entry(form, width=40)
+        replace_entry.grid(row=1, column=1, padx=5, pady=2, sticky="we")
+        regex_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form, text="Regex haku", variable=regex_var).grid(row=2, column=1, sticky="w")
+        status_label = tk.Label(form, text="", fg="gray", anchor="w")
+        status_label.grid(row=3, column=0, columnspan=3, sticky="we")
+
+        tree = ttk.Treeview(win, columns=("line", "text"), show="tree headings")
+        tree.heading("#0", text="Tiedosto", anchor="w")
+        tree.heading("line", text="Rivi", anchor="w")
+        tree.heading("text", text="Teksti", anchor="w")
+        tree.column("#0", width=200)
+        tree.column("line", width=60, stretch=False)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        locations = {} # puun rivi -> (polku, rivi, sarake, pituus)
+        state = {"task": None, "token": None}
+
+        def add_result(result):
+            if result["error"]:
+                tree.insert("", "end", text=f"{result['file']} (virhe: {result['error']})")
+                return
+            more = "+" if result["truncated"] else ""
+            node = tree.insert("", "end", text=f"{result['file']} ({len(result['hits'])}{more})", open=True)
+            for line, column, length, text in result["hits"]:
+                item = tree.insert(node, "end", values=(line, text.strip()))
+                locations[item] = (result["path"], line, column, length)
+
+        def stop():
+            state["token"] = None # keskeytetyn haun jonossa olevat tulokset ohitetaan
+            if state["task"] is not None:
+                state["task"].cancel()
+                state["task"] = None
+
+        def do_search(event=None):
+            query = find_entry.get()
+            if not query:
+                return
+            try:
+                compile_pattern(query, regex_var.get())
+            except re.error as e:
+                status_label.config(text=f"Virheellinen regex: {e}")
+                return
+            stop()
+            tree.delete(*tree.get_children())
+            locations.clear()
+            token = state["token"] = object()
+
+            def current():
+                return state["token"] is token and win.winfo_exists()
+
+            def on_item(result):
+                if current():
+                    add_result(result)
+
+            def on_progress(info):
+                if current():
+                    status_label.config(text=f"Haetaan... {info['done']}/{info['total']} tiedostoa")
+
+            def on_done(result):
+                if current():
+                    state["task"] = None
+                    hits, files = result
+                    status_label.config(text=f"{hits:,} osumaa {files} tiedostossa")
+
+            def on_error(error):
+                if current():
+                    state["task"] = None
+                    status_label.config(text=f"Hakuvirhe: {error}")
+
+            state["task"] = BackgroundTask(self.root, search_project, project_path, dict(self.settings),
+                                           query, regex_var.get(), on_item=on_item, on_progress=on_progress,
+                                           on_done=on_done, on_error=on_error).start()
+
+        def do_replace():
+            query = find_entry.get()
+            if not query or not locations:
+                return
+            if getattr(self, "maintenance_task", None):
+                messagebox.showinfo("Bittinikkari", "Projektin käsittely on jo käynnissä.")
+                return
+            # Avoimet tiedostot ohitetaan, ettei välilehden tallennus kumoa korvausta
+            open_paths = [tab.file_path for tab in map(self.notebook.nametowidget, self.notebook.tabs())
+                          if getattr(tab, "file_path", None)]
+            if not messagebox.askyesno("Vahvistus", f"Korvataanko osumat {len(tree.get_children())} tiedostossa?\n\n"
+                                       "Tiedostot varmuuskopioidaan ennen kirjoitusta. "
+                                       "Editorissa auki olevat tiedostot ohitetaan.", parent=win):
+                return
+            stop()
+
+            def finish():
+                self.maintenance_task = None
+                dialog.destroy()
+
+            def on_done(result):
+                finish()
+                count, files, errors = result
+                self.update_status(f"Projektin korvaus: {count} osumaa {files} tiedostossa.")
+                if errors:
+                    self.show_report("Korvauksen virheet", errors)
+                if win.winfo_exists():
+                    do_search()
+
+            def on_error(error):
+                finish()
+                messagebox.showerror("Bittinikkari", f"Korvaus epäonnistui: {error}")
+
+            dialog = ProgressDialog(self.root, "Korvataan projektissa...", lambda: self.maintenance_task.cancel())
+            self.maintenance_task = BackgroundTask(self.root, replace_in_project, project_path, dict(self.settings),
+                                                   query, replace_entry.get(), regex_var.get(), True, open_paths,
+                                                   on_progress=dialog.update_progress,
+                                                   on_done=on_done, on_error=on_error).start()
+
+        def open_hit(event=None):
+            location = locations.get(tree.focus())
+            if location:
+                self.goto_location(*location)
+
+        buttons = tk.Frame(form)
+        buttons.grid(row=0, column=2, rowspan=2, padx=5)
+        tk.Button(buttons, text="Etsi", command=do_search, width=12).pack(pady=2)
+        tk.Button(buttons, text="Korvaa kaikki", command=do_replace, width=12).pack(pady=2)
+        form.columnconfigure(1, weight=1)
+        find_entry.bind("<Return>", do_search)
+        tree.bind("<Double-1>", open_hit)
+        tree.bind("<Return>", open_hit)
+        win.bind("<Destroy>", lambda e: stop() if e.widget is win else None)
         find_entry.focus_set()
 
+    def find_tab(self, path):
+        """Palauttaa välilehden, jossa tiedosto on jo auki, tai None."""
+        path = os.path.abspath(path)
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id)
+            if getattr(tab, "file_path", None) and os.path.abspath(tab.file_path) == path:
+                return tab
+        return None
+
+    def goto_location(self, path, line, column=0, length=0):
+        """Avaa tiedoston (tai valitsee sen välilehden) ja siirtää kursorin annettuun kohtaan."""
+        tab = self.find_tab(path)
+        if tab is None:
+            self.open_specific_file(path)
+            tab = self.find_tab(path)
+            if tab is None:
+                return
+        self.notebook.select(tab)
+        if tab.text_area is None:
+            tab.view.see(line - 1) # vain luku -näkymä
+            return
+        start = f"{line}.{column}"
+        tab.text_area.mark_set(tk.INSERT, start)
+        tab.text_area.tag_remove("sel", "1.0", tk.END)
+        tab.text_area.tag_add("sel", start, f"{start}+{length}c")
+        tab.text_area.see(start)
+        tab.text_area.focus_set()
+
     def nikkaroi_action(self):
         text_widget = self.get_current_text_widget()
-        content = text_widget.get("1.0", tk.END)
+        if text_widget is None or getattr(text_widget, "loading", False):
+            return
+        content = text_of(text_widget)
         if self.save_file():
-            if "malloc" in content and "free" not in content:
-                messagebox.showwarning("Bittinikkari: Muistinhallinta", "Koodissa on 'malloc', mutta 'free' puuttuu!")
-            lines = content.split('\n')
-            new_content = '\n'.join([line.rstrip() for line in lines])
-            text_widget.delete("1.0", tk.END)
-            text_widget.insert("1.0", new_content)
+            # Funktiokohtainen varausanalyysi (tulos välimuistissa sisällön tiivisteen mukaan)
+            findings = analyze_c_source(content)
+            if findings:
+                lines = "\n".join(f"rivi {f['line']}: {f['call']}() funktiossa {f['function']}"
+                                  for f in findings[:10])
+                messagebox.showwarning("Bittinikkari: Muistinhallinta",
+                                       f"Varauksia ilman vastaavaa free-kutsua:\n{lines}")
+            # Rivien lopun tyhjät pois vain niiltä riveiltä, joilla niitä on, yhtenä kumoamisaskeleena
+            trailing = [(number, len(line.rstrip())) for number, line in enumerate(text_widget.document.lines(), 1)
+                        if line[-1:].isspace()]
+            text_widget.config(autoseparators=False)
+            try:
+                text_widget.edit_separator()
+                for number, length in trailing:
+                    text_widget.delete(f"{number}.{length}", f"{number}.end")
+                text_widget.edit_separator()
+            finally:
+                text_widget.config(autoseparators=True)
             self.update_status("Nikkarointi valmis.")
 
     def apply_syntax_highlighting(self, text_area):
-        syntax_colors = self.settings.get("syntax", {})
-        for tag, color in syntax_colors.items():
-            text_area.tag_configure(tag, foreground=color)
-        rules = [(r'\b(def|class|if|else|elif|while|for|return|int|char|void)\b', 'keyword'),
-                 (r'\b(malloc|free)\b', 'memory'), (r'\".*?\"', 'string'), (r'#.*|//.*', 'comment')]
-        def highlight():
-            content = text_area.get("1.0", tk.END)
-            for pattern, tag in rules:
-                for m in re.finditer(pattern, content):
-                    text_area.tag_add(tag, f"1.0+{m.start()}c", f"1.0+{m.end()}c")
-        text_area.bind("<KeyRelease>", lambda e: highlight(), add="+")
-        self.root.after(200, highlight)
+        """
+        Liittää välilehteen inkrementaalisen värityksen: muokkauksen jälkeen
+        tokenisoidaan vain muuttuneet rivit (ks. highlighter.py).
+        """
+        text_area.highlighter = IncrementalHighlighter(text_area, self.settings.get("syntax", {}))
 
     def show_project_context_menu(self, event):
         item = self.project_tree.identify_row(event.y)
@@ -428,33 +919,21 @@ class BittinikkariEditor:
             self.project_menu.post(event.x_root, event.y_root)
 
     def remove_from_project(self):
-        """Poistaa valitun tiedoston .cbp-tiedostosta."""
-        item_id = self.project_tree.focus()
-        item_data = self.project_tree.item(item_id)
-        file_to_remove = item_data["values"][0] if item_data["values"] else None
-        
-        if not file_to_remove:
+        """Poistaa valitut tiedostot (kansiorivi: koko kansion) .cbp-tiedostosta yhtenä eränä."""
+        model = self.project_view.model
+        if model is None:
+            return
+        files = self.project_view.files_of(self.project_tree.selection())
+        if not files:
             return
 
-        if messagebox.askyesno("Vahvista", f"Poistetaanko '{file_to_remove}' projektista?\n(Tiedosto jää levylle.)"):
-            project_path = self.settings.get("current_project")
-            try:
-                tree = ET.parse(project_path)
-                root = tree.getroot()
-                proj_node = root.find("Project")
-                
-                # Etsitään ja poistetaan oikea Unit-tagi
-                for unit in proj_node.findall("Unit"):
-                    if unit.get("filename") == file_to_remove:
-                        proj_node.remove(unit)
-                        break
-                
-                # Tallennetaan muutokset
-                tree.write(project_path, encoding="UTF-8", xml_declaration=True)
-                self.load_cbp_project(project_path) # Päivitetään näkymä
-                self.update_status(f"Poistettu projektista: {file_to_remove}")
-            except Exception as e:
-                messagebox.showerror("Virhe", f"Poisto epäonnistui: {e}")
+        question = (f"Poistetaanko '{files[0]}' projektista?" if len(files) == 1
+                    else f"Poistetaanko {len(files)} tiedostoa projektista?")
+        if messagebox.askyesno("Vahvista", f"{question}\n(Tiedostot jäävät levylle.)"):
+            # Malli poistaa Unit-tagit ja puunäkymän rivit; .cbp kirjoitetaan kerran erän jälkeen
+            removed = model.remove_many(files)
+            self.schedule_project_save()
+            self.update_status(f"Poistettu projektista: {files[0] if removed == 1 else f'{removed} tiedostoa'}")
 
     def populate_files_tab(self, path):
         """Täyttää Files-välilehden kansion sisällöllä."""
@@ -480,6 +959,7 @@ class BittinikkariEditor:
         self.project_tree = ttk.Treeview(self.projects_tab)
         self.project_tree.pack(fill=tk.BOTH, expand=True)
         self.project_tree.heading("#0", text="Bittinikkari - tiedostot", anchor='w')
+        self.project_view = ProjectTreeView(self.project_tree)
         
         # Project-valikko (Oikea nappi)
         self.project_menu = tk.Menu(self.project_tree, tearoff=0)
@@ -528,13 +1008,11 @@ class BittinikkariEditor:
                 self.open_specific_file(file_path)
 
     def add_selected_to_project(self):
-        """Lisää Files-välilehdellä valitun tiedoston .cbp-projektiin."""
-        item_id = self.files_tree.focus()
-        item_data = self.files_tree.item(item_id)
-        if item_data["values"]:
-            file_path = item_data["values"][0]
-            # Hyödynnetään aiempaa add_file_to_project -logiikkaa mutta suoralla polulla
-            self.do_add_file_to_cbp(file_path)
+        """Lisää Files-välilehdellä valitut tiedostot ja kansiot (rekursiivisesti) .cbp-projektiin."""
+        paths = [self.files_tree.item(item_id)["values"][0] for item_id in self.files_tree.selection()
+                 if self.files_tree.item(item_id)["values"]]
+        if paths:
+            self.add_files_to_project(paths)
 
     def show_project_context_menu(self, event):
         item = self.project_tree.identify_row(event.y)
@@ -542,47 +1020,15 @@ class BittinikkariEditor:
             self.project_tree.selection_set(item)
             self.project_menu.post(event.x_root, event.y_root)
 
-    def load_cbp_project(self, filename):
-        if not os.path.exists(filename):
-            self.project_tree.insert("", "end", text="Projektitiedosto puuttuu")
-            return
-
-        try:
-            tree = ET.parse(filename)
-            root = tree.getroot()
-            
-            # Haetaan projektin nimi (tiedostossa "Bittinikkatri" )
-            proj_node = root.find("Project")
-            title = proj_node.find("Option").get("title", "Bittinikkari")
-            
-            main_node = self.project_tree.insert("", "end", text=title, open=True)
-
-            # Ryhmitellään tiedostot kansioiden mukaan visuaalisesti
-            folders = {}
-            
-            for unit in proj_node.findall("Unit"):
-                filepath = unit.get("filename")
-                parts = filepath.split('/')
-                
-                if len(parts) > 1:
-                    # On kansion sisällä (esim. src/ai/factory.py)
-                    parent_path = "/".join(parts[:-1])
-                    if parent_path not in folders:
-                        folders[parent_path] = self.project_tree.insert(main_node, "end", text=parent_path, open=False)
-                    self.project_tree.insert(folders[parent_path], "end", text=parts[-1], values=(filepath,))
-                else:
-                    # Juuritasolla (esim. main.py)
-                    self.project_tree.insert(main_node, "end", text=filepath, values=(filepath,))
-                    
-        except Exception as e:
-            print(f"Virhe CBP-tiedoston luvussa: {e}")
-
     def on_project_tree_double_click(self, event):
         item_id = self.project_tree.focus()
         item_data = self.project_tree.item(item_id)
         if item_data["values"]:
             file_path = item_data["values"][0]
-            if os.path.exists(file_path):
+            model = self.project_view.model
+            if model is not None and file_path in model:
+                file_path = model.full_path(file_path) # Unit-polut ovat suhteessa .cbp-tiedostoon
+            if os.path.isfile(file_path):
                 self.open_specific_file(file_path)
 
     def create_menu(self):
@@ -591,8 +1037,9 @@ class BittinikkariEditor:
         file_menu.add_command(label="Uusi", command=self.new_file)
         file_menu.add_command(label="Avaa", command=self.open_file)
         file_menu.add_command(label="Tallenna", command=self.save_file)
+        file_menu.add_command(label="Palauta varmuuskopiosta...", command=self.restore_from_backup)
         file_menu.add_separator()
-        file_menu.add_command(label="Lopeta", command=self.root.quit)
+        file_menu.add_command(label="Lopeta", command=self.quit_app)
         menubar.add_cascade(label="Tiedosto", menu=file_menu)
         
         edit_menu = tk.Menu(menubar, tearoff=0)
@@ -604,6 +1051,12 @@ class BittinikkariEditor:
         project_menu.add_command(label="Avaa projekti (.cbp)...", command=lambda: self.load_cbp_project(filedialog.askopenfilename()))
         project_menu.add_separator()
         project_menu.add_command(label="Lisää tiedosto projektiin...", command=self.add_file_to_project)
+        project_menu.add_command(label="Lisää kansio projektiin...", command=self.add_folder_to_project)
+        project_menu.add_separator()
+        project_menu.add_command(label="Etsi projektista...", command=self.find_in_project, accelerator="Ctrl+Shift+F")
+        project_menu.add_command(label="Esikatsele hienosäätö (diff)...", command=self.preview_full_maintenance)
+        project_menu.add_command(label="⚡ Hienosäädä projekti", command=self.run_full_maintenance,
+                                 accelerator="Ctrl+Shift+B")
         menubar.add_cascade(label="Projekti", menu=project_menu)
 
         menubar.add_command(label="Asetukset", command=self.open_settings)
@@ -615,7 +1068,8 @@ class BittinikkariEditor:
         self.root.config(menu=menubar)
 
     def get_current_text_widget(self):
-        return self.notebook.nametowidget(self.notebook.select()).text_area
+        # Vain luku -näkymässä (mmap) ei ole Text-widgetiä
+        return getattr(self.notebook.nametowidget(self.notebook.select()), "text_area", None)
 
     def get_current_file_path(self):
         return self.notebook.nametowidget(self.notebook.select()).file_path
@@ -625,19 +1079,35 @@ class BittinikkariEditor:
         tab.file_path = path
         self.notebook.tab(tab, text=os.path.basename(path))
 
+    def backup_dir_base(self):
+        """Varmuuskopiovaraston polut ovat suhteessa .cbp-tiedoston kansioon (ilman projektia nykyiseen kansioon)."""
+        project_path = self.settings.get("current_project")
+        return os.path.dirname(os.path.abspath(project_path)) if project_path else os.getcwd()
+
     def update_status(self, msg):
         path = self.get_current_file_path()
-        backup_str = " | [Backup OK]" if path and os.path.exists(path + ".bak") else ""
+        has_backup = path and open_store(self.settings).has_backup(
+            os.path.relpath(os.path.abspath(path), self.backup_dir_base()))
+        backup_str = " | [Backup OK]" if has_backup else ""
         self.status_bar.config(text=f"{msg}{backup_str}")
 
     def close_current_tab(self):
         current_index = self.notebook.index(self.notebook.select())
         tab_id = self.notebook.tabs()[current_index]
         tab = self.notebook.nametowidget(tab_id)
-        if tab.text_area.edit_modified():
+        if getattr(tab, "cancel_loading", None):
+            tab.cancel_loading()
+        elif tab.text_area is not None and tab.text_area.edit_modified():
             if messagebox.askyesno("Tallennus", "Tallennetaanko muutokset?"):
                 self.save_file()
+        if getattr(tab, "text_area", None) is not None:
+            tab.text_area.journal.discard()
+        if getattr(tab, "mapped", None):
+            if tab.index_job:
+                self.root.after_cancel(tab.index_job)
+            tab.mapped.close()
         self.notebook.forget(current_index)
+        tab.destroy()
 
     def show_about(self):
         about_win = tk.Toplevel(self.root)
@@ -710,74 +1180,70 @@ class BittinikkariEditor:
             return
 
         if messagebox.askyesno("Vahvistus", "Hienosäädetäänkö koko bittinikkari-projekti?"):
-            # Kutsutaan engineä
-            changes, reports = process_full_project(path, self.settings)
-            
-            # Näytetään lopputulos
-            report_msg = "\n".join(reports[:20]) # Näytetään vain 20 ensimmäistä riviä
-            if len(reports) > 20: report_msg += "\n... (lista jatkuu)"
-            
-            messagebox.showinfo("Valmis", f"Muutoksia tehty: {total_changes}\n\nRaportti:\n{report_msg}")
-            self.update_status(f"Massakorjaus valmis: {changes} muutosta.")
+            # Kutsutaan engineä taustalla, editori ei jäädy
+            self.start_project_maintenance(path, "Massakorjauksen raportti")
 
     def add_file_to_project(self):
-        """Lisää valitun tiedoston nykyiseen .cbp-projektiin."""
+        """Lisää valitut tiedostot nykyiseen .cbp-projektiin."""
+        files = filedialog.askopenfilenames(title="Valitse projektiin lisättävät tiedostot")
+        if files:
+            self.add_files_to_project(files)
+
+    def add_folder_to_project(self):
+        """Lisää kansion kaikki tiedostot (alikansiot mukaan lukien) nykyiseen .cbp-projektiin."""
+        folder = filedialog.askdirectory(title="Valitse projektiin lisättävä kansio")
+        if folder:
+            self.add_files_to_project([folder])
+
+    def add_files_to_project(self, paths):
+        """
+        Lisää tiedostot (kansiot rekursiivisesti) projektiin yhtenä eränä. Jäsenyys tarkistetaan
+        mallin sanakirjasta, ja .cbp kirjoitetaan kerran erän jälkeen (schedule_project_save).
+        """
         project_path = self.settings.get("current_project", "Bittinikkari.cbp")
         
         if not os.path.exists(project_path):
             messagebox.showwarning("Virhe", "Avaa tai luo projekti ensin!")
             return
 
-        file_to_add = filedialog.askopenfilename(title="Valitse projektiin lisättävä tiedosto")
-        if file_to_add:
-            # Muutetaan polku suhteelliseksi projektitiedostoon nähden
-            rel_path = os.path.relpath(file_to_add, os.path.dirname(os.path.abspath(project_path)))
-            rel_path = rel_path.replace("\\", "/") # CodeBlocks käyttää vinoviivoja
-
-            try:
-                tree = ET.parse(project_path)
-                root = tree.getroot()
-                proj_node = root.find("Project")
-
-                # Tarkistetaan, onko tiedosto jo projektissa
-                already_exists = False
-                for unit in proj_node.findall("Unit"):
-                    if unit.get("filename") == rel_path:
-                        already_exists = True
-                        break
-
-                if not already_exists:
-                    new_unit = ET.SubElement(proj_node, "Unit")
-                    new_unit.set("filename", rel_path)
-                    
-                    # Tallennetaan kauniisti sisennettynä
-                    self._indent_xml(root)
-                    tree.write(project_path, encoding="UTF-8", xml_declaration=True)
-                    
-                    self.load_cbp_project(project_path) # Päivitetään puu
-                    self.update_status(f"Lisätty: {rel_path}")
-                else:
-                    messagebox.showinfo("Huomio", "Tiedosto on jo projektissa.")
+        try:
+            model = open_project(project_path)
+            if self.project_view.model is not model:
+                self.project_view.show(model)
+            # Polut suhteessa projektitiedostoon, vinoviivoin kuten CodeBlocksissa
+            rel_paths = [model.relative(file_path) for file_path in collect_files(paths, self.settings)]
+            added = model.add_many(rel_paths)
+        except Exception as e:
+            messagebox.showerror("Virhe", f"Tiedoston lisäys epäonnistui: {e}")
+            return
 
-            except Exception as e:
-                messagebox.showerror("Virhe", f"Tiedoston lisäys epäonnistui: {e}")
-
-    def _indent_xml(self, elem, level=0):
-        """Apumetodi XML:n siistiin sisentämiseen."""
-        i = "\n" + level*"\t"
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + "\t"
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                self._indent_xml(elem, level+1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
+        if added:
+            self.schedule_project_save()
+            self.update_status(f"Lisätty: {rel_paths[0] if len(rel_paths) == 1 else f'{added} tiedostoa'}")
+        elif len(rel_paths) == 1:
+            messagebox.showinfo("Huomio", "Tiedosto on jo projektissa.")
         else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
-	
+            self.update_status("Kaikki tiedostot ovat jo projektissa.")
+
+    def schedule_project_save(self):
+        """Kirjoittaa .cbp-tiedoston SAVE_DELAY_MS kuluttua; uusi muutos siirtää ajastusta."""
+        if self.project_save_job is not None:
+            self.root.after_cancel(self.project_save_job)
+        self.project_save_job = self.root.after(SAVE_DELAY_MS, self.flush_project_save)
+
+    def flush_project_save(self):
+        """Kirjoittaa odottavat projektin muutokset heti (ajastin, projektin vaihto, lopetus)."""
+        if self.project_save_job is not None:
+            self.root.after_cancel(self.project_save_job)
+            self.project_save_job = None
+        model = self.project_view.model
+        if model is None:
+            return
+        try:
+            model.save()
+        except Exception as e:
+            messagebox.showerror("Virhe", f"Projektitiedoston tallennus epäonnistui: {e}")
+
     def load_last_project(self):
         """Lataa viimeksi auki olleen projektin asetuksista."""
         last_proj = self.settings.get("current_project")
@@ -785,40 +1251,18 @@ class BittinikkariEditor:
             self.load_cbp_project(last_proj)
 
     def load_cbp_project(self, filename):
-        """Lataa Code::Blocks-projektin ja päivittää puunäkymän."""
+        """
+        Lataa Code::Blocks-projektin ja näyttää sen puunäkymässä. Malli on välimuistissa,
+        joten .cbp jäsennetään uudelleen vain, jos se on muuttunut levyllä (ks. project_model.py).
+        """
         if not filename: return
         
         try:
-            tree = ET.parse(filename)
-            root = tree.getroot()
-            proj_node = root.find("Project")
-            
-            if proj_node is not None:
-                # Tyhjennetään nykyinen puu
-                for i in self.project_tree.get_children():
-                    self.project_tree.delete(i)
-                
-                title = "Bittinikkari"
-                # Haetaan nimi <Option title="..."/> tagista
-                for opt in proj_node.findall("Option"):
-                    if opt.get("title"):
-                        title = opt.get("title")
-                
-                # Tallennetaan polku asetuksiin
-                self.settings["current_project"] = filename
-                
-                # Rakennetaan puu (kuten aiemmin määriteltiin)
-                main_node = self.project_tree.insert("", "end", text=title, open=True, values=(filename,))
-                
-                # Täytetään tiedostot <Unit filename="..."/> tageista
-                for unit in proj_node.findall("Unit"):
-                    f_name = unit.get("filename")
-                    self.project_tree.insert(main_node, "end", text=f_name, values=(f_name,))
-                
-                self.update_status(f"Projekti ladattu: {os.path.basename(filename)}")
+            self.flush_project_save() # edellisen projektin odottavat muutokset ensin
+            model = open_project(filename)
+            # Tallennetaan polku asetuksiin
+            self.settings["current_project"] = filename
+            self.project_view.show(model)
+            self.update_status(f"Projekti ladattu: {os.path.basename(filename)}")
         except Exception as e:
             messagebox.showerror("Luku-virhe", f"CBP-tiedostoa ei voitu lukea: {e}")
-
-
-
-
@@ -3,102 +3,320 @@
 # Lisenssi: GNU GPLv3
 
 import os
-import shutil
-from datetime import datetime
+import copy
 import json
+import threading
 import re
+import difflib
+from itertools import islice
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from manifest import (get_manifest_path, load_manifest, save_manifest,
+                      make_entry, stat_matches, content_matches)
+from atomic_file import AtomicFile, write_atomic
+from backup_store import open_store
+from c_analyzer import analyze_c_source, format_finding
+from trigram_index import open_index, notify_written
+
+# Yksi yhdistetty hakulauseke: GPL-otsikko, malloc/free-kutsut, rivin lopun tyhjät ja tabit.
+# Alun lookahead hylkää nopeasti kohdat, joista mikään vaihtoehto ei voi alkaa.
+# trail alkaa vain tyhjän jakson alusta (lookbehind), joten epäonnistunut yritys käy jakson
+# läpi vain kerran (tavallinen +, koska possessiivinen ++ vaatisi Python 3.11:n).
+ANALYSIS_RE = re.compile(r'(?=[Gmf\s])(?:(?P<gpl>GPLv3)|\b(?P<malloc>malloc)\(|\b(?P<free>free)\('
+                         r'|(?P<trail>(?<![^\S\n])[^\S\n]+$)|(?P<tab>\t+))', re.M)
 
 # Käytetään sovittua config-tiedostoa
 CONFIG_PATH = "config/config.json"
 
-def load_settings():
-    if not os.path.exists(CONFIG_PATH) or os.path.getsize(CONFIG_PATH) == 0:
-        return create_default_settings() # Luodaan uudet jos tiedosto on tyhjä
-
-    """Lataa asetukset tai luo oletustiedoston tarvittaessa."""
-    # 1. Varmistetaan kansion olemassaolo
-    config_dir = os.path.dirname(CONFIG_PATH)
-    if not os.path.exists(config_dir):
-        os.makedirs(config_dir)
-        print(f"Luotu kansio: {config_dir}")
-
-    # Oletusasetukset bittinikkarille
-    default_settings = {
-        "project_name": "bittinikkari",
-        "current_project": "",
-        "language": "fi",
-        "backup_dir": "backups",
-        "theme": "light"
-    }
-
-    # 2. Varmistetaan tiedoston olemassaolo
-    if not os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-                json.dump(default_settings, f, indent=4)
-            print(f"Luotu oletusasetukset: {CONFIG_PATH}")
-            return default_settings
-        except Exception as e:
-            print(f"Virhe oletusasetusten luonnissa: {e}")
-            return default_settings
-            
-    # 3. Luetaan olemassa oleva tiedosto
+# Projektihaku: osumia tiedostoa kohden ja osumarivin näytettävä pituus
+MAX_FILE_HITS = 1000
+MAX_HIT_TEXT = 200
+
+# Kuivan ajon diffistä näytetään enintään näin monta riviä tiedostoa kohden
+MAX_DIFF_LINES = 2000
+DIFF_CONTEXT = 3
+
+# Nostetaan aina, kun korjauslogiikka muuttuu -> vanhat manifestit mitätöityvät
+FIX_LOGIC_VERSION = 2
+
+# Oletusasetukset bittinikkarille
+DEFAULT_SETTINGS = {
+    "project_name": "bittinikkari",
+    "current_project": "",
+    "language": "fi",
+    "backup_dir": "backups",
+    "theme": "light",
+    "max_workers": 4,
+    "worker_type": "thread",
+    "incremental": True,
+    "skip_unchanged_writes": True,
+    "backup_compression": "zlib",
+    "backup_keep_generations": 10,
+    "backup_keep_days": 30,
+    "streaming_threshold_mb": 32,
+    "large_file_threshold_mb": 8,
+    "mmap_view_threshold_mb": 100,
+    "search_index": True,
+    "recovery_dir": "recovery",
+    "source_extensions": [".c", ".h", ".cpp", ".hpp", ".cc", ".py", ".js", ".ts", ".java", ".cs", ".go", ".rs"]
+}
+
+# Luettu config.json pidetään muistissa, kunnes tiedoston mtime tai koko muuttuu
+_settings_cache = {"key": None, "data": None}
+_settings_lock = threading.Lock()
+
+def _validate_settings(data):
+    """Täydentää puuttuvat asetukset oletuksilla ja hylkää väärän tyyppiset arvot."""
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    if not isinstance(data, dict):
+        print("Virheellinen config.json, käytetään oletusasetuksia.")
+        return settings
+    for key, value in data.items():
+        default = DEFAULT_SETTINGS.get(key)
+        if isinstance(default, bool):
+            valid = isinstance(value, bool)
+        elif isinstance(default, (int, float)):
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif isinstance(default, str):
+            valid = isinstance(value, str)
+        elif isinstance(default, list):
+            valid = isinstance(value, list) and all(isinstance(item, str) for item in value)
+        else:
+            valid = True # Tuntemattomat avaimet (esim. syntax, bg_color) kulkevat sellaisenaan
+        if valid:
+            settings[key] = value
+        else:
+            print(f"Virheellinen asetus {key}={value!r}, käytetään oletusta {default!r}.")
+    return settings
+
+def _config_key():
     try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Virhe asetusten luvussa: {e}")
-        return default_settings
+        st = os.stat(CONFIG_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _cached_settings():
+    """Palauttaa välimuistissa olevat asetukset. Tiedosto luetaan vain, jos se on muuttunut."""
+    key = _config_key()
+    with _settings_lock:
+        if _settings_cache["data"] is not None and key is not None and _settings_cache["key"] == key:
+            return _settings_cache["data"]
+
+        if key is None or key[1] == 0:
+            # Luodaan uudet oletukset, jos tiedosto puuttuu tai on tyhjä
+            data = copy.deepcopy(DEFAULT_SETTINGS)
+            try:
+                config_dir = os.path.dirname(CONFIG_PATH)
+                if config_dir and not os.path.exists(config_dir):
+                    os.makedirs(config_dir)
+                    print(f"Luotu kansio: {config_dir}")
+                with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=4)
+                print(f"Luotu oletusasetukset: {CONFIG_PATH}")
+            except Exception as e:
+                print(f"Virhe oletusasetusten luonnissa: {e}")
+        else:
+            try:
+                with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                    data = _validate_settings(json.load(f))
+            except Exception as e:
+                print(f"Virhe asetusten luvussa: {e}")
+                data = copy.deepcopy(DEFAULT_SETTINGS)
+
+        _settings_cache["key"] = _config_key()
+        _settings_cache["data"] = data
+        return data
+
+def load_settings():
+    """Lataa asetukset tai luo oletustiedoston tarvittaessa. Palauttaa muokattavan kopion."""
+    return copy.deepcopy(_cached_settings())
 
 def save_settings(settings):
-    """Tallentaa asetukset config.json tiedostoon."""
+    """Tallentaa asetukset config.json tiedostoon ja päivittää välimuistin."""
     try:
-        # Korjattu: CONFIG_FILE -> CONFIG_PATH
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(settings, f, indent=4)
+        data = _validate_settings(settings)
+        with _settings_lock:
+            # Korjattu: CONFIG_FILE -> CONFIG_PATH
+            with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+            _settings_cache["key"] = _config_key()
+            _settings_cache["data"] = data
     except Exception as e:
         print(f"Virhe asetusten tallennuksessa: {e}")
 
 def get_project_name():
     """Hakee projektin nimen asetuksista, oletuksena bittinikkari."""
+    return _cached_settings().get("project_name") or "bittinikkari"
+
+def _create_executor(settings):
+    """Luo säie- tai prosessipoolin asetusten mukaan. Palauttaa None, jos ajetaan sarjassa."""
     try:
-        if os.path.exists(CONFIG_PATH):
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return data.get("project_name", "bittinikkari")
-    except:
-        pass
-    return "bittinikkari"
+        workers = int(settings.get("max_workers", 1))
+    except (TypeError, ValueError):
+        workers = 1
+    if workers <= 1:
+        return None
+    if settings.get("worker_type", "thread") == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+def _run_pending(pending, settings, project_dir, progress=None, cancel=None, done=0, total=0):
+    """
+    Ajaa käsittelemättömät tiedostot sarjassa tai poolissa ja palauttaa tulokset
+    syötteen järjestyksessä. Peruutetussa ajossa aloittamatta jääneiden tulos on None.
+    Jo alkanut tiedosto viedään loppuun, ja kirjoitus on atomista, joten jokainen
+    tiedosto jää joko kokonaan korjatuksi tai koskemattomaksi.
+    progress saa sanakirjan: done, total, file, bytes, total_bytes.
+    """
+    state = {"done": done, "bytes": 0}
+    total_bytes = sum(item[3] for item in pending)
+    lock = threading.Lock()
+
+    def report(rel_path, size):
+        with lock:
+            state["done"] += 1
+            state["bytes"] += size
+            info = {"done": state["done"], "total": total, "file": rel_path,
+                    "bytes": state["bytes"], "total_bytes": total_bytes}
+        progress(info)
+
+    if progress:
+        progress({"done": done, "total": total, "file": "", "bytes": 0, "total_bytes": total_bytes})
+
+    executor = _create_executor(settings) if pending else None
+    if executor is None:
+        results = []
+        for rel_path, path, entry, size in pending:
+            if cancel is not None and cancel.is_set():
+                results.append(None)
+                continue
+            results.append(_process_unit(path, settings, entry, project_dir))
+            if progress:
+                report(rel_path, size)
+        return results
+
+    with executor:
+        futures = []
+        for rel_path, path, entry, size in pending:
+            future = executor.submit(_process_unit, path, settings, entry, project_dir)
+            if progress:
+                future.add_done_callback(
+                    lambda f, rel_path=rel_path, size=size: f.cancelled() or report(rel_path, size))
+            futures.append(future)
+
+        # Odotetaan lyhyissä jaksoissa, jotta peruutus huomataan nopeasti
+        not_done = set(futures)
+        while not_done:
+            finished, not_done = wait(not_done, timeout=0.1 if cancel is not None else None)
+            if cancel is not None and cancel.is_set():
+                for future in not_done:
+                    future.cancel() # Vain aloittamattomat peruuntuvat
+    # Tulokset luetaan syötteen järjestyksessä, joten raportti on sama kuin sarja-ajossa
+    return [None if future.cancelled() else future.result() for future in futures]
+
+def _process_unit(full_path, settings, entry, project_dir=None):
+    """
+    Työntekijän tehtävä yhdelle tiedostolle. Jos manifestin tiiviste täsmää,
+    tiedostoa ei varmuuskopioida eikä kirjoiteta uudelleen.
+    Palauttaa (muutokset, huomiot, uusi_manifestimerkintä, kirjoitettiinko).
+    Virhe (esim. muu kuin UTF-8-tiedosto) raportoidaan tiedostokohtaisesti: merkintä on
+    silloin None, eikä yksi tiedosto keskeytä muiden käsittelyä tai manifestin tallennusta.
+    """
+    try:
+        clean, digest = content_matches(entry, full_path)
+        if clean:
+            # Vain mtime muuttunut: päivitetään merkintä ja toistetaan aiemmat huomiot
+            return 0, list(entry.get("notes", [])), make_entry(full_path, entry.get("notes", []), digest), False
 
-def process_full_project(project_path, settings):
+        changes, issues, notes, written = _fix_file(full_path, settings, project_dir)
+        return changes, issues, make_entry(full_path, notes), written
+    except Exception as e:
+        return 0, [f"VIRHE: {type(e).__name__}: {e}"], None, False
+
+def _read_units(project_path):
+    """Palauttaa .cbp-tiedoston Unit-tagit listana (suhteellinen_polku, täysi_polku, onko_olemassa)."""
+    project_dir = os.path.dirname(os.path.abspath(project_path))
+    units = []
+    for unit in ET.parse(project_path).getroot().findall(".//Unit"):
+        rel_path = unit.get("filename")
+        if not rel_path:
+            continue
+        # Muodostetaan täysi polku suhteessa .cbp-tiedostoon
+        full_path = os.path.join(project_dir, rel_path)
+        units.append((rel_path, full_path, os.path.exists(full_path)))
+    return units
+
+def process_full_project(project_path, settings, dry_run=False, progress=None, cancel=None):
     """
     Käy läpi kaikki .cbp-tiedostossa määritellyt tiedostot ja ajaa niille fix-logiikan.
+    Tiedostot käsitellään rinnakkain, jos asetuksissa max_workers > 1.
+    Raportti pysyy aina .cbp-tiedoston mukaisessa järjestyksessä.
+    Jos "incremental" on päällä, jo siistit tiedostot ohitetaan manifestin avulla.
     Palauttaa (muutosten_maara, lista_huomioista).
+    dry_run=True ei kirjoita mitään: palauttaa (0, generaattori), joka tuottaa
+    raporttirivit ja unified diffit tiedosto kerrallaan vasta niitä luettaessa.
+    progress(tiedot) kutsutaan jokaisen valmistuneen tiedoston jälkeen (ks. _run_pending),
+    mahdollisesti työntekijäsäikeestä. cancel (threading.Event) keskeyttää ajon
+    tiedostojen välissä.
     """
     if not project_path or not os.path.exists(project_path):
         return 0, ["Projektitiedostoa ei löytynyt."]
+    if dry_run:
+        return 0, _iter_dry_run(project_path, settings)
 
     total_changes = 0
+    skipped = 0
+    failed = 0
     all_issues = []
     project_dir = os.path.dirname(os.path.abspath(project_path))
 
     try:
-        tree = ET.parse(project_path)
-        root = tree.getroot()
-
-        # Etsitään kaikki Unit-tagit, joissa on tiedostonimi
-        for unit in root.findall(".//Unit"):
-            rel_path = unit.get("filename")
-            if not rel_path:
-                continue
-
-            # Muodostetaan täysi polku suhteessa .cbp-tiedostoon
-            full_path = os.path.join(project_dir, rel_path)
-
-            if os.path.exists(full_path):
-                # Ajetaan aiemmin luotu run_fixing_logic jokaiselle tiedostolle
-                changes, issues = run_fixing_logic(full_path, settings)
+        units = _read_units(project_path)
+
+        # Projektin nimi haetaan kerran koko ajolle, ei jokaiselle tiedostolle erikseen
+        settings = dict(settings, project_name=get_project_name())
+        incremental = settings.get("incremental", True)
+        manifest_path = get_manifest_path(project_path)
+        fingerprint = f"{FIX_LOGIC_VERSION}:{settings['project_name']}"
+        old_entries = load_manifest(manifest_path, fingerprint) if incremental else {}
+        new_entries = {}
+
+        # Pelkkä stat riittää ohittamaan muuttumattomat tiedostot ilman työntekijöitä
+        pending = []
+        for rel_path, full_path, exists in units:
+            entry = old_entries.get(rel_path)
+            if exists and not stat_matches(entry, full_path):
+                pending.append((rel_path, full_path, entry, os.path.getsize(full_path)))
+
+        found = sum(1 for unit in units if unit[2])
+        computed = _run_pending(pending, settings, project_dir, progress, cancel,
+                                done=found - len(pending), total=found)
+        results = {item[0]: result for item, result in zip(pending, computed) if result is not None}
+        cancelled = {item[0] for item, result in zip(pending, computed) if result is None}
+
+        for rel_path, full_path, exists in units:
+            if exists:
+                if rel_path in results:
+                    changes, issues, entry, written = results[rel_path]
+                    if entry is None:
+                        # Käsittely epäonnistui: ei merkintää, joten tiedosto yritetään uudelleen ensi kerralla
+                        failed += 1
+                        all_issues.append(f"--- {rel_path} ---")
+                        all_issues.extend(issues)
+                        continue
+                    new_entries[rel_path] = entry
+                elif rel_path in cancelled:
+                    # Peruttu ennen käsittelyä: tiedosto on ennallaan, vanha merkintä säilyy
+                    if rel_path in old_entries:
+                        new_entries[rel_path] = old_entries[rel_path]
+                    continue
+                else:
+                    # Manifestin mukaan siisti: toistetaan vain analyysihuomiot
+                    new_entries[rel_path] = old_entries[rel_path]
+                    changes, issues, written = 0, list(old_entries[rel_path].get("notes", [])), False
+                if not written:
+                    skipped += 1
                 total_changes += changes
                 if issues:
                     all_issues.append(f"--- {rel_path} ---")
@@ -106,72 +324,561 @@ def process_full_project(project_path, settings):
             else:
                 all_issues.append(f"HUOMIO: Tiedostoa {rel_path} ei löydy levyltä.")
 
+        if incremental and new_entries != old_entries:
+            save_manifest(manifest_path, new_entries, fingerprint)
+
+        # Vanhat varmuuskopiosukupolvet karsitaan kerran ajon lopuksi
+        if skipped + len(cancelled) + failed < found:
+            open_store(settings).prune()
+
+        all_issues.insert(0, f"Ohitettu (ei muutoksia): {skipped}/{found} tiedostoa.")
+        if failed:
+            all_issues.insert(0, f"Virheitä: {failed}/{found} tiedostoa jäi käsittelemättä (ks. VIRHE-rivit).")
+        if cancelled:
+            all_issues.insert(0, f"Peruttu: {len(cancelled)}/{found} tiedostoa jäi käsittelemättä (ennallaan).")
         return total_changes, all_issues
 
     except Exception as e:
         return 0, [f"Projektin käsittelyvirhe: {e}"]
 
-def fix_indentation(content):
-    lines = content.split('\n')
-    fixed_lines = []
-    for line in lines:
-        # Muutetaan tabit 4 välilyönniksi ja poistetaan turha tyhjä lopusta
-        line = line.replace('\t', '    ').rstrip()
-        fixed_lines.append(line)
-    return '\n'.join(fixed_lines)
+def _iter_dry_run(project_path, settings):
+    """
+    Kuiva ajo: tuottaa jokaiselle muuttuvalle tiedostolle raportin ja unified diffin.
+    Mitään ei kirjoiteta eikä varmuuskopioida, ja manifestia vain luetaan.
+    Tiedostot käsitellään vasta, kun kutsuja pyytää seuraavia rivejä.
+    """
+    try:
+        units = _read_units(project_path)
+    except Exception as e:
+        yield f"Projektin käsittelyvirhe: {e}"
+        return
+
+    project_dir = os.path.dirname(os.path.abspath(project_path))
+    settings = dict(settings, project_name=get_project_name())
+    old_entries = {}
+    if settings.get("incremental", True):
+        fingerprint = f"{FIX_LOGIC_VERSION}:{settings['project_name']}"
+        old_entries = load_manifest(get_manifest_path(project_path), fingerprint)
+
+    changed = found = 0
+    yield f"--- Kuiva ajo: {os.path.basename(project_path)} (mitään ei kirjoiteta) ---"
+    for rel_path, full_path, exists in units:
+        if not exists:
+            yield f"HUOMIO: Tiedostoa {rel_path} ei löydy levyltä."
+            continue
+        found += 1
+        entry = old_entries.get(rel_path)
+        if stat_matches(entry, full_path) or content_matches(entry, full_path)[0]:
+            # Manifestin mukaan siisti: näytetään vain aiemmat analyysihuomiot
+            if entry.get("notes"):
+                yield f"--- {rel_path} ---"
+                yield from entry["notes"]
+            continue
+        try:
+            would_change, lines = _file_diff(full_path, rel_path, settings, project_dir)
+        except Exception as e:
+            would_change, lines = False, [f"--- {rel_path} ---", f"Virhe: {e}"]
+        changed += would_change
+        yield from lines
+    yield f"Muuttuisi: {changed}/{found} tiedostoa."
 
-def run_fixing_logic(file_path, settings):
+def _file_diff(full_path, rel_path, settings, project_dir=None):
+    """
+    Yhden tiedoston kuivan ajon raportti: huomiot ja unified diff (rivinvaihdot normalisoituna).
+    Palauttaa (muuttuisiko_tiedosto, raporttirivit).
+    """
+    threshold = settings.get("streaming_threshold_mb", 32) * 1024 * 1024
+    size = os.path.getsize(full_path)
+    if size >= threshold:
+        # Suurta tiedostoa ei ladata muistiin diffiä varten
+        return False, [f"--- {rel_path} ---",
+                       f"Tiedosto on liian suuri diffattavaksi ({size // (1024 * 1024)} Mt), ohitetaan."]
+
+    raw_content, content, changes, issues, notes = _compute_fix(full_path, settings, project_dir, dry_run=True)
+    old_content = raw_content.replace("\r\n", "\n").replace("\r", "\n")
+    would_change = content.replace("\n", os.linesep) != raw_content
+    lines = [f"--- {rel_path} ---"] + issues if issues or would_change else []
+    if content != old_content:
+        lines.extend(_aligned_diff(old_content.splitlines(), content.splitlines(), rel_path))
+    elif would_change:
+        lines.append("Vain rivinvaihdot muuttuisivat.")
+    return would_change, lines
+
+def _diff_range(start, stop):
+    """Hunkin rivialue unified-muodossa (kuten difflib)."""
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    return f"{start if not length else start + 1},{length}"
+
+def _aligned_diff(old_lines, new_lines, rel_path):
+    """
+    Unified diff korjaukselle, joka säilyttää rivijaon (ks. analyze_content): uusi teksti on
+    mahdollinen otsikko ja sen perässä alkuperäiset rivit korjattuina, joten rivit verrataan
+    pareittain lineaarisessa ajassa. difflib.SequenceMatcher on suurilla, paljon muuttuvilla
+    tiedostoilla lähes neliöllinen. Tuloste katkaistaan MAX_DIFF_LINES riviin.
+    """
+    inserted = len(new_lines) - len(old_lines)
+    if inserted < 0:
+        # Ei pitäisi tapahtua (korjaus ei poista rivejä); varalla rajattu difflib
+        diff = difflib.unified_diff(old_lines, new_lines, f"a/{rel_path}", f"b/{rel_path}", lineterm="")
+        yield from islice(diff, MAX_DIFF_LINES)
+        return
+
+    # Muuttuneet rivit alkuperäisen tiedoston indekseinä
+    changed = [i for i, (old, new) in enumerate(zip(old_lines, new_lines[inserted:])) if old != new]
+    total = inserted + len(changed)
+    if not total:
+        return
+    yield f"--- a/{rel_path}"
+    yield f"+++ b/{rel_path}"
+    emitted = 2
+
+    # Hunkit: otsikko alussa ja muuttuneet rivit, joiden väliin jää enintään 2 * DIFF_CONTEXT riviä
+    groups = []
+    for i in changed:
+        if groups and i - groups[-1][1] <= 2 * DIFF_CONTEXT + 1:
+            groups[-1][1] = i
+        else:
+            groups.append([i, i])
+    if inserted:
+        if groups and groups[0][0] <= 2 * DIFF_CONTEXT:
+            groups[0][0] = -1
+        else:
+            groups.insert(0, [-1, -1])
+
+    for first, last in groups:
+        start = max(0, first - DIFF_CONTEXT) if first >= 0 else 0
+        stop = min(len(old_lines), last + DIFF_CONTEXT + 1) if last >= 0 else min(len(old_lines), DIFF_CONTEXT)
+        hunk = []
+        if first < 0:
+            hunk.extend("+" + line for line in new_lines[:inserted])
+        removed, added = [], []
+        for i in range(start, stop):
+            old, new = old_lines[i], new_lines[i + inserted]
+            if old != new:
+                removed.append("-" + old)
+                added.append("+" + new)
+                continue
+            hunk.extend(removed)
+            hunk.extend(added)
+            removed, added = [], []
+            hunk.append(" " + old)
+        hunk.extend(removed)
+        hunk.extend(added)
+        new_start = start + inserted if first >= 0 else 0
+        new_stop = stop + inserted
+        yield f"@@ -{_diff_range(start, stop)} +{_diff_range(new_start, new_stop)} @@"
+        emitted += 1
+        for line in hunk:
+            if emitted >= MAX_DIFF_LINES:
+                yield f"... diff katkaistu: {total} riviä muuttuisi, loput jätetty pois."
+                return
+            yield line
+            emitted += 1
+
+def compile_pattern(pattern, use_regex=False, nocase=True):
+    """
+    Käännetty haku; tavallinen haku on regex, jonka erikoismerkit on suojattu. Regex-tilassa
+    ^ ja $ täsmäävät jokaisella rivillä kuten Tk:n text.search(regexp=True). re.error nousee kutsujalle.
+    """
+    flags = re.IGNORECASE if nocase else 0
+    if use_regex:
+        flags |= re.MULTILINE
+    return re.compile(pattern if use_regex else re.escape(pattern), flags)
+
+def _search_unit(full_path, pattern, use_regex, nocase):
+    """
+    Työntekijän tehtävä projektihaussa. Palauttaa (osumat, katkaistu), missä osuma on
+    (rivi, sarake, pituus, rivin_teksti); pituus rajataan osuman ensimmäiselle riville.
+    """
+    regex = compile_pattern(pattern, use_regex, nocase)
+    with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+    hits = []
+    line = 1
+    counted_to = 0
+    for m in regex.finditer(content):
+        start = m.start()
+        if m.end() == start:
+            continue
+        if len(hits) >= MAX_FILE_HITS:
+            return hits, True
+        # Rivinumero lasketaan vain edellisen osuman jälkeisistä rivinvaihdoista
+        line += content.count("\n", counted_to, start)
+        counted_to = start
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", start)
+        if line_end < 0:
+            line_end = len(content)
+        text = content[line_start:line_end].rstrip("\r")
+        hits.append((line, start - line_start, min(m.end(), line_end) - start, text[:MAX_HIT_TEXT]))
+    return hits, False
+
+def search_project(project_path, settings, pattern, use_regex=False, nocase=True,
+                   emit=None, progress=None, cancel=None):
+    """
+    Etsii kaikista .cbp-tiedoston Unit-tiedostoista rinnakkain (max_workers, worker_type).
+    Jokaisen valmistuneen tiedoston tulos annetaan heti emit-kutsulle valmistumisjärjestyksessä:
+    sanakirja file, path, hits, truncated ja error. Palauttaa (osumia, tiedostoja_joissa_osumia).
+    Trigrammi-indeksi (search_index) rajaa luettavat tiedostot niihin, joissa osuma on mahdollinen.
+    """
+    compile_pattern(pattern, use_regex, nocase) # virheellinen regex ennen työntekijöiden käynnistystä
+    units = [(rel_path, full_path) for rel_path, full_path, exists in _read_units(project_path) if exists]
+    if settings.get("search_index", True) and units:
+        index = open_index(project_path)
+        index.refresh(units) # vain muuttuneet tiedostot luetaan
+        candidates = index.candidates(pattern, use_regex)
+        index.save()
+        if candidates is not None:
+            units = [unit for unit in units if unit[0] in candidates]
+    state = {"done": 0, "hits": 0, "files": 0}
+
+    def finish(rel_path, full_path, future=None):
+        result = {"file": rel_path, "path": full_path, "hits": [], "truncated": False, "error": None}
+        try:
+            if future is None:
+                result["hits"], result["truncated"] = _search_unit(full_path, pattern, use_regex, nocase)
+            else:
+                result["hits"], result["truncated"] = future.result()
+        except OSError as e:
+            result["error"] = str(e)
+        state["done"] += 1
+        if result["hits"]:
+            state["hits"] += len(result["hits"])
+            state["files"] += 1
+        if emit and (result["hits"] or result["error"]):
+            emit(result)
+        if progress:
+            progress({"done": state["done"], "total": len(units), "file": rel_path})
+
+    executor = _create_executor(settings) if units else None
+    if executor is None:
+        for rel_path, full_path in units:
+            if cancel is not None and cancel.is_set():
+                break
+            finish(rel_path, full_path)
+        return state["hits"], state["files"]
+
+    with executor:
+        futures = {executor.submit(_search_unit, full_path, pattern, use_regex, nocase): (rel_path, full_path)
+                   for rel_path, full_path in units}
+        not_done = set(futures)
+        while not_done:
+            finished, not_done = wait(not_done, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if not future.cancelled():
+                    finish(*futures[future], future=future)
+            if cancel is not None and cancel.is_set():
+                for future in not_done:
+                    future.cancel() # Vain aloittamattomat peruuntuvat
+    return state["hits"], state["files"]
+
+def _replace_unit(full_path, pattern, replacement, use_regex, nocase, settings, project_dir):
+    """
+    Työntekijän tehtävä projektin korvauksessa. Muuttuva tiedosto varmuuskopioidaan ja
+    kirjoitetaan atomisesti; rivinvaihdot säilyvät ennallaan. Palauttaa korvausten määrän.
+    """
+    regex = compile_pattern(pattern, use_regex, nocase)
+    with open(full_path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+    count = 0
+
+    def substitute(m):
+        nonlocal count
+        if m.end() == m.start():
+            return "" # tyhjää osumaa ei korvata (sama sääntö kuin haussa)
+        count += 1
+        return m.expand(replacement) if use_regex else replacement
+
+    new_content = regex.sub(substitute, content)
+    if new_content == content:
+        return 0
+    backup_file(full_path, settings, project_dir)
+    write_file_atomic(full_path, new_content, newline="")
+    return count
+
+def replace_in_project(project_path, settings, pattern, replacement, use_regex=False, nocase=True,
+                       skip=(), progress=None, cancel=None):
+    """
+    Korvaa osumat kaikissa Unit-tiedostoissa paitsi skip-joukon täysissä poluissa
+    (esim. editorissa auki olevat). Palauttaa (korvauksia, muuttuneita_tiedostoja, virheet).
+    """
+    compile_pattern(pattern, use_regex, nocase)
+    project_dir = os.path.dirname(os.path.abspath(project_path))
+    skip = {os.path.abspath(path) for path in skip}
+    units = [(rel_path, full_path) for rel_path, full_path, exists in _read_units(project_path)
+             if exists and os.path.abspath(full_path) not in skip]
+    total_bytes = sum(os.path.getsize(full_path) for _, full_path in units)
+    state = {"done": 0, "bytes": 0, "count": 0, "files": 0}
+    errors = []
+
+    def finish(rel_path, full_path, run):
+        try:
+            count = run()
+        except (OSError, UnicodeDecodeError) as e:
+            errors.append(f"{rel_path}: {e}")
+            count = 0
+        state["done"] += 1
+        state["bytes"] += os.path.getsize(full_path)
+        state["count"] += count
+        state["files"] += 1 if count else 0
+        if progress:
+            progress({"done": state["done"], "total": len(units), "file": rel_path,
+                      "bytes": state["bytes"], "total_bytes": total_bytes})
+
+    args = (pattern, replacement, use_regex, nocase, settings, project_dir)
+    executor = _create_executor(settings) if units else None
+    if executor is None:
+        for rel_path, full_path in units:
+            if cancel is not None and cancel.is_set():
+                break
+            finish(rel_path, full_path, lambda: _replace_unit(full_path, *args))
+        return state["count"], state["files"], errors
+
+    with executor:
+        futures = {executor.submit(_replace_unit, full_path, *args): (rel_path, full_path)
+                   for rel_path, full_path in units}
+        not_done = set(futures)
+        while not_done:
+            finished, not_done = wait(not_done, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if not future.cancelled():
+                    finish(*futures[future], future.result)
+            if cancel is not None and cancel.is_set():
+                for future in not_done:
+                    future.cancel()
+    return state["count"], state["files"], errors
+
+def gpl_header(project_name):
+    """GPL-lisenssiotsikko, joka lisätään tiedoston alkuun (dynaaminen projektin nimi)."""
+    return f"/*\n * Lisenssi: GNU GPLv3\n * Projekti: {project_name}\n */\n"
+
+def analyze_content(content, project_name=None, add_header=True):
+    """
+    Yhdistetty analyysi: yksi läpikäynti ANALYSIS_RE-lausekkeella kerää kaikki havainnot
+    ja tuottaa samalla korjatun tekstin (tabit -> 4 välilyöntiä, rivien lopun tyhjät pois).
+    Palauttaa sanakirjan:
+      content       - korjattu teksti (GPL-otsikko edessä, jos add_header ja otsikko puuttui)
+      has_header    - löytyikö tekstistä valmiiksi GPLv3
+      header_added  - lisättiinkö otsikko
+      indent_fixed  - muuttuiko sisennys tai rivien loput
+      malloc_lines  - malloc-kutsujen rivinumerot (1-alkuiset, alkuperäisessä tekstissä)
+      free_lines    - free-kutsujen rivinumerot
+    """
+    found = {"gpl": False, "ws": False}
+    positions = {"malloc": [], "free": []}
+
+    def replace(m):
+        kind = m.lastgroup
+        if kind == "tab":
+            found["ws"] = True
+            return "    " * len(m.group())
+        if kind == "trail":
+            found["ws"] = True
+            return ""
+        if kind == "gpl":
+            found["gpl"] = True
+        else:
+            positions[kind].append(m.start())
+        return m.group()
+
+    fixed = ANALYSIS_RE.sub(replace, content)
+
+    # Rivinumerot lasketaan vain osumille, ei koko tekstille
+    lines = {}
+    for kind in ("malloc", "free"):
+        lines[kind] = []
+        line, last = 1, 0
+        for pos in positions[kind]:
+            line += content.count("\n", last, pos)
+            last = pos
+            lines[kind].append(line)
+
+    header_added = add_header and not found["gpl"]
+    if header_added:
+        fixed = gpl_header(project_name or get_project_name()) + fixed
+
+    return {
+        "content": fixed,
+        "has_header": found["gpl"],
+        "header_added": header_added,
+        "indent_fixed": found["ws"],
+        "malloc_lines": lines["malloc"],
+        "free_lines": lines["free"],
+    }
+
+def write_file_atomic(file_path, content, newline=None, durable=False):
+    """
+    Kirjoittaa lähdetiedoston atomisesti (ks. atomic_file.write_atomic; sisältö str tai bytes)
+    ja kertoo muutoksesta hakuindeksille. Kaatuminen kesken kirjoituksen ei riko tiedostoa.
+    """
+    write_atomic(file_path, content, newline=newline, durable=durable)
+    notify_written(file_path)
+
+def backup_file(file_path, settings, project_dir=None):
+    """
+    Tallentaa tiedoston sisältöosoitteiseen varmuuskopiovarastoon.
+    Polku tallennetaan suhteessa projektikansioon (oletuksena nykyinen kansio).
+    Palauttaa indeksimerkinnän.
+    """
+    rel_path = os.path.relpath(os.path.abspath(file_path), project_dir or os.getcwd())
+    return open_store(settings).backup(file_path, rel_path)
+
+def _memory_notes(malloc_count, free_count):
+    if malloc_count > free_count:
+        return [f"HUOM: {malloc_count} malloc vs {free_count} free. Muista vapauttaa muisti!"]
+    if malloc_count < free_count:
+        return [f"HUOM: free-kutsuja ({free_count}) on enemmän kuin varauksia."]
+    return []
+
+def _file_contains(file_path, needle, chunk_size=1024 * 1024):
+    """Etsii tavujonoa tiedostosta paloittain. Lopettaa heti löydettyään (otsikko on yleensä alussa)."""
+    tail = b""
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            data = tail + chunk
+            if needle in data:
+                return True
+            tail = data[-(len(needle) - 1):]
+    return False
+
+def run_fixing_logic(file_path, settings, project_dir=None):
     """Bittinikkarin ydintoiminto: Varmuuskopiot, Lisenssi ja C-muistinhallinta."""
-    issues = []
-    changes = 0
-    project_name = get_project_name()
+    changes, issues, notes, written = _fix_file(file_path, settings, project_dir)
+    return changes, issues
 
+def _fix_file(file_path, settings, project_dir=None):
+    """
+    Varsinainen korjauslogiikka. Palauttaa (muutokset, huomiot, analyysihuomiot, kirjoitettiinko).
+    Analyysihuomiot (esim. muistivaroitukset) tallennetaan manifestiin,
+    jotta ne voidaan näyttää myös ohitetuille tiedostoille.
+    Korjattu sisältö lasketaan ensin; varmuuskopio ja kirjoitus tehdään vain,
+    jos tavut oikeasti muuttuvat (asetus skip_unchanged_writes).
+    """
     if not file_path or not os.path.exists(file_path):
-        return 0, ["Tiedostoa ei löytynyt."]
+        return 0, ["Tiedostoa ei löytynyt."], [], False
 
-    # 1. VARMUUSKOPIO (Backup) - Tallennetaan configissa määriteltyyn paikkaan
-    backup_dir = settings.get("backup_dir", "backups")
-    if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
+    # Suuret tiedostot käsitellään rivi kerrallaan, jotta muistinkulutus pysyy rajattuna
+    threshold = settings.get("streaming_threshold_mb", 32) * 1024 * 1024
+    if os.path.getsize(file_path) >= threshold:
+        return _fix_file_streaming(file_path, settings, project_dir)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = os.path.join(backup_dir, f"{os.path.basename(file_path)}.{timestamp}.bak")
-    shutil.copy2(file_path, backup_path)
-    issues.append(f"Varmuuskopio luotu: {backup_path}")
+    raw_content, content, changes, issues, notes = _compute_fix(file_path, settings, project_dir)
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    # Tekstitila kirjoittaa rivinvaihdot os.linesep-muodossa
+    if settings.get("skip_unchanged_writes", True) and content.replace("\n", os.linesep) == raw_content:
+        return changes, issues, notes, False
 
-    # 2. GPL-LISENSSIN LISÄYS (Dynaaminen projektin nimi)
-    gpl_header = f"/*\n * Lisenssi: GNU GPLv3\n * Projekti: {project_name}\n */\n"
-    if "GPLv3" not in content:
-        content = gpl_header + content
-        changes += 1
-        issues.append(f"GPLv3-lisenssi lisätty ({project_name}).")
+    # 4. VARMUUSKOPIO (Backup) - Sisältöosoitteinen varasto configin backup_dir-kansiossa
+    backup = backup_file(file_path, settings, project_dir)
+    issues.insert(0, f"Varmuuskopio luotu: {backup['path']} ({backup['stamp']}, {backup['hash'][:12]})")
 
-    # 3. KEVYT MUISTINHALLINTA (C-kieli)
-    if file_path.endswith((".c", ".h")):
-        malloc_count = len(re.findall(r'\bmalloc\(', content))
-        free_count = len(re.findall(r'\bfree\(', content))
-
-        if malloc_count > free_count:
-            issues.append(f"HUOM: {malloc_count} malloc vs {free_count} free. Muista vapauttaa muisti!")
-        elif malloc_count < free_count:
-            issues.append(f"HUOM: free-kutsuja ({free_count}) on enemmän kuin varauksia.")
-
-    # 4. AUTOMAATTINEN SISENNYS
-    old_content = content
-    content = fix_indentation(content)
-    if old_content != content:
-        changes += 1
-        issues.append("Sisennykset ja tyhjät välit siivottu.")
-
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    write_file_atomic(file_path, content)
 
-    return changes, issues
+    return changes, issues, notes, True
 
+def _compute_fix(file_path, settings, project_dir=None, dry_run=False):
+    """
+    Laskee korjatun sisällön koskematta levyyn.
+    Palauttaa (alkuperäinen_teksti, korjattu_teksti, muutokset, huomiot, analyysihuomiot).
+    dry_run=True: analyysihuomioiden rivinumerot viittaavat alkuperäiseen tiedostoon,
+    koska korjattua ei kirjoiteta levylle.
+    """
+    issues = []
+    notes = []
+    changes = 0
+    project_name = settings.get("project_name") or get_project_name()
 
+    # Luetaan rivinvaihdot sellaisinaan, jotta voidaan verrata levyllä olevia tavuja
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        raw_content = f.read()
+    content = original = raw_content.replace("\r\n", "\n").replace("\r", "\n")
 
+    # 1.-3. GPL-otsikko, muistianalyysi ja sisennykset yhdellä läpikäynnillä
+    analysis = analyze_content(content, project_name)
+    content = analysis["content"]
+    if analysis["header_added"]:
+        changes += 1
+        issues.append(f"GPLv3-lisenssi lisätty ({project_name}).")
+    if file_path.endswith((".c", ".h")):
+        # Funktiokohtainen varausanalyysi siitä sisällöstä, joka on levyllä käsittelyn jälkeen,
+        # jotta rivinumerot vastaavat tiedostoa (GPL-otsikko siirtää rivejä alaspäin)
+        rel_path = os.path.relpath(os.path.abspath(file_path), project_dir or os.getcwd())
+        notes = [format_finding(f) for f in analyze_c_source(original if dry_run else content, rel_path)]
+        # Funktiokohtainen analyysi ei huomaa ylimääräisiä free-kutsuja: tiedostotason vertailu säilyy
+        malloc_count, free_count = len(analysis["malloc_lines"]), len(analysis["free_lines"])
+        if free_count > malloc_count:
+            notes += _memory_notes(malloc_count, free_count)
+        issues.extend(notes)
+    if analysis["indent_fixed"]:
+        changes += 1
+        issues.append("Sisennykset ja tyhjät välit siivottu.")
 
+    return raw_content, content, changes, issues, notes
 
+def _fix_file_streaming(file_path, settings, project_dir=None):
+    """
+    Rivi kerrallaan etenevä _fix_file suurille tiedostoille (esim. generoidut C-lähteet).
+    Tabit, rivien loppujen siivous, GPL-otsikko ja malloc/free-laskenta tehdään yhdellä
+    läpikäynnillä suoraan väliaikaistiedostoon. Tulos on tavulleen sama kuin muistissa tehtynä.
+    """
+    issues = []
+    notes = []
+    changes = 0
+    project_name = settings.get("project_name") or get_project_name()
+    is_c_file = file_path.endswith((".c", ".h"))
+
+    # GPLv3 voi olla missä tahansa, joten se tarkistetaan ennen kirjoitusta (yleensä heti alusta)
+    has_header = _file_contains(file_path, b"GPLv3")
+    malloc_count = free_count = 0
+    indent_fixed = False
+    same_bytes = has_header
+
+    target = AtomicFile(file_path)
+    with target as out:
+        # newline="" säilyttää alkuperäiset rivinvaihdot, jotta tavuvertailu onnistuu
+        with open(file_path, "r", encoding="utf-8", newline="") as src:
+            if not has_header:
+                out.write(gpl_header(project_name))
+            for line in src:
+                if line.endswith("\r\n"):
+                    body, ending = line[:-2], "\r\n"
+                elif line.endswith(("\n", "\r")):
+                    body, ending = line[:-1], line[-1]
+                else:
+                    body, ending = line, ""
+                line_analysis = analyze_content(body, add_header=False)
+                malloc_count += len(line_analysis["malloc_lines"])
+                free_count += len(line_analysis["free_lines"])
+                fixed = line_analysis["content"]
+                if line_analysis["indent_fixed"]:
+                    indent_fixed = True
+                    same_bytes = False
+                if ending and ending != os.linesep:
+                    same_bytes = False
+                # Tekstitila muuntaa \n -> os.linesep kuten muistissa tehtävä polku
+                out.write(fixed + "\n" if ending else fixed)
+
+        if not has_header:
+            changes += 1
+            issues.append(f"GPLv3-lisenssi lisätty ({project_name}).")
+        if is_c_file:
+            # Funktiokohtainen analyysi vaatisi koko tiedoston muistiin, joten
+            # suurille tiedostoille käytetään kevyttä malloc/free-laskentaa
+            notes = _memory_notes(malloc_count, free_count)
+            issues.extend(notes)
+        if indent_fixed:
+            changes += 1
+            issues.append("Sisennykset ja tyhjät välit siivottu.")
+
+        if settings.get("skip_unchanged_writes", True) and same_bytes:
+            target.discard()
+            return changes, issues, notes, False
+
+        # Varmuuskopio ennen kuin väliaikaistiedosto vaihdetaan paikalleen lohkon lopussa
+        backup = backup_file(file_path, settings, project_dir)
+        issues.insert(0, f"Varmuuskopio luotu: {backup['path']} ({backup['stamp']}, {backup['hash'][:12]})")
+    notify_written(file_path)
+
+    return changes, issues, notes, True
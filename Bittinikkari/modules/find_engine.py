@@ -0,0 +1,343 @@
+# Bittinikkari - find_engine.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import time
+import tkinter as tk
+from bisect import bisect_left, bisect_right
+from edit_hook import install_edit_hook
+from engine import compile_pattern
+from document import Document, text_of
+
+MAX_MATCHES = 100000  # tätä useampia osumia ei kerätä (tulos merkitään katkaistuksi)
+TAG_BATCH = 2000      # kuinka monta osuma-aluetta lisätään yhdellä tag_add-kutsulla
+_TAG_SLICE_MS = 8     # korostuserän kesto; erien välissä käyttöliittymä käsittelee tapahtumat
+TYPE_DEBOUNCE_MS = 150  # kirjoitettaessa haku tehdään vasta tauon jälkeen
+REFRESH_DELAY_MS = 150  # muokkauksen jälkeen likaiset rivit haetaan uudelleen tauon jälkeen
+
+
+class FindEngine:
+    """
+    Tekstin haku Text-widgetistä yhdellä get-kutsulla ja käännetyllä Pythonin re-lausekkeella.
+    Osumat säilytetään merkkisiirtyminä; ne muunnetaan Tk-indekseiksi (rivi.sarake)
+    välilehden Document-mallin lohkoindeksillä. Korostukset lisätään erissä, ja
+    seuraava/edellinen osuma haetaan välimuistissa olevasta listasta.
+    Muokkaus merkitsee vain muuttuneet rivit likaisiksi: niiden ulkopuoliset osumat
+    säilyvät (siirtyminä siirrettyinä), ja uudelleen haetaan vain likainen alue,
+    jonka rivit haetaan mallista ja vaihdetaan tallessa olevaan tekstiin.
+    Kun tavallinen hakusana jatkuu edellisestä, uudet osumat etsitään vanhojen joukosta.
+    """
+
+    def __init__(self, text_widget):
+        self.text = text_widget
+        self.document = getattr(text_widget, "document", None)
+        if self.document is None:
+            self.document = text_widget.document = Document(text_widget)
+        self.pattern = None
+        self.query = None      # (hakusana, regex, nocase) edelliselle haulle
+        self.content = ""
+        self.starts = []       # osumien alut merkkisiirtyminä
+        self.ends = []
+        self.truncated = False
+        self.current = -1      # valitun osuman indeksi
+        self.dirty = None      # (ensimmäinen, viimeinen) muokattu rivi nykyisessä numeroinnissa
+        self.on_change = None  # kutsutaan, kun muokkaus on päivittänyt osumat (esim. laskurille)
+        self._job = None
+        self._refresh_job = None
+        self._full_highlight = False
+        text_widget.tag_configure("match", background="yellow", foreground="black")
+        text_widget.tag_configure("current_match", background="orange", foreground="black")
+        text_widget.tag_raise("match")
+        text_widget.tag_raise("current_match")
+        install_edit_hook(text_widget).add_listener(self.on_edit)
+
+    @property
+    def stale(self):
+        return self.dirty is not None
+
+    def on_edit(self, op, start, old_end, new_end):
+        """EditHookin kuuntelija: yhdistää muokatun rivialueen likaiseen alueeseen."""
+        if self.pattern is None:
+            return
+        if self.dirty is None:
+            self.dirty = (start, new_end)
+        else:
+            first, last = self.dirty
+            last = last + new_end - old_end if last > old_end else max(last, new_end)
+            self.dirty = (min(first, start), last)
+        if self._job is not None:
+            # Keskeneräiset korostuserät käyttäisivät vanhentuneita siirtymiä
+            self.text.after_cancel(self._job)
+            self._job = None
+            self._full_highlight = True
+        if self._refresh_job is not None:
+            self.text.after_cancel(self._refresh_job)
+        self._refresh_job = self.text.after(REFRESH_DELAY_MS, self._refresh_and_notify)
+
+    def search(self, pattern, use_regex=False, nocase=True):
+        """
+        Etsii kaikki osumat ja korostaa ne. Palauttaa osumien määrän.
+        Sama haku uudelleen käyttää välimuistia, ja tavallisen hakusanan jatke rajataan
+        edellisen haun osumista koko tekstin läpikäynnin sijaan.
+        """
+        query = (pattern, use_regex, nocase)
+        previous = self.query
+        if self.pattern is not None:
+            self.refresh()
+        if query == previous:
+            return len(self.starts)
+        self.pattern = compile_pattern(pattern, use_regex, nocase)
+        self.query = query
+        self.current = -1
+        if (previous and not use_regex and not previous[1] and previous[2] == nocase
+                and not self.truncated and pattern.startswith(previous[0])):
+            self._narrow(len(previous[0]))
+        else:
+            self.content = text_of(self.text)
+            self.starts, self.ends, self.truncated = self._scan(0, len(self.content))
+        self.highlight()
+        return len(self.starts)
+
+    def replace_all(self, pattern, replacement, use_regex=False, nocase=True):
+        """
+        Korvaa kaikki osumat yhtenä kumoamisaskeleena. Widgetiin tehdään yksi replace-kutsu
+        muuttuvaa osumaa kohden lopusta alkuun, joten muu teksti, tagit ja vierityskohta säilyvät.
+        Regex-tilassa korvaava teksti voi viitata ryhmiin (\\1, \\g<nimi>). Palauttaa korvausten määrän.
+        """
+        self.search(pattern, use_regex, nocase)
+        content = self.content
+        edits = []
+        if use_regex:
+            # Sama käännetty lauseke täsmää samaan kohtaan kuin haussa, joten ryhmät saadaan ilman uutta hakua
+            match = self.pattern.match
+            for start, end in zip(self.starts, self.ends):
+                m = match(content, start)
+                if m is None or m.end() != end:
+                    continue # ei täsmää samoin kuin haussa (esim. tyhjä vaihtoehto ensin): ohitetaan
+                new = m.expand(replacement)
+                if new != m.group():
+                    edits.append((start, m.end(), new))
+        else:
+            edits = [(start, end, replacement) for start, end in zip(self.starts, self.ends)
+                     if content[start:end] != replacement]
+        if not edits:
+            return 0
+
+        # Indeksit lasketaan ennen muutoksia; lopusta alkuun edettäessä aiemmat indeksit pysyvät oikeina
+        edits = [(self.index(start), self.index(end), new) for start, end, new in edits]
+        self.clear()
+        self.current = -1
+        autoseparators = self.text.cget("autoseparators")
+        self.text.config(autoseparators=False)
+        try:
+            self.text.edit_separator()
+            for start, end, new in reversed(edits):
+                self.text.replace(start, end, new)
+            self.text.edit_separator()
+        finally:
+            self.text.config(autoseparators=autoseparators)
+        return len(edits)
+
+    def _scan(self, first, last):
+        """Osumat, jotka alkavat väliltä first..last (merkkisiirtymiä). Palauttaa (alut, loput, katkaistu)."""
+        starts, ends = [], []
+        for m in self.pattern.finditer(self.content, first):
+            if m.start() > last:
+                break
+            if m.end() == m.start():
+                continue # tyhjää osumaa ei voi korostaa eikä valita
+            starts.append(m.start())
+            ends.append(m.end())
+            if len(starts) >= MAX_MATCHES:
+                return starts, ends, True
+        return starts, ends, False
+
+    def _narrow(self, old_length):
+        """
+        Hakusana jatkuu edellisestä: uusi osuma voi alkaa vain kohdasta, jossa myös vanha
+        hakusana esiintyy, eli vanhan osuman alusta tai sen sisältä (päällekkäiset esiintymät).
+        """
+        match = self.pattern.match
+        content = self.content
+        starts, ends = [], []
+        end = 0
+        for start in self.starts:
+            for position in range(max(start, end), start + old_length):
+                m = match(content, position)
+                if m:
+                    end = m.end()
+                    starts.append(position)
+                    ends.append(end)
+                    break
+        self.starts, self.ends = starts, ends
+
+    def refresh(self):
+        """Hakee likaiset rivit uudelleen; muut osumat siirretään muokkauksen pituuserolla."""
+        if self._refresh_job is not None:
+            self.text.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        if self.dirty is None:
+            return False
+        document = self.document
+        count = document.line_count()
+        first, last = self.dirty
+        first, last = min(first, count), min(last, count)
+        self.dirty = None
+        # Likaisen alueen edellä ja jälkeen teksti on ennallaan: vain alueen rivit luetaan mallista
+        delta = document.char_count() - len(self.content)
+        region_start = document.offset(first)
+        region_end = document.offset(last) + len(document.line(last))
+        self.content = self.content[:region_start] + document.get(first, last) + self.content[region_end - delta:]
+
+        # Likaisen alueen edellä päättyvät osumat ovat ennallaan, sen jälkeen alkavat siirtyvät
+        keep_before = bisect_left(self.ends, region_start)
+        if self.query[1] and keep_before:
+            # Regex-osuma voi kasvaa, kun sen perässä oleva teksti muuttuu (esim. x[^y]*x
+            # usean rivin yli), joten alueen edellä viimeinen osuma haetaan uudelleen alusta
+            keep_before -= 1
+        keep_after = bisect_right(self.starts, region_end - delta)
+        current = self.starts[self.current] if self.current >= 0 else None
+        after_starts = [s + delta for s in self.starts[keep_after:]]
+        after_ends = [e + delta for e in self.ends[keep_after:]]
+
+        # Haku jatkuu edellisen säilyvän osuman lopusta (regex voi ulottua usealle riville);
+        # tavallinen hakusana ei sisällä rivinvaihtoa, joten se voi alkaa likaiselta riviltä.
+        window_start = self.ends[keep_before - 1] if keep_before else 0
+        if not self.query[1]:
+            window_start = max(window_start, region_start)
+        # Likaisen alueen jälkeen haku päättyy, kun osuma osuu vanhan osuman kohdalle:
+        # siitä eteenpäin teksti on sama, joten loputkin osumat ovat samat.
+        starts, ends = [], []
+        resync = len(after_starts)
+        for m in self.pattern.finditer(self.content, window_start):
+            if m.start() > region_end:
+                number = bisect_left(after_starts, m.start())
+                if number < len(after_starts) and after_starts[number] == m.start():
+                    resync = number
+                    break
+            if m.end() == m.start():
+                continue
+            starts.append(m.start())
+            ends.append(m.end())
+            if keep_before + len(starts) >= MAX_MATCHES:
+                resync = len(after_starts)
+                break
+        window_end = max(region_end, ends[-1] if ends else 0, after_ends[resync - 1] if resync else 0)
+        self.starts = self.starts[:keep_before] + starts + after_starts[resync:]
+        self.ends = self.ends[:keep_before] + ends + after_ends[resync:]
+        self.truncated = len(self.starts) >= MAX_MATCHES
+        del self.starts[MAX_MATCHES:], self.ends[MAX_MATCHES:]
+
+        if current is not None:
+            current = current if current < region_start else current + delta
+            number = bisect_left(self.starts, current)
+            self.current = number if number < len(self.starts) and self.starts[number] == current else -1
+
+        if self._full_highlight:
+            self.highlight()
+        else:
+            # Muualla Tk on siirtänyt korostukset tekstin mukana; korjataan vain muuttunut väli
+            self.text.tag_remove("match", self.index(min(window_start, region_start)), self.index(window_end))
+            ranges = []
+            for start, end in zip(starts, ends):
+                ranges.append(self.index(start))
+                ranges.append(self.index(end))
+            for batch in range(0, len(ranges), 2 * TAG_BATCH):
+                self.text.tag_add("match", *ranges[batch:batch + 2 * TAG_BATCH])
+        return True
+
+    def _refresh_and_notify(self):
+        self._refresh_job = None
+        try:
+            changed = self.refresh()
+        except tk.TclError:
+            return # Widget on jo tuhottu
+        if changed and self.on_change:
+            self.on_change()
+
+    def index(self, offset):
+        """Merkkisiirtymä -> Tk-indeksi 'rivi.sarake'."""
+        line, column = self.document.position(offset)
+        return f"{line}.{column}"
+
+    def offset(self, index):
+        """Tk-indeksi -> merkkisiirtymä (vain tuoreelle tulokselle)."""
+        line, column = map(int, self.text.index(index).split("."))
+        return self.document.offset(line, column)
+
+    def clear(self):
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        self.text.tag_remove("match", "1.0", tk.END)
+        self.text.tag_remove("current_match", "1.0", tk.END)
+
+    def reset(self):
+        """Unohtaa haun ja poistaa korostukset (esim. tyhjä hakukenttä)."""
+        self.clear()
+        if self._refresh_job is not None:
+            self.text.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self.pattern = self.query = None
+        self.content = ""
+        self.starts, self.ends = [], []
+        self.truncated = False
+        self.current = -1
+        self.dirty = None
+
+    def highlight(self):
+        """Poistaa vanhat korostukset ja lisää uudet erissä (TAG_BATCH aluetta kutsua kohden)."""
+        self.clear()
+        self._full_highlight = False
+        self._highlight_from(0)
+
+    def _highlight_from(self, first):
+        self._job = None
+        deadline = time.monotonic() + _TAG_SLICE_MS / 1000
+        try:
+            while first < len(self.starts) and time.monotonic() < deadline:
+                last = min(len(self.starts), first + TAG_BATCH)
+                ranges = []
+                for start, end in zip(self.starts[first:last], self.ends[first:last]):
+                    ranges.append(self.index(start))
+                    ranges.append(self.index(end))
+                self.text.tag_add("match", *ranges)
+                first = last
+        except tk.TclError:
+            return # Widget on jo tuhottu
+        if first < len(self.starts):
+            self._job = self.text.after(1, self._highlight_from, first)
+
+    def select(self, number):
+        """Valitsee osuman numero number, vierittää sen näkyviin ja siirtää kursorin sen loppuun."""
+        self.current = number
+        start, end = self.index(self.starts[number]), self.index(self.ends[number])
+        self.text.tag_remove("current_match", "1.0", tk.END)
+        self.text.tag_add("current_match", start, end)
+        self.text.mark_set(tk.INSERT, end)
+        self.text.see(start)
+
+    def next(self, backwards=False):
+        """
+        Siirtyy kursorista seuraavaan (tai edelliseen) osumaan, listan lopusta alkuun kiertäen.
+        Palauttaa valitun osuman numeron (0-alkuinen) tai None, jos osumia ei ole.
+        """
+        self.refresh()
+        if not self.starts:
+            return None
+        if self.current >= 0 and self.text.compare(tk.INSERT, "==", self.index(self.ends[self.current])):
+            # Kursori on yhä valitun osuman lopussa: jatketaan listasta
+            number = self.current + (-1 if backwards else 1)
+        else:
+            cursor = self.offset(tk.INSERT)
+            number = bisect_left(self.starts, cursor) - 1 if backwards else bisect_left(self.starts, cursor)
+        self.select(number % len(self.starts))
+        return self.current
+
+
+def find_engine_for(text_widget):
+    """Palauttaa widgetin FindEnginen; luodaan ensimmäisellä kutsulla."""
+    engine = getattr(text_widget, "find_engine", None)
+    if engine is None:
+        engine = text_widget.find_engine = FindEngine(text_widget)
+    return engine
@@ -0,0 +1,102 @@
+# Bittinikkari - gutter.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import tkinter as tk
+from edit_hook import install_edit_hook
+from line_state import CLEAN, MODIFIED, ADDED, SAVED
+
+# Näkyvien rivien asettelu yhdellä Tcl-kutsulla: palauttaa litteän listan
+# "rivi y korkeus rivi y korkeus ...". Muuten jokainen rivi vaatisi useita
+# edestakaisia kutsuja Pythonin ja Tcl:n välillä (dlineinfo, index).
+_LAYOUT_PROC = "bittinikkari_visible_lines"
+_LAYOUT_TCL = r'''
+proc %s {w} {
+    set result {}
+    set last [lindex [split [$w index end-1c] .] 0]
+    set i [$w index @0,0]
+    while {[lindex [split $i .] 0] <= $last} {
+        set d [$w dlineinfo $i]
+        if {$d eq ""} break
+        lappend result [lindex [split $i .] 0] [lindex $d 1] [lindex $d 3]
+        set next [$w index "$i +1line"]
+        if {$next eq $i} break
+        set i $next
+    }
+    return $result
+}
+''' % _LAYOUT_PROC
+
+FRAME_MS = 16 # yksi piirto per ruudunpäivitys, vaikka tapahtumia tulisi ryöppynä
+
+# Muutospalkin värit rivin tilan mukaan; None = palkin taustaväri
+STATE_COLORS = {CLEAN: None, MODIFIED: "red", ADDED: "#e5a50a", SAVED: "green"}
+
+class GutterRenderer:
+    """
+    Rivinumerot ja muutospalkki Text-widgetin vieressä.
+    Canvas-oliot luodaan kerran ja niitä siirretään coords/itemconfigure-kutsuilla.
+    Piirto tehdään vain, jos ensimmäinen näkyvä rivi, rivien korkeudet tai
+    näkyvien rivien tilat (LineStates) ovat muuttuneet edellisestä kerrasta.
+    """
+
+    def __init__(self, text_area, line_states, line_nums, change_bar, folding_bar, bg="#313335"):
+        self.text = text_area
+        self.line_states = line_states
+        self.line_nums = line_nums
+        self.change_bar = change_bar
+        self.folding_bar = folding_bar
+        self.bg = bg
+        self._numbers = []
+        self._bars = []
+        self._drawn = [] # jokaisen pool-olion viimeksi piirretty (rivi, y, korkeus, väri)
+        self._last = None
+        self._job = None
+        if not text_area.tk.call("info", "commands", _LAYOUT_PROC):
+            text_area.tk.eval(_LAYOUT_TCL)
+        install_edit_hook(text_area).add_listener(self.request)
+
+    def request(self, *args):
+        """Pyytää uudelleenpiirron; saman ruudun aikana tulevat pyynnöt yhdistetään."""
+        if self._job is None:
+            self._job = self.text.after(FRAME_MS, self.redraw)
+
+    def redraw(self):
+        self._job = None
+        try:
+            layout = self.text.tk.call(_LAYOUT_PROC, self.text._w)
+        except tk.TclError:
+            return # Widget on jo tuhottu
+        layout = tuple(int(v) for v in self.text.tk.splitlist(layout))
+        rows = [layout[i:i + 3] for i in range(0, len(layout), 3)]
+
+        states = self.line_states.visible(rows[0][0], rows[-1][0]) if rows else b""
+        state = (layout, states)
+        if state == self._last:
+            return
+        self._last = state
+
+        while len(self._numbers) < len(rows):
+            self._numbers.append(self.line_nums.create_text(35, 0, anchor="ne", fill="gray"))
+            self._bars.append(self.change_bar.create_rectangle(0, 0, 5, 0, outline=""))
+            self._drawn.append(None)
+
+        # Päivitetään vain ne pool-oliot, joiden sisältö tai paikka muuttui
+        for row, (line, y, height) in enumerate(rows):
+            color = (STATE_COLORS.get(states[row]) if row < len(states) else None) or self.bg
+            drawn = (line, y, height, color)
+            previous = self._drawn[row]
+            if drawn == previous:
+                continue
+            if previous is None or previous[:3] != drawn[:3]:
+                self.line_nums.coords(self._numbers[row], 35, y)
+                self.change_bar.coords(self._bars[row], 0, y, 5, y + height)
+            if previous is None or previous[0] != line:
+                self.line_nums.itemconfigure(self._numbers[row], text=str(line), state=tk.NORMAL)
+            self.change_bar.itemconfigure(self._bars[row], fill=color, state=tk.NORMAL)
+            self._drawn[row] = drawn
+        for row in range(len(rows), len(self._numbers)):
+            if self._drawn[row] is not None:
+                self.line_nums.itemconfigure(self._numbers[row], state=tk.HIDDEN)
+                self.change_bar.itemconfigure(self._bars[row], state=tk.HIDDEN)
+                self._drawn[row] = None
@@ -0,0 +1,209 @@
+# Bittinikkari - highlighter.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import re
+import time
+import tkinter as tk
+from edit_hook import install_edit_hook
+from document import lines_of
+
+# Oletusvärit; configin "syntax"-avain voi korvata minkä tahansa
+DEFAULT_SYNTAX_COLORS = {
+    "keyword": "#cc7832",
+    "memory": "#ff6b68",
+    "string": "#6a8759",
+    "comment": "#808080",
+}
+
+# Rivin lopun tila: tavallinen koodi tai avoin /* ... */ -kommentti
+STATE_NORMAL = 0
+STATE_COMMENT = 1
+
+# Yksi rivi kerrallaan: kommentit, lohkokommentin alku, merkkijonot, avainsanat ja muistikutsut
+_TOKEN_RE = re.compile(r'(?P<comment>//.*|#.*)|(?P<block>/\*)|(?P<string>"(?:\\.|[^"\\])*")'
+                       r'|\b(?P<keyword>def|class|if|else|elif|while|for|return|int|char|void)\b'
+                       r'|\b(?P<memory>malloc|free)\b')
+
+# Pelkkä tilan laskenta (ei tageja): merkit, jotka voivat avata lohkokommentin tai estää sen.
+# Vastaa lex_line-funktion sääntöjä, mutta toimii koko tekstilohkolle kerralla.
+_STATE_RE = re.compile(r'//[^\n]*|#[^\n]*|"(?:\\.|[^"\\\n])*"|/\*')
+
+# Kuinka monta riviä haetaan widgetiltä yhdellä get-kutsulla
+_CHUNK_LINES = 256
+# Taustatäytön yhden erän kesto; erien välissä käyttöliittymä käsittelee tapahtumat
+_FILL_SLICE_MS = 8
+
+def lex_line(text, state):
+    """
+    Tokenisoi yhden rivin. state kertoo, alkaako rivi avoimen lohkokommentin sisältä.
+    Palauttaa ([(tagi, alku, loppu), ...], rivin_lopun_tila); sarakkeet ovat merkkejä.
+    """
+    tokens = []
+    pos = 0
+    if state == STATE_COMMENT:
+        end = text.find("*/")
+        if end < 0:
+            tokens.append(("comment", 0, len(text)))
+            return tokens, STATE_COMMENT
+        pos = end + 2
+        tokens.append(("comment", 0, pos))
+    while True:
+        m = _TOKEN_RE.search(text, pos)
+        if m is None:
+            return tokens, STATE_NORMAL
+        kind = m.lastgroup
+        if kind == "block":
+            end = text.find("*/", m.end())
+            if end < 0:
+                tokens.append(("comment", m.start(), len(text)))
+                return tokens, STATE_COMMENT
+            pos = end + 2
+            tokens.append(("comment", m.start(), pos))
+        else:
+            pos = m.end()
+            tokens.append((kind, m.start(), pos))
+
+
+def scan_state(text, state):
+    """
+    Laskee monirivisen tekstin lopputilan tokenisoimatta sitä.
+    Sama tulos kuin lex_line-kutsuilla rivi kerrallaan, mutta yhdellä regex-läpikäynnillä.
+    """
+    pos = 0
+    while True:
+        if state == STATE_COMMENT:
+            end = text.find("*/", pos)
+            if end < 0:
+                return STATE_COMMENT
+            pos = end + 2
+            state = STATE_NORMAL
+        m = _STATE_RE.search(text, pos)
+        if m is None:
+            return STATE_NORMAL
+        pos = m.end()
+        if m.group() == "/*":
+            state = STATE_COMMENT
+
+
+class IncrementalHighlighter:
+    """
+    Väritys, joka lasketaan uudelleen vain muuttuneille riveille.
+    Jokaiselle riville muistetaan lekserin tila rivin lopussa (avoin lohkokommentti).
+    Muokkaus merkitsee rivit likaisiksi (None); käsittely jatkuu alaspäin vain niin
+    kauan kuin rivin lopputila muuttuu. Vanhat tagit poistetaan vain käsitellyltä alueelta.
+    Näkyvä alue väritetään aina ensin, ja loput täytetään taustalla lyhyissä erissä
+    after()-ajastuksella, joten suurenkin tiedoston avaus näyttää värit heti.
+    """
+
+    TAGS = ("keyword", "memory", "string", "comment")
+
+    def __init__(self, text_area, colors=None):
+        self.text = text_area
+        for tag, color in dict(DEFAULT_SYNTAX_COLORS, **(colors or {})).items():
+            text_area.tag_configure(tag, foreground=color)
+
+        # end_states[i] = rivin i+1 lopputila, None = likainen (ei vielä käsitelty)
+        line_count = int(text_area.index("end-1c").split(".")[0])
+        self.end_states = [None] * line_count
+        self._pending = line_count
+        self._dirty_from = 1 # ensimmäinen mahdollinen likainen rivi
+        self._job = None
+
+        install_edit_hook(text_area).add_listener(self.on_edit)
+        self._schedule()
+
+    def on_edit(self, op, start, old_end, new_end):
+        """EditHookin kuuntelija: korvaa rivien start..old_end tilat likaisilla riveillä start..new_end."""
+        removed = self.end_states[start - 1:old_end]
+        self._pending -= removed.count(None)
+        self.end_states[start - 1:old_end] = [None] * (new_end - start + 1)
+        self._pending += new_end - start + 1
+        self._dirty_from = min(self._dirty_from, start)
+        # Muokkaus väritetään heti seuraavalla idle-kierroksella, ei taustatäytön tahdissa
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+        self._job = self.text.after_idle(self.flush)
+
+    def _schedule(self):
+        if self._job is None:
+            self._job = self.text.after_idle(self.flush)
+
+    def flush(self):
+        """Värittää ensin näkyvät rivit ja sen jälkeen likaisia rivejä aikarajaan asti."""
+        self._job = None
+        if not self._pending:
+            return
+        try:
+            self._paint_viewport()
+            deadline = time.monotonic() + _FILL_SLICE_MS / 1000
+            while self._pending and time.monotonic() < deadline:
+                line = self.end_states.index(None, self._dirty_from - 1) + 1
+                self._dirty_from = self._relex_run(line, min(len(self.end_states), line + _CHUNK_LINES - 1))
+            # Täyttö voi levittää tilamuutoksen näkyvälle alueelle: korjataan se saman erän aikana
+            self._paint_viewport()
+        except tk.TclError:
+            return # Widget on jo tuhottu
+        if self._pending:
+            self._job = self.text.after(1, self.flush)
+
+    def _paint_viewport(self):
+        """Tokenisoi näkyvän alueen likaiset rivit oikealla alkutilalla."""
+        top = int(self.text.index("@0,0").split(".")[0])
+        bottom = int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0])
+        line = top
+        while line <= bottom:
+            try:
+                line = self.end_states.index(None, line - 1, bottom) + 1
+            except ValueError:
+                return # Näkyvä alue on jo valmis
+            line = self._relex_run(line, bottom, self._entry_state(line))
+
+    def _entry_state(self, line):
+        """
+        Rivin alkutila. Jos yläpuolella on vielä käsittelemättömiä rivejä, niiden
+        vaikutus lasketaan nopealla scan_state-läpikäynnillä tageja lisäämättä.
+        """
+        if line == 1:
+            return STATE_NORMAL
+        first_dirty = self.end_states.index(None, self._dirty_from - 1) + 1
+        if first_dirty >= line:
+            return self.end_states[line - 2]
+        state = self.end_states[first_dirty - 2] if first_dirty > 1 else STATE_NORMAL
+        return scan_state("\n".join(lines_of(self.text, first_dirty, line - 1)), state)
+
+    def _relex_run(self, first, last, state=None):
+        """
+        Tokenisoi rivejä first..last, kunnes vastaan tulee puhdas rivi, jonka alkutila ei muuttunut.
+        Jos tila muuttui vielä viimeisellä rivillä, seuraava rivi merkitään likaiseksi.
+        Palauttaa ensimmäisen käsittelemättömän rivin numeron.
+        """
+        if state is None:
+            state = self.end_states[first - 2] if first > 1 else STATE_NORMAL
+        lines = lines_of(self.text, first, last)
+        spans = {tag: [] for tag in self.TAGS}
+        line = first
+        changed = True
+        for text_line in lines:
+            old = self.end_states[line - 1]
+            if old is not None and not changed:
+                break
+            tokens, state = lex_line(text_line, state)
+            for tag, start, end in tokens:
+                if end > start:
+                    spans[tag].extend((f"{line}.{start}", f"{line}.{end}"))
+            if old is None:
+                self._pending -= 1
+            self.end_states[line - 1] = state
+            changed = state != old
+            line += 1
+        if changed and line <= len(self.end_states) and self.end_states[line - 1] is not None:
+            self.end_states[line - 1] = None
+            self._pending += 1
+
+        # Vanhat tagit pois vain käsitellyltä alueelta, uudet yhdellä kutsulla tagia kohden
+        for tag in self.TAGS:
+            self.text.tag_remove(tag, f"{first}.0", f"{line - 1}.end")
+            if spans[tag]:
+                self.text.tag_add(tag, *spans[tag])
+        return line
@@ -0,0 +1,154 @@
+# Bittinikkari - large_file.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import mmap
+import os
+import time
+from array import array
+from itertools import accumulate, islice
+
+LOAD_CHUNK_CHARS = 256 * 1024   # yhden after-kierroksen lisäys Text-widgetiin
+LOAD_SLICE_MS = 30              # kuinka kauan yksi latauskierros saa kestää
+INDEX_CHUNK_BYTES = 4 * 1024 * 1024
+INDEX_STEP = 32                 # rivi-indeksiin tallennetaan joka 32. rivin alku
+
+def load_in_chunks(text_area, path, on_progress=None, on_done=None):
+    """
+    Lataa tiedoston Text-widgetiin paloittain root.after-kierroksilla, jotta
+    käyttöliittymä ei jäädy. Widget on lukittu (state=disabled) latauksen ajan.
+    on_progress(luettu_tavuina, koko_tavuina) ja on_done(virhe_tai_None).
+    Palauttaa funktion, jolla lataus voidaan keskeyttää (on_done-kutsua ei silloin tehdä).
+    """
+    size = max(1, os.path.getsize(path))
+    f = open(path, "r", encoding="utf-8")
+    state = {"job": None}
+    text_area.loading = True
+    text_area.config(state="disabled")
+
+    def finish(error=None, notify=True):
+        f.close()
+        text_area.loading = False
+        state["job"] = None
+        if text_area.winfo_exists():
+            text_area.config(state="normal")
+            # Latauksen lisäykset eivät ole käyttäjän muutoksia: tyhjä undo-pino
+            text_area.edit_reset()
+            text_area.edit_modified(False)
+        if on_done and notify:
+            on_done(error)
+
+    def step():
+        if not text_area.winfo_exists():
+            f.close()
+            return # Välilehti suljettiin kesken latauksen
+        try:
+            deadline = time.monotonic() + LOAD_SLICE_MS / 1000
+            text_area.config(state="normal")
+            while time.monotonic() < deadline:
+                chunk = f.read(LOAD_CHUNK_CHARS)
+                if not chunk:
+                    finish()
+                    return
+                text_area.insert("end-1c", chunk)
+            text_area.config(state="disabled")
+        except Exception as e:
+            finish(e)
+            return
+        if on_progress:
+            on_progress(f.buffer.tell(), size)
+        state["job"] = text_area.after(1, step)
+
+    def cancel():
+        if state["job"] is not None:
+            text_area.after_cancel(state["job"])
+            finish(notify=False)
+
+    state["job"] = text_area.after(1, step)
+    return cancel
+
+
+class MappedLines:
+    """
+    Vain luku -rivinäkymä muistiin kuvattuun (mmap) tiedostoon.
+    Rivien alut indeksoidaan taustalla harvana taulukkona (joka INDEX_STEP. rivi),
+    joten muistia kuluu murto-osa tiedoston koosta. len() kasvaa indeksoinnin edetessä,
+    ja rivit dekoodataan vasta, kun niitä pyydetään (esim. VirtualLineView).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = self._file.seek(0, 2)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._sparse = array("q", [0])
+        self._count = 0          # indeksoitujen rivien määrä
+        self._indexed_to = 0     # tavu, johon asti indeksi on valmis
+        self._cursor = (0, 0)    # viimeksi luettu (rivi, alku) peräkkäisiä hakuja varten
+        self.closed = False
+
+    @property
+    def done(self):
+        return self._indexed_to >= self.size
+
+    @property
+    def progress(self):
+        """Indeksoinnin eteneminen prosentteina."""
+        return self._indexed_to * 100 // self.size if self.size else 100
+
+    def index_step(self, budget_ms=20):
+        """Indeksoi lisää rivejä aikarajaan asti. Palauttaa True, kun koko tiedosto on käyty."""
+        deadline = time.monotonic() + budget_ms / 1000
+        while not self.done and time.monotonic() < deadline:
+            start = self._indexed_to
+            end = self._map.rfind(b"\n", start, start + INDEX_CHUNK_BYTES) + 1
+            if end <= start:
+                # Ei rivinvaihtoa palassa: pitkä rivi tai tiedoston loppu
+                end = self._map.find(b"\n", start + INDEX_CHUNK_BYTES) + 1 or self.size
+            lines = self._map[start:end].split(b"\n")
+            if end < self.size or lines[-1] == b"":
+                lines.pop() # viimeinen pala päättyi rivinvaihtoon
+            # Rivien alkukohdat C-tason funktioilla: alku + (pituus + 1) kumulatiivisesti
+            starts = accumulate(map((1).__add__, map(len, lines)), initial=start)
+            first = (-self._count) % INDEX_STEP
+            sparse = list(islice(starts, first, len(lines), INDEX_STEP))
+            if self._count == 0 and sparse and sparse[0] == 0:
+                sparse.pop(0) # rivi 0 on jo taulukossa
+            self._sparse.extend(sparse)
+            self._count += len(lines)
+            self._indexed_to = end
+        return self.done
+
+    def __len__(self):
+        return self._count
+
+    def _line_start(self, index):
+        cursor_line, cursor_pos = self._cursor
+        if cursor_line <= index < (cursor_line // INDEX_STEP + 1) * INDEX_STEP:
+            line, pos = cursor_line, cursor_pos
+        else:
+            line = index - index % INDEX_STEP
+            pos = self._sparse[index // INDEX_STEP]
+        while line < index:
+            pos = self._map.find(b"\n", pos) + 1
+            line += 1
+        return pos
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._line_start(index)
+        end = self._map.find(b"\n", start, self.size)
+        if end < 0:
+            end = self.size
+        self._cursor = (index, start)
+        return self._map[start:end].decode("utf-8", "replace").rstrip("\r").expandtabs(4)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.size:
+                self._map.close()
+            self._file.close()
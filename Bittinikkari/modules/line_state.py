@@ -0,0 +1,69 @@
+# Bittinikkari - line_state.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import re
+from edit_hook import install_edit_hook
+
+# Rivin tila: yksi tavu riviä kohden
+CLEAN = 0     # ennallaan avaamisen (tai palautuksen) jälkeen
+MODIFIED = 1  # muutettu, ei tallennettu
+ADDED = 2     # uusi rivi, ei tallennettu
+SAVED = 3     # muutettu ja tallennettu
+
+# Tallennus: muutetut ja lisätyt -> tallennettu, yhdellä translate-kutsulla
+_SAVE_TABLE = bytes(SAVED if i in (MODIFIED, ADDED) else i for i in range(256))
+# Muutoslohkon alku: tallentamaton rivi, jota ei edellä tallentamaton rivi (MODIFIED=1, ADDED=2)
+_CHANGE_START_RE = re.compile(rb"(?<![\x01\x02])[\x01\x02]")
+
+class LineStates:
+    """
+    Rivikohtainen muutostila Text-widgetille, ylläpidetään EditHookin tapahtumista.
+    Tila on bytearray (rivi n -> tavu n-1), joten haku on O(1), rivien lisäys ja poisto
+    on yksi viipalesijoitus ja tallennus nollaa kaiken kerralla.
+    """
+
+    def __init__(self, text_area):
+        self.text = text_area
+        self.reset()
+        install_edit_hook(text_area).add_listener(self.on_edit)
+
+    def reset(self):
+        """Kaikki rivit ennalleen (esim. tiedoston avaus tai palautus varmuuskopiosta)."""
+        self.states = bytearray(int(self.text.index("end-1c").split(".")[0]))
+
+    def on_edit(self, op, start, old_end, new_end):
+        old_count = old_end - start + 1
+        new_count = new_end - start + 1
+        kept = min(old_count, new_count)
+        # Säilyvät rivit muuttuvat, uudet ovat lisättyjä; lisätty rivi pysyy lisättynä
+        replacement = bytearray(ADDED if s == ADDED else MODIFIED for s in self.states[start - 1:start - 1 + kept])
+        replacement.extend(bytes([ADDED]) * (new_count - kept))
+        self.states[start - 1:old_end] = replacement
+
+    def status(self, line):
+        """Rivin tila (1-alkuinen rivinumero)."""
+        return self.states[line - 1] if 0 < line <= len(self.states) else CLEAN
+
+    def visible(self, first, last):
+        """Rivien first..last tilat tavuina (esim. rivinumeropalkin piirtoon)."""
+        return bytes(self.states[first - 1:last])
+
+    def mark_saved(self):
+        """Tallennuksen jälkeen: kaikki tallentamattomat muutokset merkitään tallennetuiksi."""
+        self.states = self.states.translate(_SAVE_TABLE)
+
+    def next_change(self, line):
+        """Seuraavan tallentamattoman muutoslohkon alkurivi rivin line jälkeen, tai None."""
+        m = _CHANGE_START_RE.search(self.states, line)
+        return m.start() + 1 if m else None
+
+    def prev_change(self, line):
+        """Edellisen tallentamattoman muutoslohkon alkurivi ennen riviä line, tai None."""
+        position = max(self.states.rfind(bytes([MODIFIED]), 0, line - 1),
+                       self.states.rfind(bytes([ADDED]), 0, line - 1))
+        if position < 0:
+            return None
+        while position > 0 and self.states[position - 1] in (MODIFIED, ADDED):
+            position -= 1
+        return position + 1
@@ -0,0 +1,78 @@
+# Bittinikkari - manifest.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import json
+import hashlib
+from atomic_file import AtomicFile
+
+# Nostetaan, jos manifestin rakenne muuttuu
+MANIFEST_VERSION = 1
+
+def get_manifest_path(project_path):
+    """Manifesti tallennetaan .cbp-tiedoston viereen: Projekti.cbp -> Projekti.manifest.json"""
+    return os.path.splitext(os.path.abspath(project_path))[0] + ".manifest.json"
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Laskee tiedoston SHA-256-tiivisteen paloittain (ei lueta koko tiedostoa muistiin)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path, fingerprint):
+    """
+    Lukee manifestin. Palauttaa {suhteellinen_polku: merkintä}.
+    Jos versio tai sormenjälki (esim. korjauslogiikan versio) ei täsmää, palautetaan tyhjä.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION or data.get("fingerprint") != fingerprint:
+            return {}
+        return data.get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest_path, entries, fingerprint):
+    """Kirjoittaa manifestin atomisesti (väliaikaistiedosto + rename)."""
+    data = {"version": MANIFEST_VERSION, "fingerprint": fingerprint, "files": entries}
+    with AtomicFile(manifest_path) as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+def make_entry(path, notes, digest=None):
+    """Luo merkinnän onnistuneen käsittelyn jälkeen: koko, mtime, tiiviste ja analyysihuomiot."""
+    st = os.stat(path)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": digest or hash_file(path),
+        "notes": list(notes),
+    }
+
+def stat_matches(entry, path):
+    """Nopea tarkistus pelkällä stat-kutsulla: sama koko ja mtime -> tiedosto on ennallaan."""
+    if not entry:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == entry.get("size") and st.st_mtime_ns == entry.get("mtime_ns")
+
+def content_matches(entry, path):
+    """
+    Hitaampi tarkistus: mtime on muuttunut (esim. touch tai git checkout), mutta sisältö voi olla sama.
+    Palauttaa (täsmääkö, tiiviste).
+    """
+    if not entry:
+        return False, None
+    try:
+        if os.path.getsize(path) != entry.get("size"):
+            return False, None
+        digest = hash_file(path)
+    except OSError:
+        return False, None
+    return digest == entry.get("sha256"), digest
@@ -0,0 +1,264 @@
+# Bittinikkari - project_model.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import io
+import os
+import threading
+import xml.etree.ElementTree as ET
+from atomic_file import write_atomic
+from engine import CONFIG_PATH
+
+# Jäsennetyt projektit polun mukaan; luetaan uudelleen vain, jos .cbp muuttuu levyllä
+_models = {}
+_models_lock = threading.Lock()
+
+SAVE_DELAY_MS = 500 # muutoserän jälkeen odotetaan näin kauan ennen kuin .cbp kirjoitetaan
+
+# Bittinikkarin omat tiedostot (projekti, manifesti, indeksi, varmuuskopiot, päiväkirjat)
+ARTIFACT_SUFFIXES = (".cbp", ".manifest.json", ".trigrams", ".bak", ".journal", ".tmp")
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class ProjectModel:
+    """
+    .cbp-projekti muistissa: XML jäsennetään kerran ja Unit-tagit indeksoidaan tiedostonimen
+    mukaan, joten jäsenyys on sanakirjahaku. Lisäys ja poisto muuttavat vain yhtä tagia
+    (sisennys korjataan naapuritagien perusteella) ja kertovat muutoksesta kuuntelijoille,
+    jotka päivittävät puunäkymän samalla tavalla rivi kerrallaan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.project_dir = os.path.dirname(os.path.abspath(path))
+        self.tree = ET.parse(path)
+        self.project = self.tree.getroot().find("Project")
+        if self.project is None:
+            raise ValueError("Project-tagi puuttuu")
+        self.title = "Bittinikkari"
+        # Haetaan nimi <Option title="..."/> tagista
+        for opt in self.project.findall("Option"):
+            if opt.get("title"):
+                self.title = opt.get("title")
+        self.units = {} # tiedostonimi -> Unit-tagi, .cbp-tiedoston järjestyksessä
+        for unit in self.project.findall("Unit"):
+            if unit.get("filename"):
+                self.units[unit.get("filename")] = unit
+        self.stamp = _stamp(path)
+        self.changed = False # onko muistissa muutoksia, joita ei ole kirjoitettu .cbp-tiedostoon
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(op, tiedostonimi), op on "add" tai "remove"."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, op, rel_path):
+        for callback in list(self._listeners):
+            callback(op, rel_path)
+
+    def __contains__(self, rel_path):
+        return rel_path in self.units
+
+    def __len__(self):
+        return len(self.units)
+
+    def full_path(self, rel_path):
+        """Tiedostonimi on suhteessa .cbp-tiedostoon."""
+        return os.path.join(self.project_dir, rel_path)
+
+    def relative(self, file_path):
+        """Levypolku -> tiedostonimi kuten CodeBlocks sen kirjoittaa (vinoviivat)."""
+        return os.path.relpath(os.path.abspath(file_path), self.project_dir).replace("\\", "/")
+
+    def add(self, rel_path):
+        """Lisää Unit-tagin. Palauttaa False, jos tiedosto on jo projektissa."""
+        if rel_path in self.units:
+            return False
+        project = self.project
+        last = project[-1] if len(project) else None
+        unit = ET.SubElement(project, "Unit", filename=rel_path)
+        # Sisennys kuten CodeBlocksin tiedostoissa: tagien väli "\n\t\t", viimeisen perässä "\n\t"
+        if last is not None:
+            unit.tail = last.tail
+            last.tail = project.text
+        else:
+            project.text, unit.tail = "\n\t\t", "\n\t"
+        self.units[rel_path] = unit
+        self.changed = True
+        self._notify("add", rel_path)
+        return True
+
+    def add_many(self, rel_paths):
+        """Lisää tiedostot yhtenä eränä. Palauttaa lisättyjen määrän (jo projektissa olevat ohitetaan)."""
+        return sum(map(self.add, rel_paths))
+
+    def remove(self, rel_path):
+        """Poistaa Unit-tagin. Palauttaa False, jos tiedosto ei ole projektissa."""
+        unit = self.units.pop(rel_path, None)
+        if unit is None:
+            return False
+        project = self.project
+        if len(project) > 1 and project[-1] is unit:
+            project[-2].tail = unit.tail
+        project.remove(unit)
+        self.changed = True
+        self._notify("remove", rel_path)
+        return True
+
+    def remove_many(self, rel_paths):
+        """
+        Poistaa tiedostot yhtenä eränä: Project-tagin lapset suodatetaan kerran joukon avulla
+        sen sijaan, että jokainen poisto etsisi tagiaan listasta. Palauttaa poistettujen määrän.
+        """
+        removed = {rel_path: self.units.pop(rel_path) for rel_path in dict.fromkeys(rel_paths)
+                   if rel_path in self.units}
+        if not removed:
+            return 0
+        project = self.project
+        units = set(removed.values())
+        kept = [child for child in project if child not in units]
+        if kept and project[-1] in units:
+            kept[-1].tail = project[-1].tail
+        project[:] = kept
+        self.changed = True
+        for rel_path in removed:
+            self._notify("remove", rel_path)
+        return len(removed)
+
+    def save(self):
+        """Kirjoittaa .cbp-tiedoston atomisesti (väliaikaistiedosto + rename), jos siihen on muutoksia."""
+        if not self.changed:
+            return False
+        buffer = io.BytesIO()
+        self.tree.write(buffer, encoding="UTF-8", xml_declaration=True)
+        write_atomic(self.path, buffer.getvalue())
+        self.stamp = _stamp(self.path)
+        self.changed = False
+        return True
+
+
+def collect_files(paths, settings):
+    """
+    Projektiin lisättävät tiedostot annetuista poluista. Kansiot käydään rekursiivisesti, ja
+    niistä otetaan vain lähdekooditiedostot (source_extensions). Piilotetut kansiot,
+    __pycache__, config-kansio, varmuuskopiot ja palautuspäiväkirjat ohitetaan kokonaan,
+    ja työkalun omia tiedostoja ei lisätä, vaikka ne valittaisiin erikseen.
+    """
+    extensions = tuple(ext.lower() for ext in settings.get("source_extensions", ()))
+    skip_dirs = {os.path.abspath(settings.get("backup_dir", "backups")),
+                 os.path.abspath(settings.get("recovery_dir", "recovery")),
+                 os.path.abspath(os.path.dirname(CONFIG_PATH))}
+    for path in paths:
+        if os.path.isfile(path):
+            if not path.lower().endswith(ARTIFACT_SUFFIXES):
+                yield path
+            continue
+        for folder, dirs, files in os.walk(path):
+            if os.path.abspath(folder) in skip_dirs:
+                dirs[:] = []
+                continue
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+            for name in sorted(files):
+                lower = name.lower()
+                if not name.startswith(".") and lower.endswith(extensions) and not lower.endswith(ARTIFACT_SUFFIXES):
+                    yield os.path.join(folder, name)
+
+def open_project(path):
+    """Palauttaa projektin mallin; .cbp jäsennetään uudelleen vain, jos se on muuttunut levyllä."""
+    key = os.path.abspath(path)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None or model.stamp != _stamp(path):
+            model = _models[key] = ProjectModel(path)
+        return model
+
+
+class ProjectTreeView:
+    """
+    Projektin puunäkymä ttk.Treeview'hun. Tiedostot ryhmitellään kansioittain, ja kansion
+    rivit lisätään vasta, kun kansio avataan ensimmäisen kerran, joten suurikin projekti
+    aukeaa heti. Mallin lisäykset ja poistot päivitetään puuhun rivi kerrallaan.
+    """
+
+    def __init__(self, treeview):
+        self.tree = treeview
+        self.model = None
+        self.tree.bind("<<TreeviewOpen>>", self._on_open, add="+")
+
+    def show(self, model):
+        if self.model is not None:
+            self.model.remove_listener(self.on_change)
+        self.model = model
+        model.add_listener(self.on_change)
+        self.tree.delete(*self.tree.get_children())
+        self.main_node = self.tree.insert("", "end", text=model.title, open=True, values=(model.path,))
+        self.folders = {}  # kansio -> [rivi, kansion tiedostonimet (dict), onko rivit lisätty]
+        self.nodes = {}    # kansion rivi -> kansio
+        self.items = {}    # tiedostonimi -> rivi (vain lisätyille riveille)
+        self.rows = {}     # rivi -> tiedostonimi
+        for rel_path in model.units:
+            self._add(rel_path)
+
+    def _add(self, rel_path):
+        folder, name = rel_path.rpartition("/")[::2]
+        if not folder:
+            # Juuritasolla (esim. main.py)
+            self._insert(self.main_node, rel_path, rel_path)
+            return
+        entry = self.folders.get(folder)
+        if entry is None:
+            node = self.tree.insert(self.main_node, "end", text=folder, open=False)
+            self.tree.insert(node, "end", text="...") # paikkamerkki, jotta kansion voi avata
+            entry = self.folders[folder] = [node, {}, False]
+            self.nodes[node] = folder
+        entry[1][rel_path] = None
+        if entry[2]:
+            self._insert(entry[0], rel_path, name)
+
+    def _insert(self, parent, rel_path, text):
+        row = self.items[rel_path] = self.tree.insert(parent, "end", text=text, values=(rel_path,))
+        self.rows[row] = rel_path
+
+    def _on_open(self, event):
+        node = self.tree.focus()
+        entry = self.folders.get(self.nodes.get(node))
+        if entry is None or entry[2]:
+            return
+        self.tree.delete(*self.tree.get_children(node))
+        for rel_path in entry[1]:
+            self._insert(node, rel_path, rel_path.rpartition("/")[2])
+        entry[2] = True
+
+    def files_of(self, rows):
+        """Valittujen rivien tiedostonimet; kansiorivi tarkoittaa kaikkia kansion tiedostoja."""
+        found = {}
+        for row in rows:
+            if row in self.rows:
+                found[self.rows[row]] = None
+            elif row in self.nodes:
+                found.update(self.folders[self.nodes[row]][1])
+        return list(found)
+
+    def on_change(self, op, rel_path):
+        if op == "add":
+            self._add(rel_path)
+            return
+        item = self.items.pop(rel_path, None)
+        if item is not None:
+            del self.rows[item]
+            self.tree.delete(item)
+        folder = rel_path.rpartition("/")[0]
+        entry = self.folders.get(folder)
+        if entry is not None:
+            entry[1].pop(rel_path, None)
+            if not entry[1]:
+                self.tree.delete(entry[0])
+                del self.nodes[entry[0]]
+                del self.folders[folder]
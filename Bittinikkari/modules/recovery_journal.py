@@ -0,0 +1,295 @@
+# Bittinikkari - recovery_journal.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import glob
+import hashlib
+import json
+import os
+import queue
+import threading
+import uuid
+from document import lines_of
+from edit_hook import install_edit_hook
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+FLUSH_MS = 1000       # kuinka usein kertyneet muutokset viedään kirjoitussäikeelle
+JOURNAL_VERSION = 1
+STALE_SUFFIX = ".stale" # päiväkirja, jonka pohjatiedosto muuttui: säilytetään, mutta ei tarjota enää
+
+
+class StaleJournalError(ValueError):
+    """Pohjatiedosto on muuttunut tai puuttuu, joten muokkauksia ei voi toistaa sen päälle."""
+
+
+def _lock(f):
+    """Lukitsee avoimen tiedoston (ei odota). Käyttöjärjestelmä vapauttaa lukon, kun prosessi päättyy."""
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _owner_alive(folder, owner):
+    """Onko päiväkirjan omistava editori yhä käynnissä (sen lukkotiedosto on lukittuna)."""
+    lock_path = os.path.join(folder, f"{owner}.lock")
+    try:
+        f = open(lock_path, "a")
+    except OSError:
+        return False
+    with f:
+        if not _lock(f):
+            return True
+    remove_journal(lock_path) # omistaja kaatui: lukkotiedosto jäi
+    return False
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _apply(lines, start, old_end, new_lines):
+    """Rivit start..old_end (1-alkuiset) korvataan listalla new_lines (kuten Document.replace_lines)."""
+    lines[start - 1:old_end] = new_lines
+
+
+class TabJournal:
+    """
+    Yhden välilehden palautuspäiväkirja. Ensimmäinen rivi kertoo pohjan (tiedosto ja sen
+    SHA-256 tai tallentamattoman välilehden teksti), sen jälkeen tulee yksi JSON-rivi
+    [alku, vanha_loppu, [rivit]] kutakin muokkausta kohden. Peräkkäiset muokkaukset samalle
+    alueelle (esim. kirjoittaminen yhdelle riville) yhdistetään muistissa ennen kirjoitusta,
+    joten kirjoitettava määrä riippuu muokkauksista eikä tiedoston koosta.
+    """
+
+    def __init__(self, manager, text_area, path, content):
+        self.manager = manager
+        self.text = text_area
+        self.file = os.path.join(manager.folder, f"{manager.owner}-{uuid.uuid4().hex}.journal")
+        self.pending = []   # [alku, vanha_loppu, uusi_loppu, rivit]
+        self.closed = False
+        self.rebase(path, content)
+        install_edit_hook(text_area).add_listener(self.on_edit)
+
+    def rebase(self, path, content, current=None):
+        """
+        Uusi pohja (avaus, latauksen loppu, tallennus): vanhat muutokset hylätään.
+        current on teksti, jos sitä on muutettu pohjan (esim. tallennetun kopion) jälkeen.
+        """
+        if self.closed:
+            return
+        self.pending = []
+        header = {"version": JOURNAL_VERSION, "path": os.path.abspath(path) if path else None}
+        if not path:
+            header["text"] = content
+        self.manager.submit(("begin", self.file, header, content))
+        if current is not None and current != content:
+            self.pending.append([1, content.count("\n") + 1, current.count("\n") + 1, current.split("\n")])
+            self.manager.schedule()
+
+    def on_edit(self, op, start, old_end, new_end):
+        if self.closed or getattr(self.text, "loading", False):
+            return # Latauksen lisäykset kuuluvat pohjaan
+        # Dokumenttimalli on jo päivitetty (sen kuuntelija rekisteröitiin ensin), joten rivejä ei haeta Tk:lta
+        new_lines = lines_of(self.text, start, new_end)
+        if self.pending:
+            last = self.pending[-1]
+            if last[0] <= start and old_end <= last[2]:
+                # Muokkaus osuu edellisen muokkauksen tuottamien rivien sisälle: yhdistetään
+                last[3][start - last[0]:old_end - last[0] + 1] = new_lines
+                last[2] += new_end - old_end
+                return
+        self.pending.append([start, old_end, new_end, new_lines])
+        self.manager.schedule()
+
+    def take(self):
+        records, self.pending = self.pending, []
+        return [[start, old_end, lines] for start, old_end, _, lines in records]
+
+    def discard(self):
+        """Välilehti suljettiin tai ohjelma lopetettiin siististi: päiväkirja pois."""
+        if not self.closed:
+            self.closed = True
+            self.pending = []
+            self.manager.forget(self)
+            self.manager.submit(("discard", self.file))
+
+
+class RecoveryJournal:
+    """
+    Avointen välilehtien palautuspäiväkirjat. Muokkaukset kerätään muistiin pääsäikeessä,
+    ja FLUSH_MS välein ne annetaan kirjoitussäikeelle, joka lisää ne tiedostojen perään.
+    Edellisen istunnon jäljelle jääneet päiväkirjat luetaan leftovers()-kutsulla.
+    Päiväkirjan nimen alussa on sen kirjoittaneen editorin tunniste, ja editori pitää
+    tunnisteen lukkotiedostoa lukittuna koko ajon, joten samaan aikaan käynnissä olevan
+    toisen editorin päiväkirjoja ei tarjota eikä poisteta.
+    """
+
+    def __init__(self, root, folder):
+        self.root = root
+        self.folder = os.path.abspath(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.owner = uuid.uuid4().hex
+        self._lock_file = open(os.path.join(self.folder, f"{self.owner}.lock"), "a")
+        _lock(self._lock_file)
+        # Ennen tämän istunnon välilehtiä olleet tiedostot ovat päättyneiltä tai muilta istunnoilta
+        self._leftovers = sorted(glob.glob(os.path.join(self.folder, "*.journal")), key=os.path.getmtime)
+        self.journals = []
+        self._job = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def attach(self, text_area, path=None, content=""):
+        journal = TabJournal(self, text_area, path, content)
+        self.journals.append(journal)
+        return journal
+
+    def forget(self, journal):
+        if journal in self.journals:
+            self.journals.remove(journal)
+
+    def submit(self, op):
+        self._queue.put(op)
+
+    def schedule(self):
+        if self._job is None:
+            self._job = self.root.after(FLUSH_MS, self.flush)
+
+    def flush(self):
+        """Kertyneet muokkaukset kirjoitussäikeelle (ajastettuna tai ennen lopetusta)."""
+        self._job = None
+        for journal in self.journals:
+            if journal.pending:
+                self.submit(("append", journal.file, journal.take()))
+
+    def close(self, keep=()):
+        """Siisti lopetus: päiväkirjat poistetaan paitsi välilehdiltä keep (tallentamattomat)."""
+        self.flush()
+        for journal in list(self.journals):
+            if journal.text not in keep:
+                journal.discard()
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._lock_file.close()
+        remove_journal(self._lock_file.name)
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            try:
+                if op[0] == "begin":
+                    _, file, header, content = op
+                    header["sha256"] = _digest(content)
+                    with open(file, "w", encoding="utf-8") as f:
+                        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                elif op[0] == "append":
+                    _, file, records = op
+                    with open(file, "a", encoding="utf-8") as f:
+                        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                elif op[0] == "discard" and os.path.exists(op[1]):
+                    os.remove(op[1])
+            except OSError:
+                pass # Päiväkirja on vain varaverkko: kirjoitusvirhe ei saa kaataa editoria
+
+    def leftovers(self):
+        """
+        Päättyneiden istuntojen päiväkirjat, joissa on muokkauksia; tyhjät poistetaan samalla.
+        Käynnissä olevan editorin päiväkirjat ohitetaan koskematta niihin.
+        """
+        found = []
+        alive = {}
+        for file in self._leftovers:
+            owner = os.path.basename(file).partition("-")[0]
+            if owner not in alive:
+                alive[owner] = _owner_alive(self.folder, owner)
+            if alive[owner]:
+                continue
+            try:
+                with open(file, encoding="utf-8") as f:
+                    f.readline()
+                    has_edits = bool(f.readline())
+            except OSError:
+                continue
+            if has_edits:
+                found.append(file)
+            else:
+                remove_journal(file)
+        self._leftovers = []
+        return found
+
+
+def read_journal(file):
+    """
+    Palauttaa (polku, pohja, teksti) toistamalla muokkaukset pohjan päälle. Polku on None
+    tallentamattomalle välilehdelle. StaleJournalError, jos pohjatiedosto on muuttunut tai
+    puuttuu; muut ValueErrorit tarkoittavat rikkinäistä päiväkirjaa.
+    """
+    with open(file, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != JOURNAL_VERSION:
+            raise ValueError("tuntematon päiväkirjan versio")
+        path = header.get("path")
+        if path is None:
+            base = header.get("text", "")
+        else:
+            try:
+                with open(path, "r", encoding="utf-8") as source:
+                    base = source.read()
+            except OSError:
+                raise StaleJournalError(f"{path} puuttuu")
+            if _digest(base) != header["sha256"]:
+                raise StaleJournalError(f"{path} on muuttunut tallennuksen jälkeen")
+        lines = base.split("\n")
+        for row in f:
+            try:
+                start, old_end, new_lines = json.loads(row)
+            except ValueError:
+                break # Kesken jäänyt viimeinen rivi (kaatuminen kirjoituksen aikana)
+            _apply(lines, start, old_end, new_lines)
+    return path, base, "\n".join(lines)
+
+def apply_recovered(text_area, base, text):
+    """
+    Vie palautetun tekstin välilehdelle, jossa on pohja: vain eroava rivialue korvataan,
+    joten rivien muutostila ja kumoaminen koskevat vain palautettuja muutoksia.
+    """
+    old, new = base.split("\n"), text.split("\n")
+    if old == new:
+        return False
+    first = 0
+    while first < min(len(old), len(new)) and old[first] == new[first]:
+        first += 1
+    tail = 0
+    while tail < min(len(old), len(new)) - first and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    new_mid = new[first:len(new) - tail]
+    if tail:
+        text_area.replace(f"{first + 1}.0", f"{len(old) - tail + 1}.0", "".join(line + "\n" for line in new_mid))
+    elif first:
+        text_area.replace(f"{first}.end", "end-1c", "".join("\n" + line for line in new_mid))
+    else:
+        text_area.replace("1.0", "end-1c", "\n".join(new_mid))
+    return True
+
+def set_aside(file):
+    """Siirtää päiväkirjan sivuun (STALE_SUFFIX), jotta sitä ei tarjota uudelleen. Palauttaa uuden polun."""
+    target = file + STALE_SUFFIX
+    try:
+        os.replace(file, target)
+    except OSError:
+        return file
+    return target
+
+def remove_journal(file):
+    try:
+        os.remove(file)
+    except OSError:
+        pass
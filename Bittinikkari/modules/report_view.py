@@ -0,0 +1,192 @@
+# Bittinikkari - report_view.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import time
+import tkinter as tk
+import tkinter.font as tkfont
+
+# Diff- ja raporttirivien värit rivin alun mukaan (ensimmäinen osuma voittaa)
+REPORT_COLORS = (
+    ("+++ ", "#1a5fb4"),
+    ("--- ", "#1a5fb4"),
+    ("@@", "#8a2be2"),
+    ("+", "#26a269"),
+    ("-", "#c01c28"),
+    ("HUOM", "#b5835a"),
+    ("Virhe", "#c01c28"),
+)
+
+class VirtualLineView(tk.Frame):
+    """
+    Virtualisoitu rivinäkymä: Canvasiin piirretään vain näkyvät rivit.
+    Rivilähteeksi käy mikä tahansa olio, jolla on len() ja indeksointi (esim. lista),
+    joten näkymä pysyy nopeana myös kymmenillä tuhansilla riveillä.
+    Tekstiolioita ei luoda vierittäessä uudelleen, vaan samoja käytetään uudelleen.
+    """
+
+    def __init__(self, master, lines=None, colors=REPORT_COLORS, font=("Courier", 10), **kwargs):
+        super().__init__(master, **kwargs)
+        self.lines = lines if lines is not None else []
+        self.colors = colors
+        self.font = tkfont.Font(master, font=font)
+        self.line_height = self.font.metrics("linespace") + 1
+        self.top = 0 # ensimmäinen näkyvä rivi
+        self._items = []
+        self._redraw_pending = False
+
+        self.scrollbar = tk.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_lines(-3))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_lines(3))
+        self.canvas.bind("<Enter>", lambda e: self.canvas.focus_set())
+        self.canvas.bind("<Prior>", lambda e: self.scroll_lines(-self.visible_rows()))
+        self.canvas.bind("<Next>", lambda e: self.scroll_lines(self.visible_rows()))
+        self.canvas.bind("<Home>", lambda e: self.see(0))
+        self.canvas.bind("<End>", lambda e: self.see(len(self.lines)))
+
+    def visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.line_height)
+
+    def set_lines(self, lines):
+        self.lines = lines
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        """Pyytää uudelleenpiirron; useat pyynnöt samalla kierroksella yhdistetään yhdeksi."""
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        self._redraw_pending = False
+        rows = self.visible_rows() + 1
+        total = len(self.lines)
+        self.top = max(0, min(self.top, total - rows + 1))
+
+        # Lisätään tekstiolioita vain, jos ikkuna kasvaa
+        while len(self._items) < rows:
+            y = len(self._items) * self.line_height + 2
+            self._items.append(self.canvas.create_text(4, y, anchor=tk.NW, font=self.font))
+        for row, item in enumerate(self._items):
+            index = self.top + row
+            if row < rows and index < total:
+                line = self.lines[index]
+                self.canvas.itemconfigure(item, text=line, fill=self._color(line))
+            else:
+                self.canvas.itemconfigure(item, text="")
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + rows - 1) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _color(self, line):
+        for prefix, color in self.colors:
+            if line.startswith(prefix):
+                return color
+        return "black"
+
+    def yview(self, *args):
+        """Scrollbarin komento: moveto-osuus tai scroll n units/pages."""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.lines))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.top += step * self.visible_rows() if args[2] == "pages" else step
+        self.refresh()
+
+    def scroll_lines(self, count):
+        self.top += count
+        self.refresh()
+
+    def see(self, index):
+        """Vierittää niin, että rivi index on näkyvissä."""
+        rows = self.visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + rows:
+            self.top = index - rows + 1
+        self.refresh()
+
+    def _on_wheel(self, event):
+        self.scroll_lines(-3 if event.delta > 0 else 3)
+
+
+class ReportPanel(tk.Toplevel):
+    """
+    Raporttiikkuna, joka lukee rivejä iteraattorista pienissä erissä root.after-ajastuksella.
+    Käyttöliittymä ei jäädy, vaikka rivejä olisi kymmeniä tuhansia, ja jo luetut rivit voi
+    selata heti. Jos lines on None, rivit tuodaan extend-kutsuilla (esim. BackgroundTaskin
+    on_item) ja lopuksi kutsutaan finish(); on_close kutsutaan, kun ikkuna suljetaan.
+    """
+
+    BATCH_MS = 15 # yhden erän enimmäiskesto millisekunteina
+
+    def __init__(self, master, title, lines, summary="", on_close=None):
+        super().__init__(master)
+        self.title(title)
+        self.geometry("900x600")
+        self.summary = summary
+        self._source = iter(lines) if lines is not None else None
+        self._lines = []
+        self.on_close = on_close
+
+        self.info = tk.Label(self, anchor=tk.W, text=summary or "Luetaan...")
+        self.info.pack(side=tk.TOP, fill=tk.X, padx=5, pady=2)
+        self.view = VirtualLineView(self, self._lines)
+        self.view.pack(fill=tk.BOTH, expand=True)
+
+        button_row = tk.Frame(self)
+        button_row.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Button(button_row, text="Sulje", command=self.destroy, width=12).pack(side=tk.RIGHT, padx=5, pady=5)
+
+        self._job = self.after(1, self._pump) if self._source is not None else None
+
+    def extend(self, lines):
+        """Lisää taustalla tuotetut rivit näkymään."""
+        self._lines.extend(lines)
+        self.view.refresh()
+        count = f"{len(self._lines):,}".replace(",", " ")
+        self.info.config(text=f"{self.summary}  Luetaan... {count} riviä".strip())
+
+    def finish(self, message=""):
+        """Rivejä ei tule enempää (message esim. virhe tai keskeytys)."""
+        count = f"{len(self._lines):,}".replace(",", " ")
+        self.info.config(text=f"{self.summary}  Rivejä: {count}  {message}".strip())
+
+    def _pump(self):
+        """Lukee iteraattoria, kunnes aikaraja täyttyy, ja ajastaa seuraavan erän."""
+        deadline = time.monotonic() + self.BATCH_MS / 1000
+        done = False
+        while time.monotonic() < deadline:
+            try:
+                for _ in range(200):
+                    self._lines.append(next(self._source))
+            except StopIteration:
+                done = True
+                break
+        self.view.refresh()
+
+        count = f"{len(self._lines):,}".replace(",", " ")
+        if done:
+            self._job = None
+            self.info.config(text=f"{self.summary}  Rivejä: {count}".strip())
+        else:
+            self.info.config(text=f"{self.summary}  Luetaan... {count} riviä".strip())
+            self._job = self.after(1, self._pump)
+
+    def destroy(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+        if self.on_close:
+            self.on_close()
+            self.on_close = None
+        super().destroy()
@@ -0,0 +1,107 @@
+# Bittinikkari - save_pipeline.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import queue
+import threading
+from collections import deque
+from engine import write_file_atomic, backup_file
+
+POLL_MS = 50 # kuinka usein käyttöliittymä tarkistaa valmistuneet tallennukset
+
+class SavePipeline:
+    """
+    Tallentaa tiedostot taustasäikeessä. Käyttöliittymä antaa tekstistä valmiin kopion
+    ja jatkaa heti; säie varmuuskopioi vanhan sisällön varmuuskopiovarastoon (backup_store),
+    kirjoittaa väliaikaistiedostoon (fsync) ja vaihtaa sen paikalleen. Saman tiedoston tallennukset yhdistetään: jos tiedosto
+    odottaa jo jonossa, sen sisältö vain korvataan uusimmalla, joten nopeat
+    Ctrl+S-painallukset johtavat yhteen kirjoitukseen. Valmistumisesta kerrotaan
+    pääsäikeelle jonon kautta root.after-ajastuksella kuten BackgroundTaskissa.
+    """
+
+    def __init__(self, root, settings):
+        self.root = root
+        self.settings = settings
+        self._lock = threading.Condition()
+        self._pending = {}      # polku -> (sisältö, on_done, analyze, projektikansio)
+        self._order = deque()   # jonossa olevat polut saapumisjärjestyksessä
+        self._writing = None    # polku, jota säie kirjoittaa juuri nyt
+        self._results = queue.Queue()
+        self._polling = False
+        self._thread = None
+
+    def save(self, path, content, on_done=None, analyze=None, project_dir=None):
+        """
+        Jonottaa tallennuksen. on_done(virhe_tai_None, analyysi) kutsutaan pääsäikeessä;
+        analyze(content) ajetaan taustasäikeessä kirjoituksen jälkeen, jos se on annettu.
+        Varmuuskopion polku tallennetaan suhteessa project_dir-kansioon (kuten engine tekee).
+        Palauttaa True, jos pyyntö yhdistettiin jo jonossa olevaan tallennukseen.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            coalesced = path in self._pending
+            if not coalesced:
+                self._order.append(path)
+            self._pending[path] = (content, on_done, analyze, project_dir)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._lock.notify()
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+        return coalesced
+
+    def busy(self, path=None):
+        """Onko tallennuksia kesken (tai annetun tiedoston tallennus)."""
+        with self._lock:
+            if path is None:
+                return bool(self._order) or self._writing is not None
+            path = os.path.abspath(path)
+            return path in self._pending or path == self._writing
+
+    def flush(self, timeout=None):
+        """Odottaa, että jonossa olevat tallennukset on kirjoitettu (esim. ohjelmaa suljettaessa)."""
+        with self._lock:
+            self._lock.wait_for(lambda: not self._order and self._writing is None, timeout)
+        self._drain()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._order)
+                path = self._order.popleft()
+                content, on_done, analyze, project_dir = self._pending.pop(path)
+                self._writing = path
+            try:
+                if os.path.exists(path):
+                    try:
+                        backup_file(path, self.settings, project_dir)
+                    except OSError:
+                        pass # Varmuuskopiointi epäonnistui, jatketaan silti
+                write_file_atomic(path, content, durable=True)
+                result = (None, analyze(content) if analyze else None)
+            except Exception as e:
+                result = (e, None)
+            self._results.put((on_done, result))
+            with self._lock:
+                self._writing = None
+                self._lock.notify_all()
+
+    def _drain(self):
+        while True:
+            try:
+                on_done, (error, analysis) = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if on_done:
+                on_done(error, analysis)
+
+    def _poll(self):
+        self._drain()
+        # Tulos laitetaan jonoon ennen kuin säie vapautuu, joten tyhjä jono ja vapaa säie = valmista
+        if self.busy() or not self._results.empty():
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,114 @@
+# Bittinikkari - task_runner.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+POLL_MS = 50 # kuinka usein käyttöliittymä tyhjentää tapahtumajonon
+
+class BackgroundTask:
+    """
+    Ajaa pitkän tehtävän taustasäikeessä. Säie ei koske Tk-olioihin lainkaan:
+    se vain laittaa tapahtumia jonoon, ja pääsäie lukee jonon root.after-ajastuksella.
+    Tehtäväfunktio saa avainsana-argumentit progress (kutsuttava) ja cancel (threading.Event).
+    Jos on_item on annettu, funktio saa myös emit-kutsun, jonka tulokset välitetään
+    kaikki ja järjestyksessä (esim. hakutulokset sitä mukaa kuin niitä valmistuu).
+    """
+
+    def __init__(self, root, func, *args, on_progress=None, on_done=None, on_error=None, on_item=None):
+        self.root = root
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._on_progress = on_progress
+        self._on_item = on_item
+        self._on_done = on_done
+        self._on_error = on_error
+        self._thread = threading.Thread(target=self._run, args=(func, args), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self.root.after(POLL_MS, self._poll)
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _run(self, func, args):
+        kwargs = {"progress": lambda info: self._queue.put(("progress", info)), "cancel": self.cancel_event}
+        if self._on_item:
+            kwargs["emit"] = lambda item: self._queue.put(("item", item))
+        try:
+            result = func(*args, **kwargs)
+            self._queue.put(("done", result))
+        except Exception as e:
+            self._queue.put(("error", e))
+
+    def _poll(self):
+        # Välivaiheista näytetään vain uusin, jotta nopea tehtävä ei tukehduta käyttöliittymää
+        latest = None
+        while True:
+            try:
+                kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                latest = payload
+                continue
+            if kind == "item":
+                self._on_item(payload)
+                continue
+            if latest is not None and self._on_progress:
+                self._on_progress(latest)
+            callback = self._on_done if kind == "done" else self._on_error
+            if callback:
+                callback(payload)
+            return
+        if latest is not None and self._on_progress:
+            self._on_progress(latest)
+        self.root.after(POLL_MS, self._poll)
+
+
+def _format_bytes(count):
+    for unit in ("t", "kt", "Mt"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "t" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} Gt"
+
+
+class ProgressDialog(tk.Toplevel):
+    """Edistymisikkuna: palkki, nykyinen tiedosto, käsitellyt tavut ja Peruuta-nappi."""
+
+    def __init__(self, master, title, on_cancel):
+        super().__init__(master)
+        self.title(title)
+        self.geometry("460x150")
+        self.resizable(False, False)
+        self.transient(master)
+        self._on_cancel = on_cancel
+
+        self.label = tk.Label(self, text="Valmistellaan...", anchor=tk.W)
+        self.label.pack(fill=tk.X, padx=10, pady=(10, 2))
+        self.bar = ttk.Progressbar(self, mode="determinate", maximum=1)
+        self.bar.pack(fill=tk.X, padx=10, pady=2)
+        self.file_label = tk.Label(self, text="", anchor=tk.W, fg="#555555")
+        self.file_label.pack(fill=tk.X, padx=10, pady=2)
+        self.cancel_btn = tk.Button(self, text="Peruuta", width=12, command=self.request_cancel)
+        self.cancel_btn.pack(side=tk.BOTTOM, pady=8)
+        self.protocol("WM_DELETE_WINDOW", self.request_cancel)
+
+    def update_progress(self, info):
+        total = max(info["total"], 1)
+        self.bar.config(maximum=total, value=info["done"])
+        self.label.config(text=f"Tiedostoja: {info['done']}/{info['total']}  |  "
+                               f"{_format_bytes(info['bytes'])} / {_format_bytes(info['total_bytes'])}")
+        if info["file"]:
+            self.file_label.config(text=info["file"])
+
+    def request_cancel(self):
+        """Peruutus odottaa kesken olevan tiedoston valmistumista, joten ikkuna jää auki siihen asti."""
+        self.cancel_btn.config(state=tk.DISABLED, text="Peruutetaan...")
+        self._on_cancel()
@@ -0,0 +1,279 @@
+# Bittinikkari - trigram_index.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import json
+import struct
+import threading
+import zlib
+from atomic_file import write_atomic
+from manifest import hash_file
+
+# Nostetaan, jos tiedostomuoto muuttuu
+INDEX_VERSION = 1
+_MAGIC = b"BNTRI"
+
+# Avoimet indeksit projektin absoluuttisen polun mukaan, jotta hakujen välillä ei lueta levyltä
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index_path(project_path):
+    """Indeksi tallennetaan .cbp-tiedoston viereen: Projekti.cbp -> Projekti.trigrams"""
+    return os.path.splitext(os.path.abspath(project_path))[0] + ".trigrams"
+
+def _read_grams(path):
+    """Tiedoston trigrammit pienaakkosina UTF-8-tavuina (sama muunnos kuin hakusanalle)."""
+    with open(path, "rb") as f:
+        data = f.read().decode("utf-8", "replace").lower().encode("utf-8")
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+def _query_grams(text):
+    data = text.lower().encode("utf-8")
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+def required_literals(pattern, use_regex=False):
+    """
+    Merkkijonot, joiden on pakko esiintyä jokaisessa osumassa. Regexistä poimitaan vain
+    ryhmien ulkopuoliset pakolliset kirjainjaksot; epävarmoissa tapauksissa (vaihtoehdot,
+    liput) palautetaan tyhjä lista, jolloin esisuodatusta ei tehdä.
+    """
+    if not use_regex:
+        return [pattern]
+    if "|" in pattern or "(?" in pattern:
+        return []
+    pieces, current = [], []
+    depth = 0
+    i = 0
+
+    def close():
+        if current:
+            pieces.append("".join(current))
+            current.clear()
+
+    while i < len(pattern):
+        c = pattern[i]
+        char = None
+        if c == "\\":
+            following = pattern[i + 1:i + 2]
+            if following and not following.isalnum():
+                char = following # suojattu erikoismerkki on tavallinen merkki
+            elif following.isdigit() or following in ("x", "u", "U", "N"):
+                # \x41, \u00e4, \N{...}, oktaali tai takaisinviittaus: merkkiä ei tulkita, ei esisuodatusta
+                return []
+            else:
+                close() # \d, \w, \1 ...
+            i += 2
+        elif c == "[":
+            close()
+            i += 2 if pattern[i + 1:i + 2] == "]" else 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+            continue
+        elif c == "(":
+            close()
+            depth += 1
+            i += 1
+        elif c == ")":
+            depth = max(0, depth - 1)
+            i += 1
+        elif c in "*?{":
+            # Edellinen merkki on valinnainen
+            if current:
+                current.pop()
+            close()
+            if c == "{":
+                end = pattern.find("}", i)
+                i = end + 1 if end >= 0 else i + 1
+            else:
+                i += 1
+        elif c == "+":
+            close() # edellinen merkki vähintään kerran, mutta jakso katkeaa
+            i += 1
+        elif c in ".^$":
+            close()
+            i += 1
+        else:
+            char = c
+            i += 1
+        if char is not None and depth == 0:
+            current.append(char)
+    close()
+    return pieces
+
+
+class TrigramIndex:
+    """
+    Projektin tiedostojen trigrammi-indeksi hakujen esisuodatukseen.
+    Jokaiselle trigrammille pidetään bittikartta (Pythonin int) tiedostoista, joissa se esiintyy;
+    haun ehdokkaat saadaan hakusanan trigrammien bittikarttojen AND-operaatiolla.
+    Tiedostot tunnistetaan koon ja mtimen perusteella, ja muuttuneelta näyttävä tiedosto
+    indeksoidaan uudelleen vain, jos sen SHA-256-tiiviste on muuttunut (kuten manifestissa).
+    Kirjoitetut tiedostot vain merkitään (mark_written); ne indeksoidaan yhtenä eränä
+    seuraavan haun refresh-kutsussa, joten kirjoittajat eivät odota indeksin lukkoa.
+    """
+
+    def __init__(self, project_path):
+        self.project_dir = os.path.dirname(os.path.abspath(project_path))
+        self.path = get_index_path(project_path)
+        self.files = {}      # suhteellinen polku -> [id, koko, mtime_ns, sha256]
+        self.postings = {}   # trigrammi (3 tavua) -> bittikartta tiedostojen id:istä
+        self.changed = False
+        self.lock = threading.RLock()
+        self._written = set()  # kirjoitetut polut: tiiviste tarkistetaan, vaikka koko ja mtime täsmäisivät
+        self._written_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        # Muoto (zlib): BNTRI \n {"version"} \n {tiedostot} \n ja sen jälkeen
+        # trigrammi (3 t) + bittikartan pituus (uint32) + bittikartta (little-endian)
+        try:
+            with open(self.path, "rb") as f:
+                data = zlib.decompress(f.read())
+            magic, header, files, _ = data.split(b"\n", 3)
+            if magic != _MAGIC or json.loads(header).get("version") != INDEX_VERSION:
+                raise ValueError("vanha indeksi")
+            self.files = json.loads(files)
+        except (OSError, ValueError, zlib.error):
+            return # Puuttuva tai vanha indeksi rakennetaan uudelleen ensimmäisessä haussa
+        pos = len(magic) + len(header) + len(files) + 3
+        postings = {}
+        while pos < len(data):
+            gram = data[pos:pos + 3]
+            length, = struct.unpack_from("<I", data, pos + 3)
+            pos += 7
+            postings[gram] = int.from_bytes(data[pos:pos + length], "little")
+            pos += length
+        self.postings = postings
+
+    def save(self):
+        """Kirjoittaa indeksin atomisesti (väliaikaistiedosto + rename), jos se on muuttunut."""
+        with self.lock:
+            if not self.changed:
+                return
+            header = json.dumps({"version": INDEX_VERSION}).encode("utf-8")
+            files = json.dumps(self.files, separators=(",", ":")).encode("utf-8")
+            parts = [_MAGIC, b"\n", header, b"\n", files, b"\n"]
+            for gram, bitmap in self.postings.items():
+                raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+                parts.append(gram + struct.pack("<I", len(raw)) + raw)
+            self.changed = False
+        write_atomic(self.path, zlib.compress(b"".join(parts), 1))
+
+    def _drop(self, fids):
+        """Poistaa tiedostojen bitit kaikista bittikartoista yhdellä läpikäynnillä."""
+        if not fids:
+            return
+        mask = 0
+        for fid in fids:
+            mask |= 1 << fid
+        keep = ~mask
+        self.postings = {gram: bits & keep for gram, bits in self.postings.items() if bits & keep}
+
+    def _add(self, fid, grams):
+        bit = 1 << fid
+        postings = self.postings
+        for gram in grams:
+            postings[gram] = postings.get(gram, 0) | bit
+
+    def refresh(self, units):
+        """
+        Synkronoi indeksin tiedostolistaan [(suhteellinen_polku, täysi_polku), ...]:
+        uudet ja muuttuneet indeksoidaan, poistuneet pudotetaan.
+        """
+        with self.lock:
+            wanted = dict(units)
+            self._sync(wanted.items(), [rel_path for rel_path in self.files if rel_path not in wanted])
+
+    def mark_written(self, full_path):
+        """
+        Merkitsee tiedoston kirjoitetuksi (tallennus, korjaus, korvaus). Indeksiä ei päivitetä
+        heti: seuraava refresh lukee merkityt tiedostot, vaikka mtime ei olisi ehtinyt muuttua.
+        """
+        rel_path = os.path.relpath(os.path.abspath(full_path), self.project_dir).replace(os.sep, "/")
+        with self._written_lock:
+            self._written.add(rel_path)
+
+    def _sync(self, units, stale=()):
+        stale = list(stale)
+        with self._written_lock:
+            written, self._written = self._written, set()
+        to_index = []
+        for rel_path, full_path in units:
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                if rel_path in self.files:
+                    stale.append(rel_path)
+                continue
+            entry = self.files.get(rel_path)
+            if entry and entry[1] == st.st_size and entry[2] == st.st_mtime_ns and rel_path not in written:
+                continue
+            digest = hash_file(full_path)
+            if entry and entry[3] == digest:
+                entry[2] = st.st_mtime_ns # vain mtime muuttui
+                self.changed = True
+                continue
+            to_index.append((rel_path, full_path, st, digest))
+        if not stale and not to_index:
+            return
+
+        # Muuttuneet ja poistuneet pois bittikartoista yhdellä läpikäynnillä
+        self._drop([self.files.pop(rel_path)[0] for rel_path in stale]
+                   + [self.files[rel_path][0] for rel_path, _, _, _ in to_index if rel_path in self.files])
+        used = {entry[0] for entry in self.files.values()}
+        next_id = 0
+        for rel_path, full_path, st, digest in to_index:
+            entry = self.files.get(rel_path)
+            if entry:
+                fid = entry[0]
+            else:
+                # Pienin vapaa id pitää bittikartat lyhyinä
+                while next_id in used:
+                    next_id += 1
+                fid = next_id
+                used.add(fid)
+            try:
+                grams = _read_grams(full_path)
+            except OSError:
+                self.files.pop(rel_path, None)
+                continue
+            self.files[rel_path] = [fid, st.st_size, st.st_mtime_ns, digest]
+            self._add(fid, grams)
+        self.changed = True
+
+    def candidates(self, pattern, use_regex=False):
+        """
+        Suhteelliset polut, joissa haku voi osua, tai None, jos hakusanasta ei saa
+        trigrammeja (liian lyhyt tai regex ilman pakollisia jaksoja).
+        """
+        grams = set()
+        for piece in required_literals(pattern, use_regex):
+            grams |= _query_grams(piece)
+        if not grams:
+            return None
+        with self.lock:
+            bits = -1
+            for gram in grams:
+                bits &= self.postings.get(gram, 0)
+                if not bits:
+                    return set()
+            return {rel_path for rel_path, entry in self.files.items() if bits >> entry[0] & 1}
+
+
+def open_index(project_path):
+    """Palauttaa projektin indeksin; luetaan levyltä vain ensimmäisellä kutsulla."""
+    key = os.path.abspath(project_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = TrigramIndex(project_path)
+        return index
+
+def notify_written(full_path):
+    """Kerrotaan avoimille indekseille, että tiedosto kirjoitettiin (tallennus, korjaus, korvaus)."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.mark_written(full_path)
@@ -0,0 +1,33 @@
+# Bittinikkari - test_atomic_file.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+from atomic_file import AtomicFile, write_atomic
+
+def test_write_atomic_accepts_text_and_bytes(tmp_path):
+    path = tmp_path / "a.txt"
+    write_atomic(str(path), "rivi\r\n", newline="")
+    assert path.read_bytes() == b"rivi\r\n"
+    write_atomic(str(path), b"\x00\x01", durable=True)
+    assert path.read_bytes() == b"\x00\x01"
+
+def test_error_and_discard_leave_target_untouched(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("vanha", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        with AtomicFile(str(path)) as f:
+            f.write("uusi")
+            raise RuntimeError("keskeytys")
+    target = AtomicFile(str(path))
+    with target as f:
+        f.write("uusi")
+        target.discard()
+    assert path.read_text(encoding="utf-8") == "vanha"
+    assert os.listdir(tmp_path) == ["a.txt"]
@@ -0,0 +1,65 @@
+# Bittinikkari - test_backup_store.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+from backup_store import BackupStore
+
+def test_restore_picks_version_by_hash_within_same_second(tmp_path):
+    store = BackupStore(str(tmp_path / "backups"))
+    path = tmp_path / "a.c"
+    path.write_text("eka\n", encoding="utf-8")
+    first = store.backup(str(path), "a.c")
+    path.write_text("toka\n", encoding="utf-8")
+    second = store.backup(str(path), "a.c")
+    assert first["hash"] != second["hash"]
+
+    store.restore("a.c", str(path), first["hash"])
+    assert path.read_text(encoding="utf-8") == "eka\n"
+    store.restore("a.c", str(path), second["hash"])
+    assert path.read_text(encoding="utf-8") == "toka\n"
+
+def test_prune_leaves_no_temp_files(tmp_path):
+    store = BackupStore(str(tmp_path / "backups"), keep_generations=1)
+    path = tmp_path / "a.c"
+    for i in range(3):
+        path.write_text(f"versio {i}\n", encoding="utf-8")
+        store.backup(str(path), "a.c")
+    assert store.prune() == 2
+    assert len(store.history("a.c")) == 1
+    assert not [name for name in os.listdir(store.root_dir) if name.endswith(".tmp")]
+
+def test_has_backup_sees_new_entries(tmp_path):
+    store = BackupStore(str(tmp_path / "backups"))
+    path = tmp_path / "a.c"
+    path.write_text("eka\n", encoding="utf-8")
+    assert not store.has_backup("a.c")
+    store.backup(str(path), "a.c")
+    assert store.has_backup("a.c")
+    assert not store.has_backup("b.c")
+    store.backup(str(path), "sub/b.c")
+    assert store.has_backup("sub\\b.c")
+
+def test_save_pipeline_backs_up_previous_version_to_store(tmp_path):
+    from save_pipeline import SavePipeline
+
+    class FakeRoot:
+        def after(self, ms, func):
+            pass
+
+    settings = {"backup_dir": str(tmp_path / "backups")}
+    path = tmp_path / "a.c"
+    path.write_text("vanha\n", encoding="utf-8")
+    pipeline = SavePipeline(FakeRoot(), settings)
+    pipeline.save(str(path), "uusi\n", project_dir=str(tmp_path))
+    pipeline.flush(timeout=5)
+
+    assert path.read_text(encoding="utf-8") == "uusi\n"
+    assert not os.path.exists(str(path) + ".bak")
+    store = BackupStore(settings["backup_dir"])
+    entry = store.history("a.c")[0]
+    assert store.read(entry["hash"]) == b"vanha\n"
@@ -0,0 +1,65 @@
+# Bittinikkari - test_c_analyzer.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+import engine
+from c_analyzer import analyze_c_source
+
+SOURCE = """#include <stdlib.h>
+/* malloc( kommentissa */
+static const char *msg = "free( malloc(";
+
+char *make(int n) {
+    char *buf = (char *)malloc(n);
+    return buf;
+}
+
+void leak(void)
+{
+    char *a = malloc(10);
+    int *b = calloc(4, sizeof(int));
+    b = realloc(b, 20);
+    free(b);
+}
+
+void store(struct ctx *c, char **out) {
+    c->buf = malloc(3);
+    *out = malloc(4);
+}
+"""
+
+def _vars(source):
+    return [finding["var"] for finding in analyze_c_source(source)]
+
+def test_findings_have_function_and_line():
+    assert analyze_c_source(SOURCE, "a.c") == [
+        {"function": "leak", "line": 12, "call": "malloc", "var": "a", "file": "a.c"}]
+
+@pytest.mark.parametrize("source, expected", [
+    ("void f(void) { char*p=malloc(3); free(p); }", []),
+    ("void f(void) { int*buf=calloc(1,4); free(buf); }", []),
+    ("void f(void) { char*p=malloc(3); }", ["p"]),
+    ("void f(void) { unsigned char **pp = malloc(8); free(pp); }", []),
+    ("void f(void) { char *a[2]; a[0] = malloc(2); }", ["a[0]"]),
+    ("void f(void) { char *a[2]; a[0] = malloc(2); free(a[0]); }", []),
+    ("void f(void) { char *a[2]; int i; for (i = 0; i < 2; i++) a[i] = malloc(2);"
+     " for (i = 0; i < 2; i++) free(a[i]); }", []),
+    ("void f(char **out) { out[0] = malloc(2); }", []),
+    ("static char *table[4];\nvoid f(void) { table[0] = malloc(2); }", []),
+    ("void f(struct s *st) { char *p = malloc(2); st->buf = p; }", []),
+])
+def test_assignment_targets(source, expected):
+    assert _vars(source) == expected
+
+def test_extra_free_note_on_in_memory_path(tmp_path):
+    path = tmp_path / "a.c"
+    path.write_text("/* GPLv3 */\nvoid f(char *p) {\n    free(p);\n}\n", encoding="utf-8")
+    notes = engine._compute_fix(str(path), engine.DEFAULT_SETTINGS, str(tmp_path))[4]
+    assert notes == ["HUOM: free-kutsuja (1) on enemmän kuin varauksia."]
@@ -0,0 +1,107 @@
+# Bittinikkari - test_engine.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+import engine
+
+SOURCES = {
+    "main.c": "#include <stdlib.h>\n\nint main(void)\n{\n\tchar *p = malloc(8);   \n\treturn 0;\n}\n",
+    "util.h": "int apu(int x);  \r\n\tint toinen(void);\r\n",
+    "skripti.py": "def f():\n\treturn 1   \n",
+    "siisti.txt": "GPLv3\nvalmiiksi siisti\n",
+}
+
+def make_project(folder):
+    """Kirjoittaa lähdetiedostot ja niitä listaavan .cbp-tiedoston. Palauttaa .cbp-polun."""
+    os.makedirs(folder, exist_ok=True)
+    for name, text in SOURCES.items():
+        with open(os.path.join(folder, name), "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+    units = "".join(f'\t\t<Unit filename="{name}" />\n' for name in SOURCES)
+    project_path = os.path.join(folder, "testi.cbp")
+    with open(project_path, "w", encoding="utf-8") as f:
+        f.write(f"<?xml version='1.0' encoding='UTF-8'?>\n<CodeBlocks_project_file>\n"
+                f"\t<Project>\n{units}\t</Project>\n</CodeBlocks_project_file>\n")
+    return project_path
+
+def make_settings(tmp_path, **overrides):
+    settings = dict(engine.DEFAULT_SETTINGS, backup_dir=str(tmp_path / "backups"))
+    settings.update(overrides)
+    return settings
+
+def read_sources(folder):
+    result = {}
+    for name in SOURCES:
+        with open(os.path.join(folder, name), "rb") as f:
+            result[name] = f.read()
+    return result
+
+def report_lines(issues):
+    """Varmuuskopiorivillä on aikaleima, joten se jätetään vertailusta pois."""
+    return [line for line in issues if not line.startswith("Varmuuskopio luotu:")]
+
+def test_thread_and_process_pools_give_same_report_and_files(tmp_path):
+    results = {}
+    for name, workers, worker_type in (("serial", 1, "thread"), ("thread", 3, "thread"), ("process", 3, "process")):
+        folder = str(tmp_path / name)
+        project_path = make_project(folder)
+        settings = make_settings(tmp_path, max_workers=workers, worker_type=worker_type)
+        changes, issues = engine.process_full_project(project_path, settings)
+        results[name] = (changes, report_lines(issues), read_sources(folder))
+
+    assert results["serial"] == results["thread"] == results["process"]
+    changes, issues, files = results["thread"]
+    assert changes > 0
+    assert issues.index("--- main.c ---") < issues.index("--- util.h ---") < issues.index("--- skripti.py ---")
+    assert not any(line.startswith("VIRHE") for line in issues)
+    assert files["siisti.txt"] == SOURCES["siisti.txt"].replace("\n", os.linesep).encode("utf-8")
+
+def test_second_run_skips_unchanged_files_via_manifest(tmp_path):
+    folder = str(tmp_path / "projekti")
+    project_path = make_project(folder)
+    settings = make_settings(tmp_path, max_workers=1)
+    engine.process_full_project(project_path, settings)
+    assert os.path.exists(engine.get_manifest_path(project_path))
+    first_files = read_sources(folder)
+    store = engine.open_store(settings)
+    backups = len(store.history("main.c"))
+
+    changes, issues = engine.process_full_project(project_path, settings)
+    assert changes == 0
+    assert f"Ohitettu (ei muutoksia): {len(SOURCES)}/{len(SOURCES)} tiedostoa." in issues
+    assert read_sources(folder) == first_files
+    assert len(store.history("main.c")) == backups
+    # Ohitetun tiedoston analyysihuomiot toistetaan manifestista
+    assert "--- main.c ---" in issues
+
+    with open(os.path.join(folder, "skripti.py"), "a", encoding="utf-8") as f:
+        f.write("\tx = 2  \n")
+    changes, issues = engine.process_full_project(project_path, settings)
+    assert changes == 1
+    assert f"Ohitettu (ei muutoksia): {len(SOURCES) - 1}/{len(SOURCES)} tiedostoa." in issues
+
+def test_streaming_fix_matches_in_memory_fix(tmp_path):
+    cases = dict(SOURCES)
+    cases.update({
+        "ei_rivinvaihtoa.c": "int x;\t \n\tint y;",
+        "sekalaiset.txt": "eka\r\ntoka\rkolmas\n\n\t\tneljäs  \r\n",
+        "tyhja.txt": "",
+        "valmis.py": "# GPLv3\ndef f():\n    return 1\n".replace("\n", os.linesep),
+    })
+    for name, text in cases.items():
+        results = []
+        for mode, threshold in (("muisti", 1024), ("virta", 0)):
+            path = tmp_path / mode / name
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(text.encode("utf-8"))
+            settings = make_settings(tmp_path, streaming_threshold_mb=threshold)
+            changes, issues, notes, written = engine._fix_file(str(path), settings, str(path.parent))
+            if name.endswith((".c", ".h")):
+                issues = [] # C-analyysi on suurille tiedostoille kevyempi, joten huomiot eroavat
+            results.append((path.read_bytes(), changes, report_lines(issues), written))
+        assert results[0] == results[1], name
@@ -0,0 +1,191 @@
+# Bittinikkari - test_find_engine.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import random
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+import document
+import find_engine
+from find_engine import FindEngine
+
+
+class FakeHook:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+
+class FakeText:
+    """Text-widgetin korvike: rivi.sarake-indeksit, muokkaukset kuten EditHook ne ilmoittaa, ajastukset jonossa."""
+
+    def __init__(self, content=""):
+        self.lines = content.split("\n")
+        self.hook = FakeHook()
+        self.jobs = []
+        self.insert_mark = (1, 0)
+        self.options = {"autoseparators": True}
+        self.log = []           # replace- ja edit_separator-kutsut järjestyksessä
+
+    def _pos(self, index):
+        if index == "insert":
+            return self.insert_mark
+        if index in ("end", "end-1c"):
+            return len(self.lines), len(self.lines[-1])
+        line, column = index.split(".")
+        line = min(int(line), len(self.lines))
+        text = self.lines[line - 1]
+        return line, len(text) if column == "end" else min(int(column), len(text))
+
+    def _offset(self, index):
+        line, column = self._pos(index)
+        return sum(len(text) + 1 for text in self.lines[:line - 1]) + column
+
+    def index(self, index):
+        return "%d.%d" % self._pos(index)
+
+    def get(self, start, end):
+        return "\n".join(self.lines)[self._offset(start):self._offset(end)]
+
+    def replace(self, start, end, text):
+        first, last = self._pos(start)[0], self._pos(end)[0]
+        content = "\n".join(self.lines)
+        a, b = self._offset(start), self._offset(end)
+        before = len(self.lines)
+        self.log.append(("replace", start, end, text))
+        self.lines = (content[:a] + text + content[b:]).split("\n")
+        for listener in self.hook.listeners:
+            listener("replace", first, last, last + len(self.lines) - before)
+
+    def insert(self, index, text):
+        self.replace(index, index, text)
+
+    def delete(self, start, end):
+        self.replace(start, end, "")
+
+    def after(self, ms, callback, *args):
+        job = lambda: callback(*args)
+        self.jobs.append(job)
+        return job
+
+    def after_cancel(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def run_jobs(self):
+        while self.jobs:
+            self.jobs.pop(0)()
+
+    def compare(self, a, op, b):
+        return {"==": self._pos(a) == self._pos(b)}[op]
+
+    def mark_set(self, mark, index):
+        self.insert_mark = self._pos(index)
+
+    def cget(self, option):
+        return self.options[option]
+
+    def config(self, **options):
+        self.options.update(options)
+
+    def edit_separator(self):
+        self.log.append("separator")
+
+    def tag_configure(self, *args, **kwargs):
+        pass
+
+    tag_raise = tag_remove = tag_add = see = tag_configure
+
+
+@pytest.fixture(autouse=True)
+def fake_hooks(monkeypatch):
+    monkeypatch.setattr(find_engine, "install_edit_hook", lambda widget: widget.hook)
+    monkeypatch.setattr(document, "install_edit_hook", lambda widget: widget.hook)
+
+def _engine(content):
+    text = FakeText(content)
+    text.document = document.Document(text)
+    return text, FindEngine(text)
+
+def _expected(text, pattern, use_regex):
+    regex = find_engine.compile_pattern(pattern, use_regex, True)
+    return [m.span() for m in regex.finditer("\n".join(text.lines)) if m.end() > m.start()]
+
+def _hits(engine):
+    engine.refresh()
+    return list(zip(engine.starts, engine.ends))
+
+def test_regex_match_grows_when_later_line_changes():
+    text, engine = _engine("\naxababxaab\nb\n\n")
+    engine.search("x[^y]*x", True)
+    assert _hits(engine) == [(2, 8)]
+    text.insert("5.0", "aaaaaaax")
+    assert _hits(engine) == _expected(text, "x[^y]*x", True) == [(2, 23)]
+
+@pytest.mark.parametrize("pattern, use_regex", [("a", False), ("ab", False), ("a+", True),
+                                                (r"a\s+b", True), (r"b\n", True), ("x[^y]*x", True)])
+def test_refresh_after_edits_matches_full_search(pattern, use_regex):
+    rng = random.Random(pattern)
+    for _ in range(200):
+        content = "\n".join("".join(rng.choice("aabxy ") for _ in range(rng.randint(0, 8)))
+                            for _ in range(rng.randint(1, 10)))
+        text, engine = _engine(content)
+        engine.search(pattern, use_regex)
+        for _ in range(rng.randint(1, 5)):
+            line = rng.randint(1, len(text.lines))
+            column = rng.randint(0, len(text.lines[line - 1]))
+            if rng.random() < 0.6:
+                text.insert(f"{line}.{column}", "".join(rng.choice("abxy \n") for _ in range(rng.randint(1, 4))))
+            else:
+                text.delete(f"{line}.0", f"{min(line + 1, len(text.lines))}.0")
+            if rng.random() < 0.5:
+                text.run_jobs()
+            assert _hits(engine) == _expected(text, pattern, use_regex)
+
+def test_extended_query_narrows_previous_hits():
+    text, engine = _engine("abc abd\nab aab\nabcabc")
+    assert engine.search("ab") == 6
+    assert engine.search("abc") == 3
+    assert _hits(engine) == _expected(text, "abc", False)
+    text.insert("2.0", "abc ")
+    assert engine.search("abcd") == 0
+
+def test_search_counts_hits_and_next_wraps_around():
+    text, engine = _engine("ab\nxab\nab ab")
+    assert engine.search("^ab", True) == 2
+    assert engine.search("AB") == 4
+    assert engine.search("AB") == 4
+    assert engine.search("AB", nocase=False) == 0
+    engine.search("ab")
+    text.mark_set("insert", "2.2")
+    assert engine.next() == 2
+    assert text.index("insert") == "3.2"
+    assert engine.next() == 3
+    assert engine.next() == 0
+    assert engine.next(backwards=True) == 3
+
+def test_replace_all_expands_groups_in_one_undo_step():
+    text, engine = _engine("f(1) g(22)\nh(3)")
+    assert engine.replace_all(r"(\w)\((\d+)\)", r"\2:\1", True) == 3
+    assert text.lines == ["1:f 22:g", "3:h"]
+    # Yksi kumoamisaskel: korvaukset erottimien välissä lopusta alkuun
+    assert text.log[0] == text.log[-1] == "separator"
+    assert [entry[1] for entry in text.log[1:-1]] == ["2.0", "1.5", "1.0"]
+    assert text.options["autoseparators"] is True
+    assert engine.search(r"(\w)\((\d+)\)", True) == 0
+
+def test_plain_replace_all_is_literal_and_skips_unchanged_hits():
+    text, engine = _engine("Abc abc\nABC")
+    assert engine.replace_all("abc", "abc") == 2
+    assert text.lines == ["abc abc", "abc"]
+    assert engine.replace_all("abc", r"\1") == 3
+    assert text.lines == [r"\1 \1", r"\1"]
+    assert engine.replace_all("xyz", "abc") == 0
@@ -0,0 +1,106 @@
+# Bittinikkari - test_project_model.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+from project_model import ProjectModel, ProjectTreeView, open_project
+
+CBP = ("<?xml version='1.0' encoding='UTF-8'?>\n<CodeBlocks_project_file>\n\t<Project>\n"
+       "\t\t<Option title=\"Testi\" />\n\t\t<Unit filename=\"main.c\" />\n"
+       "\t\t<Unit filename=\"src/a.c\" />\n\t\t<Unit filename=\"src/b.c\" />\n"
+       "\t</Project>\n</CodeBlocks_project_file>")
+
+
+class FakeTreeview:
+    """ttk.Treeview'n korvike: rivit ja niiden lapset sanakirjassa."""
+
+    def __init__(self):
+        self.children = {"": []}
+        self.texts = {}
+        self.selected = ""
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def insert(self, parent, index, text="", open=False, values=()):
+        item = f"I{len(self.texts)}"
+        self.children[parent].append(item)
+        self.children[item] = []
+        self.texts[item] = text
+        return item
+
+    def get_children(self, item=""):
+        return tuple(self.children[item])
+
+    def delete(self, *items):
+        for item in items:
+            for child in self.children.pop(item):
+                self.delete(child)
+            for children in self.children.values():
+                if item in children:
+                    children.remove(item)
+
+    def focus(self):
+        return self.selected
+
+    def labels(self, item):
+        return [self.texts[child] for child in self.children[item]]
+
+
+def write_project(tmp_path):
+    path = tmp_path / "testi.cbp"
+    path.write_bytes(CBP.encode("utf-8"))
+    return str(path)
+
+def test_open_project_reuses_model_until_file_changes(tmp_path):
+    path = write_project(tmp_path)
+    model = open_project(path)
+    assert model.title == "Testi"
+    assert list(model.units) == ["main.c", "src/a.c", "src/b.c"]
+    assert "src/a.c" in model and len(model) == 3
+    assert open_project(path) is model
+
+    with open(path, "ab") as f:
+        f.write(b"\n")
+    assert open_project(path) is not model
+
+def test_tree_view_adds_folder_rows_when_opened(tmp_path):
+    model = ProjectModel(write_project(tmp_path))
+    tree = FakeTreeview()
+    view = ProjectTreeView(tree)
+    view.show(model)
+    assert tree.labels(view.main_node) == ["main.c", "src"]
+    folder = tree.get_children(view.main_node)[1]
+    assert tree.labels(folder) == ["..."]
+
+    tree.selected = folder
+    view._on_open(None)
+    assert tree.labels(folder) == ["a.c", "b.c"]
+    assert view.files_of([folder]) == ["src/a.c", "src/b.c"]
+
+def test_batch_changes_round_trip_through_save(tmp_path):
+    path = write_project(tmp_path)
+    model = ProjectModel(path)
+    events = []
+    model.add_listener(lambda op, rel_path: events.append((op, rel_path)))
+
+    assert model.add_many(["src/c.c", "lib/d.c", "src/c.c", "main.c"]) == 2
+    assert model.remove_many(["src/c.c", "puuttuu.c", "lib/d.c", "lib/d.c"]) == 2
+    assert events == [("add", "src/c.c"), ("add", "lib/d.c"), ("remove", "src/c.c"), ("remove", "lib/d.c")]
+    assert model.save()
+    # Lisätyt ja poistetut tagit eivät jätä jälkeä: sisennykset palautuvat ennalleen
+    with open(path, "rb") as f:
+        assert f.read() == CBP.encode("utf-8")
+    assert not model.save()
+
+    assert model.remove_many(["src/b.c", "main.c"]) == 2
+    model.add("uusi.c")
+    model.save()
+    reloaded = ProjectModel(path)
+    assert list(reloaded.units) == ["src/a.c", "uusi.c"]
+    with open(path, encoding="utf-8") as f:
+        assert "\t\t<Unit filename=\"uusi.c\" />\n\t</Project>" in f.read()
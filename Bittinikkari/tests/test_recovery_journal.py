@@ -0,0 +1,83 @@
+# Bittinikkari - test_recovery_journal.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+import document
+import recovery_journal
+from recovery_journal import RecoveryJournal, StaleJournalError, read_journal
+
+class FakeRoot:
+    def after(self, ms, callback):
+        return None
+
+def _write_journal(file, header):
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n" + json.dumps([1, 1, ["muokattu"]]) + "\n")
+
+def test_live_instance_journals_are_left_alone(tmp_path):
+    folder = str(tmp_path / "recovery")
+    first = RecoveryJournal(FakeRoot(), folder)
+    journal = os.path.join(first.folder, f"{first.owner}-a.journal")
+    _write_journal(journal, {"version": 1, "path": None, "text": "pohja"})
+
+    second = RecoveryJournal(FakeRoot(), folder)
+    assert second.leftovers() == []
+    assert os.path.exists(journal)
+
+    first.close()
+    third = RecoveryJournal(FakeRoot(), folder)
+    assert third.leftovers() == [journal]
+    second.close()
+    third.close()
+
+def test_changed_base_is_reported_as_stale(tmp_path):
+    base = tmp_path / "a.c"
+    base.write_text("uusi sisältö\n", encoding="utf-8")
+    journal = str(tmp_path / "x.journal")
+    _write_journal(journal, {"version": 1, "path": str(base), "sha256": "0" * 64})
+    with pytest.raises(StaleJournalError):
+        read_journal(journal)
+
+class FakeText:
+    """Widget, joka kirjaa get-kutsut; muokkaukset ilmoitetaan kuuntelijoille kuten EditHook."""
+
+    def __init__(self, content):
+        self.lines = content.split("\n")
+        self.listeners = []
+        self.add_listener = self.listeners.append
+        self.reads = []
+
+    def get(self, start, end):
+        self.reads.append((start, end))
+        first = int(start.split(".")[0])
+        last = len(self.lines) if end == "end-1c" else int(end.split(".")[0])
+        return "\n".join(self.lines[first - 1:last])
+
+    def edit(self, line, text):
+        self.lines[line - 1] = text
+        for listener in self.listeners:
+            listener("replace", line, line, line)
+
+def test_edits_are_read_from_the_document_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(document, "install_edit_hook", lambda widget: widget)
+    monkeypatch.setattr(recovery_journal, "install_edit_hook", lambda widget: widget)
+    text = FakeText("eka\ntoka\nkolmas")
+    text.document = document.Document(text)
+    manager = RecoveryJournal(FakeRoot(), str(tmp_path / "recovery"))
+    journal = manager.attach(text, None, "eka\ntoka\nkolmas")
+
+    text.reads.clear()
+    text.edit(2, "toka!")
+    text.edit(2, "toka!!")
+    # Vain dokumenttimalli lukee widgetiltä; päiväkirja saa rivit mallista
+    assert text.reads == [("2.0", "2.end")] * 2
+    assert journal.take() == [[2, 2, ["toka!!"]]]
+    manager.close()
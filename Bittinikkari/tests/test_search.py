@@ -0,0 +1,34 @@
+# Bittinikkari - test_search.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+from engine import compile_pattern, search_project
+
+CONTENT = "x = 1;\ny = 2;  \nx = 3;\n#include <a.h>\nx\n"
+
+def test_anchors_match_on_every_line():
+    assert len(compile_pattern("^x", True).findall(CONTENT)) == 3
+    assert len(compile_pattern(r";\s*$", True).findall(CONTENT)) == 3
+    assert compile_pattern("^#include", True).search(CONTENT)
+    # Tavallisessa haussa ^ on vain merkki
+    assert not compile_pattern("^x", False).search(CONTENT)
+
+@pytest.mark.parametrize("search_index", [False, True])
+def test_project_search_finds_anchored_hits_per_line(tmp_path, search_index):
+    (tmp_path / "a.c").write_text(CONTENT, encoding="utf-8")
+    project_path = tmp_path / "Testi.cbp"
+    project_path.write_text("<?xml version='1.0' encoding='UTF-8'?>\n<CodeBlocks_project_file>\n"
+                            "\t<Project>\n\t\t<Unit filename=\"a.c\" />\n\t</Project>\n"
+                            "</CodeBlocks_project_file>\n", encoding="utf-8")
+    found = []
+    hits, files = search_project(str(project_path), {"search_index": search_index, "max_workers": 1},
+                                 "^x", True, False, emit=found.append)
+    assert (hits, files) == (3, 1)
+    assert [hit[0] for hit in found[0]["hits"]] == [1, 3, 5]
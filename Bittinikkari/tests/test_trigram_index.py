@@ -0,0 +1,72 @@
+# Bittinikkari - test_trigram_index.py
+# Tekijä: Tuomas Lähteenmäki
+# Lisenssi: GNU GPLv3
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules"))
+
+from engine import search_project
+from trigram_index import notify_written, open_index, required_literals
+
+FILES = {
+    "a.c": "int ABCD = 1;\nchar *s = \"1foo.bar\";\n",
+    "b.c": "xyzxyz\nabcabc\nAAAA\n",
+    "c.py": "ääkkönen = 'öljy'\nname = name\n",
+}
+
+PATTERNS = [
+    (r"\x41BCD", True),
+    (r"ääkk", True),
+    (r"\N{LATIN SMALL LETTER A WITH DIAERESIS}kk", True),
+    (r"(xyz)\1", True),
+    (r"\101BCD", True),
+    (r"\dfoo\.bar", True),
+    (r"foo\.bar", True),
+    (r"name = \w+", True),
+    ("ABCD", False),
+    ("ääkk", False),
+]
+
+@pytest.fixture
+def project(tmp_path):
+    units = "".join(f'\t\t<Unit filename="{name}" />\n' for name in FILES)
+    project_path = tmp_path / "Testi.cbp"
+    project_path.write_text("<?xml version='1.0' encoding='UTF-8'?>\n<CodeBlocks_project_file>\n"
+                            f"\t<Project>\n{units}\t</Project>\n</CodeBlocks_project_file>\n", encoding="utf-8")
+    for name, content in FILES.items():
+        (tmp_path / name).write_text(content, encoding="utf-8")
+    return str(project_path)
+
+@pytest.mark.parametrize("pattern, use_regex", PATTERNS)
+def test_index_does_not_drop_matches(project, pattern, use_regex):
+    unindexed = search_project(project, {"search_index": False, "max_workers": 1}, pattern, use_regex, False)
+    indexed = search_project(project, {"search_index": True, "max_workers": 1}, pattern, use_regex, False)
+    assert unindexed[0] > 0
+    assert indexed == unindexed
+
+def test_escapes_that_are_not_literal_text_disable_prefilter():
+    assert required_literals(r"\x41BCD", True) == []
+    assert required_literals(r"(a)\1bcd", True) == []
+    assert required_literals(r"\dfoo\.bar", True) == ["foo.bar"]
+
+def test_written_file_is_reindexed_at_next_search(project):
+    settings = {"search_index": True, "max_workers": 1}
+    assert search_project(project, settings, "xyzxyz", False, False)[0] == 1
+    index = open_index(project)
+    postings = index.postings
+
+    # Sama koko ja mtime: vain merkintä kertoo, että sisältö vaihtui
+    path = os.path.join(os.path.dirname(project), "b.c")
+    st = os.stat(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("qwerty\nabcabc\nAAAA\n")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    notify_written(path)
+    assert index.postings is postings # kirjoitus ei vielä koske bittikarttoihin
+
+    assert search_project(project, settings, "xyzxyz", False, False)[0] == 0
+    assert search_project(project, settings, "qwerty", False, False)[0] == 1